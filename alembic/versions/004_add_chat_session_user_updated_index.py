@@ -0,0 +1,30 @@
+"""add chat_sessions (user_id, updated_at) index
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-16
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """为chat_sessions添加(user_id, updated_at)复合索引"""
+    op.create_index(
+        'ix_chatsession_user_updated',
+        'chat_sessions',
+        ['user_id', 'updated_at'],
+        unique=False
+    )
+
+
+def downgrade():
+    """删除(user_id, updated_at)复合索引"""
+    op.drop_index('ix_chatsession_user_updated', table_name='chat_sessions')
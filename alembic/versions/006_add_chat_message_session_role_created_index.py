@@ -0,0 +1,30 @@
+"""add chat_messages (session_id, role, created_at) index
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-16
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """为chat_messages添加(session_id, role, created_at)复合索引"""
+    op.create_index(
+        'ix_chatmessage_session_role_created',
+        'chat_messages',
+        ['session_id', 'role', 'created_at'],
+        unique=False
+    )
+
+
+def downgrade():
+    """删除(session_id, role, created_at)复合索引"""
+    op.drop_index('ix_chatmessage_session_role_created', table_name='chat_messages')
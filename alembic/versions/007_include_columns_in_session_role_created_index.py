@@ -0,0 +1,42 @@
+"""include id and user_id in the chat_messages (session_id, role, created_at) index on PostgreSQL
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-16
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """PostgreSQL 上重建(session_id, role, created_at)索引并 INCLUDE (id, user_id)；其他数据库的二级索引已带主键，不做修改"""
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_index('ix_chatmessage_session_role_created', table_name='chat_messages')
+    op.create_index(
+        'ix_chatmessage_session_role_created',
+        'chat_messages',
+        ['session_id', 'role', 'created_at'],
+        unique=False,
+        postgresql_include=['id', 'user_id']
+    )
+
+
+def downgrade():
+    """恢复不带 INCLUDE 列的(session_id, role, created_at)索引"""
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_index('ix_chatmessage_session_role_created', table_name='chat_messages')
+    op.create_index(
+        'ix_chatmessage_session_role_created',
+        'chat_messages',
+        ['session_id', 'role', 'created_at'],
+        unique=False
+    )
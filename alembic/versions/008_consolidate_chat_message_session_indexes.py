@@ -0,0 +1,62 @@
+"""consolidate the session_id-leading indexes on chat_messages
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-16
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '008'
+down_revision = '007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """用(session_id, created_at, id)和(session_id, role, created_at, id)两个复合索引替换原有四个以session_id开头的索引"""
+    op.create_index(
+        'ix_chatmessage_session_created_id',
+        'chat_messages',
+        ['session_id', 'created_at', 'id'],
+        unique=False
+    )
+    op.create_index(
+        'ix_chatmessage_session_role_created_id',
+        'chat_messages',
+        ['session_id', 'role', 'created_at', 'id'],
+        unique=False,
+        postgresql_include=['user_id']
+    )
+    op.drop_index('ix_chatmessage_session_role_created', table_name='chat_messages')
+    op.drop_index('ix_chatmessage_session_user_created', table_name='chat_messages')
+    op.drop_index('ix_chatmessage_session_created', table_name='chat_messages')
+    op.drop_index(op.f('ix_chat_messages_session_id'), table_name='chat_messages')
+
+
+def downgrade():
+    """恢复原有的四个索引（与 007 之后的结构一致）"""
+    op.create_index(op.f('ix_chat_messages_session_id'), 'chat_messages', ['session_id'], unique=False)
+    op.create_index(
+        'ix_chatmessage_session_created',
+        'chat_messages',
+        ['session_id', 'created_at'],
+        unique=False
+    )
+    op.create_index(
+        'ix_chatmessage_session_user_created',
+        'chat_messages',
+        ['session_id', 'user_id', 'created_at'],
+        unique=False
+    )
+    op.create_index(
+        'ix_chatmessage_session_role_created',
+        'chat_messages',
+        ['session_id', 'role', 'created_at'],
+        unique=False,
+        postgresql_include=['id', 'user_id']
+    )
+    op.drop_index('ix_chatmessage_session_role_created_id', table_name='chat_messages')
+    op.drop_index('ix_chatmessage_session_created_id', table_name='chat_messages')
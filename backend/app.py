@@ -7,7 +7,7 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 from pathlib import Path
 import os
 import sys
@@ -62,6 +62,13 @@ except ImportError:
     AGENT_ENABLED = False
     agent_router = None
 
+# orjson 可选：可用时作为默认响应类，序列化明显快于标准库 json
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 # 导入日志配置
 from backend.logging_config import get_logger
 
@@ -81,7 +88,8 @@ def create_app() -> FastAPI:
         description="基于LangChain和记忆系统的情感支持聊天机器人",
         version="3.0.0",
         docs_url="/docs",
-        redoc_url="/redoc"
+        redoc_url="/redoc",
+        default_response_class=ORJSONResponse if ORJSON_AVAILABLE else JSONResponse
     )
     
     # 配置CORS
@@ -132,6 +140,13 @@ def create_app() -> FastAPI:
         app.include_router(streaming_router)
         logger.info("流式聊天模块已启用")
     
+    # 服务关闭时写入向量库缓冲中的对话（未加载向量库模块时无需处理）
+    @app.on_event("shutdown")
+    async def flush_vector_store_buffers():
+        vector_store_module = sys.modules.get("backend.vector_store")
+        if vector_store_module is not None:
+            vector_store_module.flush_all_conversations()
+    
     # 根路由
     @app.get("/")
     async def root():
@@ -3,7 +3,8 @@
 数据库配置和模型定义
 """
 import os
-from sqlalchemy import create_engine, Column, Integer, BigInteger, String, Text, DateTime, Float, Boolean
+import base64
+from sqlalchemy import create_engine, Column, Integer, BigInteger, String, Text, DateTime, Float, Boolean, Index, tuple_, func, literal, insert, select, bindparam
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
@@ -20,7 +21,21 @@ _default_db_url = (
 DATABASE_URL = os.getenv("DATABASE_URL", _default_db_url)
 
 # 创建数据库引擎
-engine = create_engine(DATABASE_URL, echo=True)
+# 所有 DatabaseManager 共享同一个连接池，每次请求取出已建立的连接，而不是重新连接数据库；
+# SQL 回显会为每条语句同步写日志，默认关闭，调试时设置 DB_ECHO=true 开启
+_engine_options = {
+    "echo": os.getenv("DB_ECHO", "false").lower() == "true",
+    # 编译后 SQL 的缓存条目数（默认 500），语句形态多时放大以减少重复编译
+    "query_cache_size": int(os.getenv("DB_QUERY_CACHE_SIZE", "1200")),
+}
+if not DATABASE_URL.startswith("sqlite"):
+    _engine_options.update(
+        pool_size=int(os.getenv("DB_POOL_SIZE", "10")),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "20")),
+        pool_pre_ping=True,
+        pool_recycle=3600,
+    )
+engine = create_engine(DATABASE_URL, **_engine_options)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -46,19 +61,45 @@ class ChatSession(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_active = Column(Boolean, default=True)
+    
+    __table_args__ = (
+        # 用户会话列表按更新时间倒序分页，计数也可只扫该索引
+        Index('ix_chatsession_user_updated', 'user_id', 'updated_at'),
+    )
 
 class ChatMessage(Base):
     """聊天消息表"""
     __tablename__ = "chat_messages"
     
     id = Column(Integer, primary_key=True, index=True)
-    session_id = Column(String(100), index=True)
+    session_id = Column(String(100))  # 由下面的复合索引覆盖，不再单独建索引
     user_id = Column(String(100), index=True)
     role = Column(String(20))  # user, assistant
     content = Column(Text)
     emotion = Column(String(50))  # 情感标签
     emotion_intensity = Column(Float)  # 情感强度
     created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        # 会话内消息按 (created_at, id) 分页、按时间范围删除/查询（消息编辑、撤回），
+        # 撤回时探测同一用户在该消息之后是否还有消息也沿此索引扫描该会话的少量新消息
+        Index('ix_chatmessage_session_created_id', 'session_id', 'created_at', 'id'),
+        # 会话列表标题取会话内第一条用户消息，按角色过滤后直接沿索引取首行；
+        # 撤回时查找紧随其后的AI回复（get_reply_to）也走这里。
+        # PostgreSQL 额外 INCLUDE user_id，只读这些列的查询可以只扫索引
+        Index(
+            'ix_chatmessage_session_role_created_id', 'session_id', 'role', 'created_at', 'id',
+            postgresql_include=['user_id']
+        ),
+    )
+
+# 用户消息之后的第一条AI回复（撤回时一并删除），预先构建，只绑定参数
+_NEXT_REPLY_STMT = select(ChatMessage).where(
+    ChatMessage.session_id == bindparam("session_id"),
+    ChatMessage.role == 'assistant',
+    ChatMessage.created_at >= bindparam("created_at"),
+    ChatMessage.id > bindparam("message_id")
+).order_by(ChatMessage.created_at.asc(), ChatMessage.id.asc()).limit(1)
 
 class EmotionAnalysis(Base):
     """情感分析记录表"""
@@ -283,6 +324,21 @@ def get_db():
     finally:
         db.close()
 
+# 游标分页
+def encode_page_cursor(timestamp, row_id):
+    """将 (时间戳, 主键) 编码为不透明的分页游标"""
+    raw = f"{timestamp.isoformat()}|{row_id}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_page_cursor(cursor):
+    """解析分页游标，返回 (时间戳, 主键)；格式非法时抛出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        timestamp, row_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except Exception as e:
+        raise ValueError(f"无效的分页游标: {cursor}") from e
+
 # 数据库操作类
 class DatabaseManager:
     def __init__(self):
@@ -295,7 +351,12 @@ class DatabaseManager:
         self.db.close()
     
     def save_message(self, session_id, user_id, role, content, emotion=None, emotion_intensity=None):
-        """保存聊天消息"""
+        """
+        保存聊天消息
+        
+        flush 后自增ID和 created_at（Python 端默认值）已写回对象；提交前将对象移出会话，
+        提交不会使其过期，返回后读取字段无需再 refresh 查询一次
+        """
         message = ChatMessage(
             session_id=session_id,
             user_id=user_id,
@@ -305,15 +366,24 @@ class DatabaseManager:
             emotion_intensity=emotion_intensity
         )
         self.db.add(message)
+        self.db.flush()
+        self.db.expunge(message)
         self.db.commit()
-        self.db.refresh(message)
         return message
     
-    def get_session_messages(self, session_id, limit=50):
-        """获取会话消息"""
-        return self.db.query(ChatMessage)\
-            .filter(ChatMessage.session_id == session_id)\
-            .order_by(ChatMessage.created_at.desc())\
+    def get_session_messages(self, session_id, limit=50, before=None):
+        """
+        获取会话消息（按时间倒序）
+        
+        before 为 decode_page_cursor 解析出的 (created_at, id)，只返回其之前的消息；
+        键集分页沿 (session_id, created_at) 索引定位，翻页代价与历史深度无关
+        """
+        query = self.db.query(ChatMessage)\
+            .filter(ChatMessage.session_id == session_id)
+        if before is not None:
+            query = query.filter(tuple_(ChatMessage.created_at, ChatMessage.id) < tuple_(*before))
+        return query\
+            .order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc())\
             .limit(limit)\
             .all()
     
@@ -373,14 +443,100 @@ class DatabaseManager:
         self.db.commit()
         return log
     
-    def get_user_sessions(self, user_id, limit=50):
-        """获取用户的所有会话"""
-        return self.db.query(ChatSession)\
-            .filter(ChatSession.user_id == user_id)\
-            .order_by(ChatSession.updated_at.desc())\
+    def get_user_sessions(self, user_id, limit=50, before=None):
+        """
+        获取用户的所有会话（按更新时间倒序）
+        
+        before 为 decode_page_cursor 解析出的 (updated_at, id)，只返回其之后一页的会话
+        """
+        query = self.db.query(ChatSession)\
+            .filter(ChatSession.user_id == user_id)
+        if before is not None:
+            query = query.filter(tuple_(ChatSession.updated_at, ChatSession.id) < tuple_(*before))
+        return query\
+            .order_by(ChatSession.updated_at.desc(), ChatSession.id.desc())\
             .limit(limit)\
             .all()
     
+    def get_user_sessions_with_previews(self, user_id, limit=50, before=None, title_len=30, preview_len=50):
+        """
+        获取用户会话及其列表预览（按更新时间倒序），一条 SQL 完成
+        
+        消息数、首条用户消息和最后一条消息通过关联子查询取出，不再逐个会话查询；
+        没有消息的会话直接在 SQL 中过滤掉。
+        消息内容在 SQL 中截取为 title_len + 1 / preview_len + 1 个字符，
+        多取的一个字符用于判断原文是否被截断，长消息不必整条传出数据库。
+        返回行包含 id, session_id, created_at, updated_at, message_count, first_user_content, last_content
+        """
+        def _session_messages():
+            return self.db.query(ChatMessage)\
+                .filter(ChatMessage.session_id == ChatSession.session_id)
+        
+        message_count = self.db.query(func.count(ChatMessage.id))\
+            .filter(ChatMessage.session_id == ChatSession.session_id)\
+            .correlate(ChatSession)\
+            .scalar_subquery()
+        first_user_content = _session_messages()\
+            .filter(ChatMessage.role == 'user')\
+            .order_by(ChatMessage.created_at.asc(), ChatMessage.id.asc())\
+            .with_entities(func.substr(ChatMessage.content, 1, title_len + 1))\
+            .limit(1)\
+            .correlate(ChatSession)\
+            .scalar_subquery()
+        last_content = _session_messages()\
+            .order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc())\
+            .with_entities(func.substr(ChatMessage.content, 1, preview_len + 1))\
+            .limit(1)\
+            .correlate(ChatSession)\
+            .scalar_subquery()
+        
+        query = self.db.query(
+            ChatSession.id,
+            ChatSession.session_id,
+            ChatSession.created_at,
+            ChatSession.updated_at,
+            message_count.label('message_count'),
+            first_user_content.label('first_user_content'),
+            last_content.label('last_content')
+        ).filter(ChatSession.user_id == user_id)\
+            .filter(_session_messages().correlate(ChatSession).exists())
+        if before is not None:
+            query = query.filter(tuple_(ChatSession.updated_at, ChatSession.id) < tuple_(*before))
+        return query\
+            .order_by(ChatSession.updated_at.desc(), ChatSession.id.desc())\
+            .limit(limit)\
+            .all()
+    
+    def count_user_sessions(self, user_id, cap=1000):
+        """
+        统计用户会话数，最多数到 cap 条，避免会话很多的用户每次列表都全量计数
+        
+        与 get_user_sessions_with_previews 一致，不统计没有消息的会话
+        """
+        has_messages = self.db.query(ChatMessage)\
+            .filter(ChatMessage.session_id == ChatSession.session_id)\
+            .correlate(ChatSession)\
+            .exists()
+        capped = self.db.query(literal(1))\
+            .filter(ChatSession.user_id == user_id)\
+            .filter(has_messages)\
+            .limit(cap)\
+            .subquery()
+        return self.db.query(func.count()).select_from(capped).scalar()
+    
+    def get_reply_to(self, message):
+        """
+        获取紧跟在用户消息之后的第一条AI回复
+        
+        回复常与用户消息落在同一时间戳内，用 >= 取范围，再按自增ID排除用户消息及其之前的行；
+        语句在模块加载时构建一次，每次只绑定参数
+        """
+        return self.db.execute(_NEXT_REPLY_STMT, {
+            "session_id": message.session_id,
+            "created_at": message.created_at,
+            "message_id": message.id,
+        }).scalars().first()
+    
     def get_message(self, message_id, user_id=None):
         """获取特定消息"""
         # 尝试将message_id转换为整数，如果失败则直接返回None
@@ -395,35 +551,60 @@ class DatabaseManager:
         return query.first()
     
     def update_message(self, message_id, user_id, new_content, emotion=None, emotion_intensity=None):
-        """更新消息内容"""
-        message = self.get_message(message_id, user_id)
-        if not message:
-            return None
+        """
+        更新消息内容
         
+        直接执行 UPDATE ... WHERE id AND user_id，不先查询消息；会话中已加载的该消息对象
+        按更新值同步（synchronize_session='evaluate'）。提交后对象照常过期，之后读取属性会重新加载
+        
+        未更新到任何行时回滚而不提交，调用方在同一事务中的其他修改（如删除后续消息）一并撤销
+        
+        Returns:
+            更新的行数，0 表示消息不存在或无权修改
+        """
         # 验证内容不为空
         if not new_content or not new_content.strip():
             raise ValueError("消息内容不能为空")
         
-        message.content = new_content.strip()
+        try:
+            message_id_int = int(message_id)
+        except ValueError:
+            return 0
+        
+        values = {ChatMessage.content: new_content.strip()}
         if emotion is not None:
-            message.emotion = emotion
+            values[ChatMessage.emotion] = emotion
         if emotion_intensity is not None:
-            message.emotion_intensity = emotion_intensity
+            values[ChatMessage.emotion_intensity] = emotion_intensity
         
-        # 更新修改时间（如果有该字段）
-        from datetime import datetime
-        if hasattr(message, 'updated_at'):
-            message.updated_at = datetime.utcnow()
+        updated = self.db.query(ChatMessage).filter(
+            ChatMessage.id == message_id_int,
+            ChatMessage.user_id == user_id
+        ).update(values, synchronize_session='evaluate')
         
-        self.db.commit()
-        self.db.refresh(message)
-        return message
+        if updated:
+            self.db.commit()
+        else:
+            self.db.rollback()
+        return updated
     
-    def delete_message(self, message_id, user_id):
-        """删除（撤回）消息，如果是用户消息，同时删除对应的AI回复"""
+    def delete_message(self, message_id, user_id, message=None):
+        """
+        删除（撤回）消息，如果是用户消息，同时删除对应的AI回复
+        
+        调用方已查询并校验过消息时可通过 message 传入，省去重复的 SELECT；
+        每张表一条 IN 列表批量 DELETE，且不同步会话状态（synchronize_session=False）；
+        要删除的消息ID在删除前已确定，直接作为 deleted_messages 返回，
+        不依赖 DELETE ... RETURNING（默认的 MySQL 不支持）
+        
+        关联表的 message_id 不声明外键（ON DELETE CASCADE）：反馈的 message_id 由前端提交，
+        降级回复的 message_id 为 0，都可能指向不存在的消息，加外键约束会使这些写入失败，
+        因此级联删除仍由这里在同一事务内完成
+        """
         print(f"[DELETE] 开始删除消息: message_id={message_id}, user_id={user_id}")
         
-        message = self.get_message(message_id, user_id)
+        if message is None:
+            message = self.get_message(message_id, user_id)
         if not message:
             print(f"[DELETE] 消息不存在或无权删除: message_id={message_id}, user_id={user_id}")
             return {
@@ -442,30 +623,10 @@ class DatabaseManager:
                 print(f"[DELETE] 用户消息时间: {message.created_at}")
                 print(f"[DELETE] 会话ID: {message.session_id}")
                 
-                # 首先查看该会话中的所有AI消息
-                all_ai_messages = self.db.query(ChatMessage).filter(
-                    ChatMessage.session_id == message.session_id,
-                    ChatMessage.role == 'assistant'
-                ).order_by(ChatMessage.created_at.asc()).all()
-                
-                print(f"[DELETE] 会话中总共有 {len(all_ai_messages)} 条AI消息")
-                for ai_msg in all_ai_messages:
-                    print(f"[DELETE]   AI消息 {ai_msg.id}: 时间={ai_msg.created_at}, 用户ID={ai_msg.user_id}")
-                    time_diff = (ai_msg.created_at - message.created_at).total_seconds()
-                    print(f"[DELETE]   时间差: {time_diff}秒 ({'之后' if time_diff > 0 else '之前'})")
+                # 只删除紧接着的第一条AI回复：走 (session_id, role, created_at, id) 复合索引，只取一行
+                first_ai_response = self.get_reply_to(message)
                 
-                # 查找该用户消息之后的AI回复
-                ai_responses = self.db.query(ChatMessage).filter(
-                    ChatMessage.session_id == message.session_id,
-                    ChatMessage.role == 'assistant',
-                    ChatMessage.created_at > message.created_at
-                ).order_by(ChatMessage.created_at.asc()).all()
-                
-                print(f"[DELETE] 用户消息之后找到 {len(ai_responses)} 条AI回复")
-                
-                if ai_responses:
-                    # 只删除紧接着的第一条AI回复
-                    first_ai_response = ai_responses[0]
+                if first_ai_response:
                     print(f"[DELETE] 将删除第一条AI回复: {first_ai_response.id}, 内容: {first_ai_response.content[:50]}...")
                     messages_to_delete.append(first_ai_response)
                 else:
@@ -500,37 +661,25 @@ class DatabaseManager:
                             print(f"[DELETE] 找到最后一条AI消息: {last_ai.id}")
                             messages_to_delete.append(last_ai)
             
-            # 删除所有相关消息及其关联数据
-            total_deleted = 0
-            deleted_message_ids = []
+            # 删除所有相关消息及其关联数据：每张表一条批量 DELETE，不逐条加载和删除，
+            # 所有语句在同一事务中执行，只在最后提交一次
+            deleted_message_ids = [msg.id for msg in messages_to_delete]
+            print(f"[DELETE] 删除消息: {deleted_message_ids}")
             
-            for msg_to_delete in messages_to_delete:
-                print(f"[DELETE] 删除消息: {msg_to_delete.id} ({msg_to_delete.role})")
-                
-                # 删除相关的情感分析记录
-                emotion_count = self.db.query(EmotionAnalysis).filter(EmotionAnalysis.message_id == msg_to_delete.id).count()
-                if emotion_count > 0:
-                    self.db.query(EmotionAnalysis).filter(EmotionAnalysis.message_id == msg_to_delete.id).delete()
-                    print(f"[DELETE] 删除了 {emotion_count} 条情感分析记录 (消息 {msg_to_delete.id})")
-                
-                # 删除相关的反馈记录
-                feedback_count = self.db.query(UserFeedback).filter(UserFeedback.message_id == msg_to_delete.id).count()
-                if feedback_count > 0:
-                    self.db.query(UserFeedback).filter(UserFeedback.message_id == msg_to_delete.id).delete()
-                    print(f"[DELETE] 删除了 {feedback_count} 条反馈记录 (消息 {msg_to_delete.id})")
-                
-                # 删除相关的评估记录
-                eval_count = self.db.query(ResponseEvaluation).filter(ResponseEvaluation.message_id == msg_to_delete.id).count()
-                if eval_count > 0:
-                    self.db.query(ResponseEvaluation).filter(ResponseEvaluation.message_id == msg_to_delete.id).delete()
-                    print(f"[DELETE] 删除了 {eval_count} 条评估记录 (消息 {msg_to_delete.id})")
-                
-                # 记录要删除的消息ID
-                deleted_message_ids.append(msg_to_delete.id)
-                
-                # 删除消息本身
-                self.db.delete(msg_to_delete)
-                total_deleted += 1
+            for model, label in (
+                (EmotionAnalysis, "情感分析"),
+                (UserFeedback, "反馈"),
+                (ResponseEvaluation, "评估"),
+            ):
+                count = self.db.query(model).filter(
+                    model.message_id.in_(deleted_message_ids)
+                ).delete(synchronize_session=False)
+                if count:
+                    print(f"[DELETE] 删除了 {count} 条{label}记录")
+            
+            total_deleted = self.db.query(ChatMessage).filter(
+                ChatMessage.id.in_(deleted_message_ids)
+            ).delete(synchronize_session=False)
             
             self.db.commit()
             print(f"[DELETE] 成功删除 {total_deleted} 条消息: {deleted_message_ids}")
@@ -550,6 +699,47 @@ class DatabaseManager:
                 "error": str(e)
             }
     
+    def delete_messages(self, message_ids, user_id):
+        """
+        批量删除（清理）指定用户的多条消息及其关联数据
+        
+        单个事务：一条查询确定实际归属该用户的消息，然后每张表一条 DELETE ... IN，
+        语句数与消息条数无关；不做撤回的"最近一条"校验，也不联动删除AI回复
+        
+        Returns:
+            {"deleted_count": 删除条数, "deleted_messages": 消息ID列表, "session_ids": 涉及的会话ID集合}
+        """
+        message_ids = list(dict.fromkeys(message_ids))
+        if not message_ids:
+            return {"deleted_count": 0, "deleted_messages": [], "session_ids": set()}
+        try:
+            rows = self.db.query(ChatMessage.id, ChatMessage.session_id).filter(
+                ChatMessage.id.in_(message_ids),
+                ChatMessage.user_id == user_id
+            ).all()
+            deleted_message_ids = [row.id for row in rows]
+            if not deleted_message_ids:
+                return {"deleted_count": 0, "deleted_messages": [], "session_ids": set()}
+            
+            for model in (EmotionAnalysis, UserFeedback, ResponseEvaluation):
+                self.db.query(model).filter(
+                    model.message_id.in_(deleted_message_ids)
+                ).delete(synchronize_session=False)
+            
+            total_deleted = self.db.query(ChatMessage).filter(
+                ChatMessage.id.in_(deleted_message_ids)
+            ).delete(synchronize_session=False)
+            
+            self.db.commit()
+            return {
+                "deleted_count": total_deleted,
+                "deleted_messages": deleted_message_ids,
+                "session_ids": {row.session_id for row in rows}
+            }
+        except Exception as e:
+            self.db.rollback()
+            raise e
+    
     def create_session(self, session_id, user_id):
         """创建新会话"""
         session = ChatSession(
@@ -561,23 +751,118 @@ class DatabaseManager:
         self.db.refresh(session)
         return session
     
+    def _insert_session_if_missing(self, session_id, user_id):
+        """
+        会话不存在时插入（不提交），返回是否新建
+        
+        MySQL/SQLite 使用 INSERT IGNORE / INSERT OR IGNORE，一条语句完成判断与插入；
+        其他数据库先查询再插入
+        """
+        dialect = self.db.get_bind().dialect.name
+        if dialect in ('mysql', 'sqlite'):
+            now = datetime.utcnow()
+            stmt = insert(ChatSession)\
+                .values(session_id=session_id, user_id=user_id, created_at=now, updated_at=now)\
+                .prefix_with('IGNORE', dialect='mysql')\
+                .prefix_with('OR IGNORE', dialect='sqlite')
+            return self.db.execute(stmt).rowcount > 0
+        
+        exists = self.db.query(ChatSession.id)\
+            .filter(ChatSession.session_id == session_id)\
+            .first()
+        if exists:
+            return False
+        self.db.add(ChatSession(session_id=session_id, user_id=user_id))
+        return True
+    
+    def ensure_session(self, session_id, user_id):
+        """确保会话存在，返回是否新建"""
+        created = self._insert_session_if_missing(session_id, user_id)
+        self.db.commit()
+        return created
+    
+    def save_messages_bulk(self, messages, commit=True):
+        """
+        批量保存消息，所有消息一次 flush、一次提交
+        
+        Args:
+            messages: 消息字段字典列表（session_id, user_id, role, content, emotion, emotion_intensity）
+            commit: 是否提交；为 False 时由调用方在同一事务中继续操作后提交
+            
+        Returns:
+            按输入顺序的消息ID列表
+        """
+        rows = [ChatMessage(**message) for message in messages]
+        try:
+            self.db.add_all(rows)
+            # flush 后即可拿到自增ID，提交后无需再 refresh
+            self.db.flush()
+            message_ids = [row.id for row in rows]
+            if commit:
+                self.db.commit()
+            return message_ids
+        except Exception as e:
+            self.db.rollback()
+            raise e
+    
+    def save_exchange(self, session_id, user_id, user_content, assistant_content, emotion=None, emotion_intensity=None):
+        """
+        在一个事务中确保会话存在并保存一问一答两条消息
+        
+        Returns:
+            (用户消息ID, 助手消息ID)
+        """
+        try:
+            self._insert_session_if_missing(session_id, user_id)
+        except Exception as e:
+            self.db.rollback()
+            raise e
+        user_message_id, assistant_message_id = self.save_messages_bulk([
+            {
+                "session_id": session_id,
+                "user_id": user_id,
+                "role": "user",
+                "content": user_content,
+                "emotion": emotion,
+                "emotion_intensity": emotion_intensity
+            },
+            {
+                "session_id": session_id,
+                "user_id": user_id,
+                "role": "assistant",
+                "content": assistant_content,
+                "emotion": emotion
+            }
+        ])
+        return user_message_id, assistant_message_id
+    
     def delete_session(self, session_id):
         """删除会话及其相关数据"""
+        return session_id in self.delete_sessions([session_id])
+    
+    def delete_sessions(self, session_ids):
+        """
+        批量删除会话及其相关数据（单个事务，每张表一条 DELETE ... IN）
+        
+        Returns:
+            实际存在并被删除的会话ID集合
+        """
+        session_ids = list(dict.fromkeys(session_ids))
+        if not session_ids:
+            return set()
         try:
-            # 删除会话相关的所有消息
-            self.db.query(ChatMessage).filter(ChatMessage.session_id == session_id).delete()
-            
-            # 删除会话相关的反馈
-            self.db.query(UserFeedback).filter(UserFeedback.session_id == session_id).delete()
-            
-            # 删除会话相关的系统日志
-            self.db.query(SystemLog).filter(SystemLog.session_id == session_id).delete()
+            existing = {
+                session_id for (session_id,) in self.db.query(ChatSession.session_id)
+                .filter(ChatSession.session_id.in_(session_ids))
+            }
             
-            # 删除会话记录
-            deleted_count = self.db.query(ChatSession).filter(ChatSession.session_id == session_id).delete()
+            self.db.query(ChatMessage).filter(ChatMessage.session_id.in_(session_ids)).delete(synchronize_session=False)
+            self.db.query(UserFeedback).filter(UserFeedback.session_id.in_(session_ids)).delete(synchronize_session=False)
+            self.db.query(SystemLog).filter(SystemLog.session_id.in_(session_ids)).delete(synchronize_session=False)
+            self.db.query(ChatSession).filter(ChatSession.session_id.in_(session_ids)).delete(synchronize_session=False)
             
             self.db.commit()
-            return deleted_count > 0
+            return existing
         except Exception as e:
             self.db.rollback()
             raise e
@@ -45,6 +45,17 @@ class IntentService:
             - action_required: 是否需要特殊行动
             - suggestion: 建议的响应策略
         """
+        result = self.classify(text)
+        self.report_attention(result, user_id)
+        return result
+    
+    def classify(self, text: str) -> Dict[str, Any]:
+        """
+        分析用户输入的意图（只依赖文本，不记录日志；结果格式同 analyze）
+        
+        Args:
+            text: 用户输入文本
+        """
         # 1. 输入预处理
         processed = self.input_processor.preprocess(text)
         
@@ -67,22 +78,27 @@ class IntentService:
         # 5. 判断是否需要特殊行动
         action_required = self._check_action_required(intent_result, processed)
         
-        result = {
+        return {
             "success": True,
             "processed": processed,
             "intent": intent_result.dict(),
             "action_required": action_required,
             "suggestion": suggestion
         }
+    
+    def report_attention(self, result: Dict[str, Any], user_id: Optional[str] = None) -> None:
+        """
+        需要特殊行动时记录告警日志（每次请求都应调用，即使分析结果来自缓存）
         
-        # 记录日志
-        if action_required:
+        Args:
+            result: classify / analyze 的分析结果
+            user_id: 用户ID（可选）
+        """
+        if result.get("action_required"):
             logger.warning(
-                f"用户 {user_id} 需要特殊关注 - 意图: {intent_result.intent}, "
-                f"风险等级: {processed['risk_level']}"
+                f"用户 {user_id} 需要特殊关注 - 意图: {result['intent']['intent']}, "
+                f"风险等级: {result['processed']['risk_level']}"
             )
-        
-        return result
     
     def _generate_suggestion(
         self, 
@@ -4,6 +4,7 @@
 """
 import os
 import json
+import threading
 import uuid
 from typing import List, Dict, Any, Optional
 from datetime import datetime
@@ -45,6 +46,9 @@ except ImportError as e:
 
 class SimpleEmotionalChatEngine:
     def __init__(self):
+        # 记录本线程最近一次生成是否使用了备用回复（引擎被多个线程共享）
+        self._reply_state = threading.local()
+        
         # 初始化API配置 - 使用统一的LLM配置
         self.api_key = os.getenv("LLM_API_KEY") or os.getenv("DASHSCOPE_API_KEY") or os.getenv("OPENAI_API_KEY")
         self.api_base_url = os.getenv("LLM_BASE_URL") or os.getenv("API_BASE_URL", "https://api.openai.com/v1")
@@ -241,7 +245,12 @@ class SimpleEmotionalChatEngine:
                 
                 if similar_conversations and similar_conversations['documents']:
                     long_term_context = "\n相关历史对话参考：\n"
-                    for doc in similar_conversations['documents'][0][:2]:  # 取前2个最相似的
+                    metadatas = (similar_conversations.get('metadatas') or [[]])[0] or []
+                    for i, doc in enumerate(similar_conversations['documents'][0][:2]):  # 取前2个最相似的
+                        # 新记录的文档只有用户消息，助手回复保存在元数据中
+                        reply = metadatas[i].get('response') if i < len(metadatas) and metadatas[i] else None
+                        if reply:
+                            doc = "用户: {}\n助手: {}".format(doc, reply)
                         long_term_context += "- {}\n".format(doc[:100])  # 限制长度
                     long_term_context += "\n"
             except Exception as e:
@@ -308,8 +317,17 @@ class SimpleEmotionalChatEngine:
             print("API调用失败 ({}): {}".format(self.model, e))
             return self._get_fallback_response(user_input)
     
+    def begin_reply(self):
+        """开始生成一次回复：清除本线程的备用回复标记"""
+        self._reply_state.fallback = False
+    
+    def reply_was_fallback(self) -> bool:
+        """本线程自 begin_reply 以来的生成是否使用了备用回复"""
+        return getattr(self._reply_state, "fallback", False)
+    
     def _get_fallback_response(self, user_input, emotion_data=None):
         """提供备选回应当API调用失败时"""
+        self._reply_state.fallback = True
         if emotion_data is None:
             # 如果没有提供情感数据，则分析用户输入
             emotion_data = self.analyze_emotion(user_input)
@@ -5,7 +5,8 @@ import os
 import json
 import uuid
 import re
-from typing import List, Dict, Any, Optional
+import threading
+from typing import List, Dict, Any, Optional, Iterator
 from datetime import datetime
 import requests
 
@@ -33,6 +34,7 @@ from backend.plugins.weather_plugin import WeatherPlugin
 from backend.plugins.news_plugin import NewsPlugin
 from backend.plugins.holiday_plugin import HolidayPlugin
 from backend.services.personalization_service import get_personalization_service
+from backend.logging_config import get_logger
 
 try:
     from backend.vector_store import VectorStore
@@ -40,6 +42,8 @@ try:
 except ImportError:
     VECTOR_STORE_AVAILABLE = False
 
+logger = get_logger(__name__)
+
 
 class EmotionalChatEngineWithPlugins:
     """
@@ -48,6 +52,9 @@ class EmotionalChatEngineWithPlugins:
     """
     
     def __init__(self):
+        # 记录本线程最近一次生成是否使用了备用回复（引擎被多个线程共享）
+        self._reply_state = threading.local()
+        
         # 初始化LLM路由器（优先使用）
         try:
             self.llm_router = LLMRouter()
@@ -242,6 +249,93 @@ class EmotionalChatEngineWithPlugins:
             plugin_result=plugin_result
         )
     
+    def stream(self, request: ChatRequest) -> Iterator[str]:
+        """
+        流式生成回复（同步生成器，逐段产出文本）
+        
+        只负责生成，不保存消息，由调用方在流结束后持久化。
+        需要调用插件或未配置 API_KEY 时无法逐 token 输出，退回整段生成后一次产出。
+        """
+        session_id = request.session_id or str(uuid.uuid4())
+        user_id = request.user_id or "anonymous"
+        user_input = request.message
+        context_info = request.context if hasattr(request, 'context') and request.context else {}
+        emotion_data = self._analyze_emotion_simple(user_input)
+        emotion_state = {
+            "emotion": emotion_data["emotion"],
+            "intensity": emotion_data["intensity"]
+        }
+        
+        needs_plugin = (
+            self._detect_weather_intent(user_input)
+            or self._detect_holiday_intent(user_input)
+            or self._detect_news_intent(user_input)
+        )
+        if needs_plugin or not self.api_key:
+            yield self._generate_response_with_plugins(
+                user_input,
+                session_id,
+                user_id=user_id,
+                emotion_state=emotion_state,
+                deep_thinking=request.deep_thinking or False,
+                context_info=context_info
+            )
+            return
+        
+        system_prompt = self._get_personalized_system_prompt(user_id, user_input, emotion_state)
+        context_text = self._format_context_info(context_info)
+        if context_text:
+            system_prompt += f"\n\n【用户上下文】\n{context_text}"
+        
+        messages = [{"role": "system", "content": system_prompt}]
+        with DatabaseManager() as db:
+            recent_messages = db.get_session_messages(session_id, limit=12)
+            for msg in reversed(recent_messages):
+                messages.append({"role": msg.role, "content": msg.content})
+        messages.append({"role": "user", "content": user_input})
+        
+        data = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": 0.5 if request.deep_thinking else 0.7,
+            "max_tokens": 2000 if request.deep_thinking else 1000,
+            "stream": True
+        }
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        
+        produced = False
+        try:
+            with requests.post(
+                f"{self.api_base_url}/chat/completions",
+                headers=headers,
+                json=data,
+                timeout=30,
+                stream=True
+            ) as response:
+                response.raise_for_status()
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue
+                    payload = line[5:].strip()
+                    if payload == "[DONE]":
+                        break
+                    choices = json.loads(payload).get("choices") or []
+                    delta = choices[0].get("delta", {}).get("content") if choices else None
+                    if delta:
+                        produced = True
+                        yield delta
+        except Exception as e:
+            logger.error("LLM流式调用失败: %s", e)
+            # 已产出部分内容时不能再补兜底回复：抛出异常，由调用方报告错误且不保存不完整的回复
+            if produced:
+                raise
+        
+        if not produced:
+            yield self._get_fallback_response(user_input)
+    
     def _detect_weather_intent(self, user_input: str) -> Optional[str]:
         """检测用户是否在询问天气，如果是则返回城市名称"""
         weather_keywords = ["天气", "温度", "下雨", "晴天", "阴天", "weather", "温度", "气温", "降雨", "下雪"]
@@ -1393,8 +1487,17 @@ class EmotionalChatEngineWithPlugins:
         }
         return suggestions_map.get(emotion, suggestions_map["neutral"])
     
+    def begin_reply(self):
+        """开始生成一次回复：清除本线程的备用回复标记"""
+        self._reply_state.fallback = False
+    
+    def reply_was_fallback(self) -> bool:
+        """本线程自 begin_reply 以来的生成是否使用了备用回复"""
+        return getattr(self._reply_state, "fallback", False)
+    
     def _get_fallback_response(self, user_input: str) -> str:
         """备用回复"""
+        self._reply_state.fallback = True
         emotion_data = self._analyze_emotion_simple(user_input)
         suggestions = emotion_data.get("suggestions", [])
         return suggestions[0] if suggestions else "我在这里倾听你的心声。"
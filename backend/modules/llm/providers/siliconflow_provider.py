@@ -12,8 +12,10 @@ from .base_provider import BaseLLMProvider, LLMMessage, LLMResponse
 class SiliconFlowProvider(BaseLLMProvider):
     """SiliconFlow LLM提供商"""
     
-    def __init__(self, config: Dict[str, Any]):
+    def __init__(self, config: Dict[str, Any], session: Optional[requests.Session] = None):
         super().__init__(config)
+        # 所有请求复用同一个会话的连接池，避免每次调用重新做 TCP/TLS 握手
+        self.session = session or requests.Session()
         self.api_key = config.get('api_key')
         self.base_url = config.get('base_url', 'https://api.siliconflow.cn/v1')
         self.model = config.get('model', 'Qwen/Qwen2.5-7B-Instruct')
@@ -51,7 +53,7 @@ class SiliconFlowProvider(BaseLLMProvider):
                 "Content-Type": "application/json"
             }
             
-            response = requests.post(
+            response = self.session.post(
                 f"{self.base_url}/chat/completions",
                 json=data,
                 headers=headers,
@@ -114,7 +116,7 @@ class SiliconFlowProvider(BaseLLMProvider):
                 "max_tokens": 1
             }
             
-            response = requests.post(
+            response = self.session.post(
                 f"{self.base_url}/chat/completions",
                 json=test_data,
                 headers=headers,
@@ -156,7 +158,7 @@ class SiliconFlowProvider(BaseLLMProvider):
             
             print(f"[SILICONFLOW] 获取embedding，模型: {model}, 文本数量: {len(texts)}")
             
-            response = requests.post(
+            response = self.session.post(
                 f"{self.base_url}/embeddings",
                 json=data,
                 headers=headers,
@@ -190,7 +192,7 @@ class SiliconFlowProvider(BaseLLMProvider):
                 "Content-Type": "application/json"
             }
             
-            response = requests.get(
+            response = self.session.get(
                 f"{self.base_url}/models",
                 headers=headers,
                 timeout=10
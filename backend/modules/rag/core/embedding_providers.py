@@ -5,6 +5,7 @@ Embedding 提供商管理器
 """
 
 import os
+import threading
 from typing import List, Optional, Dict, Any
 from abc import ABC, abstractmethod
 import logging
@@ -246,8 +247,19 @@ class EmbeddingProviderManager:
             return False
 
 
-# 全局实例
-embedding_manager = EmbeddingProviderManager()
+# 全局实例（延迟创建，进程内共享）
+_embedding_manager: Optional[EmbeddingProviderManager] = None
+_embedding_manager_lock = threading.Lock()
+
+
+def get_embedding_manager() -> EmbeddingProviderManager:
+    """获取全局 EmbeddingProviderManager 实例"""
+    global _embedding_manager
+    if _embedding_manager is None:
+        with _embedding_manager_lock:
+            if _embedding_manager is None:
+                _embedding_manager = EmbeddingProviderManager()
+    return _embedding_manager
 
 
 def get_embedding_instance(
@@ -268,7 +280,7 @@ def get_embedding_instance(
     Returns:
         Embedding 实例或 None
     """
-    return embedding_manager.get_embedding_instance(provider, model, api_key, base_url)
+    return get_embedding_manager().get_embedding_instance(provider, model, api_key, base_url)
 
 
 if __name__ == "__main__":
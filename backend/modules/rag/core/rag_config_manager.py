@@ -5,17 +5,153 @@ RAG 配置管理器
 """
 
 import os
+import sys
 import json
-from typing import Dict, Any, Optional, List
-from pathlib import Path
+import functools
+from typing import Any, Optional
 
 from backend.logging_config import get_logger
 from backend.modules.rag.models.rag_models import RAGConfig
-from backend.modules.rag.core.embedding_providers import EmbeddingProviderManager
 from config import Config
 
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import ijson
+    IJSON_AVAILABLE = True
+except ImportError:
+    IJSON_AVAILABLE = False
+
 logger = get_logger(__name__)
 
+# 小于该大小的配置文件直接整体解析；更大的文件使用 ijson 增量解析
+STREAM_PARSE_THRESHOLD = 256 * 1024
+
+
+def _read_config_json(path: str) -> dict[str, Any]:
+    """
+    读取 JSON 配置文件
+
+    小文件走 orjson/json 一次性解析；大文件（例如附带大体积 filters 元数据的导出包）
+    使用 ijson 按顶层键增量解析，只保留 RAGConfig 需要的字段，避免整棵树驻留内存。
+    """
+    if IJSON_AVAILABLE and os.path.getsize(path) >= STREAM_PARSE_THRESHOLD:
+        fields = RAGConfig.__fields__
+        with open(path, 'rb') as f:
+            return {
+                key: value
+                for key, value in ijson.kvitems(f, '', use_float=True)
+                if key in fields
+            }
+
+    with open(path, 'rb') as f:
+        raw = f.read()
+    if ORJSON_AVAILABLE:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+# 影响知识库管理器构建的配置项
+KB_MANAGER_CONFIG_KEYS = frozenset({
+    'knowledge_base_path',
+    'chunking_strategy',
+    'chunk_size',
+    'chunk_overlap',
+    'embedding_provider',
+    'embedding_model',
+    'embedding_api_key',
+    'embedding_base_url',
+})
+
+
+@functools.lru_cache(maxsize=4)
+def _build_knowledge_base_manager(
+    persist_directory: str,
+    chunking_strategy: str,
+    chunk_size: int,
+    chunk_overlap: int,
+    embedding_provider: str,
+    embedding_model: str,
+    embedding_api_key: Optional[str],
+    embedding_base_url: Optional[str]
+):
+    """按配置构建知识库管理器，相同配置复用已打开的向量库与 embedding 客户端"""
+    from backend.modules.rag.core.knowledge_base import KnowledgeBaseManager
+    
+    return KnowledgeBaseManager(
+        persist_directory=persist_directory,
+        chunking_strategy=chunking_strategy,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        embedding_provider=embedding_provider,
+        embedding_model=embedding_model,
+        embedding_api_key=embedding_api_key,
+        embedding_base_url=embedding_base_url
+    )
+
+
+def clear_knowledge_base_manager_cache() -> None:
+    """
+    丢弃缓存的知识库管理器
+
+    知识库集合被删除或重建后调用：缓存实例持有的向量库句柄指向已删除的集合
+    """
+    _build_knowledge_base_manager.cache_clear()
+
+
+# 预定义的 embedding 提供商配置
+_PROVIDER_CONFIGS = {
+    "siliconflow": {
+        "name": "SiliconFlow",
+        "description": "API 聚合平台，支持多种模型",
+        "models": [
+            "BAAI/bge-m3",
+            "BAAI/bge-large-zh-v1.5",
+            "sentence-transformers/all-MiniLM-L6-v2"
+        ],
+        "requires_api_key": True,
+        "default_base_url": "https://api.siliconflow.cn/v1"
+    },
+    "openai": {
+        "name": "OpenAI",
+        "description": "OpenAI 官方 embedding 服务",
+        "models": [
+            "text-embedding-ada-002",
+            "text-embedding-3-small",
+            "text-embedding-3-large"
+        ],
+        "requires_api_key": True,
+        "default_base_url": "https://api.openai.com/v1"
+    },
+    "ollama": {
+        "name": "Ollama",
+        "description": "本地部署的 embedding 服务",
+        "models": [
+            "nomic-embed-text",
+            "mxbai-embed-large",
+            "all-minilm"
+        ],
+        "requires_api_key": False,
+        "default_base_url": "http://localhost:11434"
+    },
+    "deepseek": {
+        "name": "DeepSeek",
+        "description": "DeepSeek 的 embedding 服务",
+        "models": [
+            "text-embedding-v1"
+        ],
+        "requires_api_key": True,
+        "default_base_url": "https://api.deepseek.com/v1"
+    }
+}
+
+# 提供商 ID 驻留后，与驻留的当前提供商比较时命中引用相等的快速路径
+_PROVIDER_IDS = tuple(sys.intern(k) for k in _PROVIDER_CONFIGS)
+
 
 class RAGConfigManager:
     """RAG 配置管理器"""
@@ -27,8 +163,14 @@ class RAGConfigManager:
         Args:
             config_file: 配置文件路径，如果为 None 则只使用环境变量配置
         """
+        # 延迟导入，使仅读取配置的场景不必加载 embedding 依赖链
+        from backend.modules.rag.core.embedding_providers import get_embedding_manager
+        
         self.config_file = config_file
-        self.embedding_manager = EmbeddingProviderManager()
+        self.embedding_manager = get_embedding_manager()
+        # 知识库路径是否存在的缓存：只缓存"存在"，不存在时每次重新检查
+        # （路径可能稍后才创建）；路径变更时失效
+        self._kb_path_exists: Optional[bool] = None
         self._load_config()
         logger.info("RAG 配置管理器初始化完成")
     
@@ -37,8 +179,7 @@ class RAGConfigManager:
         try:
             # 如果指定了配置文件且文件存在，则从文件加载
             if self.config_file and os.path.exists(self.config_file):
-                with open(self.config_file, 'r', encoding='utf-8') as f:
-                    config_data = json.load(f)
+                config_data = _read_config_json(self.config_file)
                 self.config = RAGConfig(**config_data)
                 logger.info(f"从文件加载 RAG 配置: {self.config_file}")
             else:
@@ -71,6 +212,20 @@ class RAGConfigManager:
             embedding_base_url=Config.EMBEDDING_BASE_URL
         )
     
+    @staticmethod
+    def _serialize_compact(config: RAGConfig) -> bytes:
+        """紧凑序列化，用于程序内部持久化的配置文件"""
+        if ORJSON_AVAILABLE:
+            return orjson.dumps(config.dict())
+        return json.dumps(config.dict(), separators=(',', ':')).encode('utf-8')
+    
+    @staticmethod
+    def _serialize_pretty(config: RAGConfig) -> bytes:
+        """带缩进的序列化，用于导出给人阅读的配置文件"""
+        if ORJSON_AVAILABLE:
+            return orjson.dumps(config.dict(), option=orjson.OPT_INDENT_2)
+        return json.dumps(config.dict(), indent=2, ensure_ascii=False).encode('utf-8')
+    
     def _save_config(self) -> None:
         """保存配置到文件"""
         if not self.config_file:
@@ -78,9 +233,25 @@ class RAGConfigManager:
             return
             
         try:
-            config_dict = self.config.dict()
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(config_dict, f, indent=2, ensure_ascii=False)
+            data = self._serialize_compact(self.config)
+            
+            # 先写临时文件再原子替换；配置含 API 密钥，权限限定为 0600
+            # （O_CREAT 的 mode 对已存在的残留临时文件不生效，打开后再显式 fchmod）
+            tmp_path = f"{self.config_file}.tmp"
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            try:
+                # 文件对象的 write 会写完全部字节，不会像 os.write 那样部分写入
+                with os.fdopen(fd, 'wb') as f:
+                    if hasattr(os, "fchmod"):
+                        os.fchmod(f.fileno(), 0o600)
+                    f.write(data)
+                os.replace(tmp_path, self.config_file)
+            except BaseException:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+                raise
             logger.info(f"配置已保存到: {self.config_file}")
         except Exception as e:
             logger.error(f"保存配置失败: {e}")
@@ -103,6 +274,11 @@ class RAGConfigManager:
                     setattr(self.config, key, value)
                     logger.info(f"更新配置项: {key} = {value}")
             
+            if 'knowledge_base_path' in kwargs:
+                self._kb_path_exists = None
+            if KB_MANAGER_CONFIG_KEYS.intersection(kwargs):
+                _build_knowledge_base_manager.cache_clear()
+            
             # 保存到文件
             self._save_config()
             
@@ -150,75 +326,31 @@ class RAGConfigManager:
             logger.error(f"设置 embedding 提供商失败: {e}")
             return False
     
-    def get_available_providers(self) -> List[Dict[str, Any]]:
+    def get_available_providers(self) -> list[dict[str, Any]]:
         """获取可用的 embedding 提供商列表"""
         providers = []
         
-        # 预定义的提供商配置
-        provider_configs = {
-            "siliconflow": {
-                "name": "SiliconFlow",
-                "description": "API 聚合平台，支持多种模型",
-                "models": [
-                    "BAAI/bge-m3",
-                    "BAAI/bge-large-zh-v1.5",
-                    "sentence-transformers/all-MiniLM-L6-v2"
-                ],
-                "requires_api_key": True,
-                "default_base_url": "https://api.siliconflow.cn/v1"
-            },
-            "openai": {
-                "name": "OpenAI",
-                "description": "OpenAI 官方 embedding 服务",
-                "models": [
-                    "text-embedding-ada-002",
-                    "text-embedding-3-small",
-                    "text-embedding-3-large"
-                ],
-                "requires_api_key": True,
-                "default_base_url": "https://api.openai.com/v1"
-            },
-            "ollama": {
-                "name": "Ollama",
-                "description": "本地部署的 embedding 服务",
-                "models": [
-                    "nomic-embed-text",
-                    "mxbai-embed-large",
-                    "all-minilm"
-                ],
-                "requires_api_key": False,
-                "default_base_url": "http://localhost:11434"
-            },
-            "deepseek": {
-                "name": "DeepSeek",
-                "description": "DeepSeek 的 embedding 服务",
-                "models": [
-                    "text-embedding-v1"
-                ],
-                "requires_api_key": True,
-                "default_base_url": "https://api.deepseek.com/v1"
-            }
-        }
-        
         # 检查每个提供商的可用性
-        available_provider_names = self.embedding_manager.get_available_providers()
+        available = frozenset(self.embedding_manager.get_available_providers())
+        current = sys.intern(self.config.embedding_provider)
         
-        for provider_id, config in provider_configs.items():
+        for provider_id in _PROVIDER_IDS:
+            config = _PROVIDER_CONFIGS[provider_id]
             provider_info = {
                 "id": provider_id,
                 "name": config["name"],
                 "description": config["description"],
-                "models": config["models"],
+                "models": list(config["models"]),
                 "requires_api_key": config["requires_api_key"],
                 "default_base_url": config["default_base_url"],
-                "available": provider_id in available_provider_names,
-                "current": provider_id == self.config.embedding_provider
+                "available": provider_id in available,
+                "current": provider_id == current
             }
             providers.append(provider_info)
         
         return providers
     
-    def get_current_provider_info(self) -> Dict[str, Any]:
+    def get_current_provider_info(self) -> dict[str, Any]:
         """获取当前提供商信息"""
         return {
             "provider": self.config.embedding_provider,
@@ -228,7 +360,7 @@ class RAGConfigManager:
             "enabled": self.config.enabled
         }
     
-    def test_current_config(self) -> Dict[str, Any]:
+    def test_current_config(self) -> dict[str, Any]:
         """测试当前配置"""
         try:
             # 测试 embedding
@@ -237,8 +369,10 @@ class RAGConfigManager:
                 self.config.embedding_model
             )
             
-            # 测试知识库路径
-            kb_path_exists = os.path.exists(self.config.knowledge_base_path)
+            # 测试知识库路径（已存在的结果缓存，避免每次健康检查都 stat；不存在时重新检查）
+            if not self._kb_path_exists:
+                self._kb_path_exists = os.path.exists(self.config.knowledge_base_path)
+            kb_path_exists = self._kb_path_exists
             
             return {
                 "embedding_test": embedding_success,
@@ -256,30 +390,27 @@ class RAGConfigManager:
             }
     
     def create_knowledge_base_manager(self):
-        """根据当前配置创建知识库管理器"""
-        from backend.modules.rag.core.knowledge_base import KnowledgeBaseManager
-        
-        return KnowledgeBaseManager(
-            persist_directory=self.config.knowledge_base_path,
-            chunking_strategy=self.config.chunking_strategy,
-            chunk_size=self.config.chunk_size,
-            chunk_overlap=self.config.chunk_overlap,
-            embedding_provider=self.config.embedding_provider,
-            embedding_model=self.config.embedding_model,
-            embedding_api_key=self.config.embedding_api_key,
-            embedding_base_url=self.config.embedding_base_url
+        """根据当前配置获取知识库管理器（相同配置返回缓存实例）"""
+        return _build_knowledge_base_manager(
+            self.config.knowledge_base_path,
+            self.config.chunking_strategy,
+            self.config.chunk_size,
+            self.config.chunk_overlap,
+            self.config.embedding_provider,
+            self.config.embedding_model,
+            self.config.embedding_api_key,
+            self.config.embedding_base_url
         )
     
     def export_config(self, export_path: str) -> bool:
         """导出配置到指定路径"""
         try:
-            config_dict = self.config.dict()
-            # 不导出敏感信息
-            if 'embedding_api_key' in config_dict:
-                config_dict['embedding_api_key'] = "***HIDDEN***"
+            # 不导出敏感信息：浅拷贝时直接替换字段，无需再复制和修改整个 dict
+            exported = self.config.copy(update={'embedding_api_key': "***HIDDEN***"})
+            data = self._serialize_pretty(exported)
             
-            with open(export_path, 'w', encoding='utf-8') as f:
-                json.dump(config_dict, f, indent=2, ensure_ascii=False)
+            with open(export_path, 'wb') as f:
+                f.write(data)
             
             logger.info(f"配置已导出到: {export_path}")
             return True
@@ -291,12 +422,13 @@ class RAGConfigManager:
     def import_config(self, import_path: str) -> bool:
         """从指定路径导入配置"""
         try:
-            with open(import_path, 'r', encoding='utf-8') as f:
-                config_data = json.load(f)
+            config_data = _read_config_json(import_path)
             
             # 验证配置
             new_config = RAGConfig(**config_data)
             self.config = new_config
+            self._kb_path_exists = None
+            _build_knowledge_base_manager.cache_clear()
             self._save_config()
             
             logger.info(f"配置已从 {import_path} 导入")
@@ -11,8 +11,9 @@ import os
 import tempfile
 from pathlib import Path
 
-from ..services.rag_service import RAGService, RAGIntegrationService
+from ..services.rag_service import RAGService, RAGIntegrationService, rag_query_cache
 from ..core.knowledge_base import KnowledgeBaseManager, PsychologyKnowledgeLoader
+from ..core.rag_config_manager import clear_knowledge_base_manager_cache
 from backend.logging_config import get_logger
 
 logger = get_logger(__name__)
@@ -152,6 +153,7 @@ async def init_sample_knowledge(request: LoadSampleRequest = None):
         if request.overwrite:
             try:
                 kb_manager.delete_collection()
+                clear_knowledge_base_manager_cache()
                 logger.info("已删除现有知识库")
             except:
                 pass
@@ -159,6 +161,7 @@ async def init_sample_knowledge(request: LoadSampleRequest = None):
         # 加载示例知识
         loader = PsychologyKnowledgeLoader(kb_manager)
         loader.load_sample_knowledge()
+        rag_query_cache.clear()
         
         # 获取统计信息
         stats = kb_manager.get_stats()
@@ -192,6 +195,7 @@ async def init_knowledge_base_structure(request: LoadSampleRequest = None):
         if request.overwrite:
             try:
                 kb_manager.delete_collection()
+                clear_knowledge_base_manager_cache()
                 logger.info("已删除现有知识库")
             except:
                 pass
@@ -199,6 +203,7 @@ async def init_knowledge_base_structure(request: LoadSampleRequest = None):
         # 从知识库结构加载知识
         loader = PsychologyKnowledgeLoader(kb_manager)
         loader.load_from_knowledge_base_structure()
+        rag_query_cache.clear()
         
         # 获取统计信息
         stats = kb_manager.get_stats()
@@ -236,6 +241,7 @@ async def upload_pdf(file: UploadFile = File(...)):
             kb_manager = get_kb_manager()
             loader = PsychologyKnowledgeLoader(kb_manager)
             loader.load_from_pdf(tmp_path)
+            rag_query_cache.clear()
             
             # 获取统计信息
             stats = kb_manager.get_stats()
@@ -350,6 +356,8 @@ async def reset_knowledge_base():
         
         kb_manager = get_kb_manager()
         kb_manager.delete_collection()
+        clear_knowledge_base_manager_cache()
+        rag_query_cache.clear()
         
         # 重置全局实例
         global _kb_manager, _rag_service, _integration_service
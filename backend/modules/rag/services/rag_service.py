@@ -17,11 +17,76 @@ from langchain_core.prompts import PromptTemplate
 
 from ..core.knowledge_base import KnowledgeBaseManager
 from backend.logging_config import get_logger
+from backend.utils.fingerprint import text_fingerprint
+from backend.utils.ttl_cache import TTLLRUCache
 from config import Config
 
 logger = get_logger(__name__)
 
 
+class QueryCache(TTLLRUCache):
+    """
+    RAG 增强结果的 LRU + TTL 缓存（线程安全）
+    
+    重复提问或重新生成回复时直接复用上一次的检索与生成结果，
+    避免再次计算 embedding 和向量检索。知识库内容变化时需调用 clear()。
+    """
+    
+    def __init__(self, ttl_seconds: int = 300, max_size: int = 1000):
+        super().__init__(ttl_seconds, max_size)
+    
+    @staticmethod
+    def make_key(
+        message: str,
+        emotion: Optional[str] = None,
+        conversation_history: Optional[List[Dict[str, str]]] = None
+    ) -> bytes:
+        """缓存键：消息 + 情绪 + 最近一条历史的 blake2b 指纹"""
+        if conversation_history:
+            latest = conversation_history[0]
+            return text_fingerprint(message, emotion, latest.get('role', ''), latest.get('content', ''))
+        return text_fingerprint(message, emotion)
+
+
+# 全局 RAG 结果缓存
+rag_query_cache = QueryCache()
+
+
+# 结合上下文问答的提示词模板，模块加载时定义一次，每轮只做一次 format 填充
+CONTEXT_PROMPT_TEMPLATE = """你是"心语"，一个专业的心理健康陪伴机器人。
+
+请基于下面的专业知识和对话上下文，用温暖、共情和专业的语气回答用户。注意：
+1. 考虑用户的情绪状态，给予适当的情感支持
+2. 结合对话历史，提供连贯的回应
+3. 优先使用知识库中的科学方法和技巧
+4. 用通俗易懂的语言解释专业概念
+5. 提供具体可操作的建议
+6. 询问用户是否需要进一步的指导或陪伴
+
+参考的专业知识：
+{knowledge_context}
+
+{emotion_context}
+
+最近对话：
+{history_context}
+
+用户当前问题：{question}
+
+回答："""
+
+
+def _knowledge_order_key(doc: Document) -> tuple:
+    """检索文档在提示词中的稳定顺序：来源、文档ID、分块ID，最后按内容"""
+    metadata = doc.metadata or {}
+    return (
+        str(metadata.get('source', '')),
+        str(metadata.get('doc_id', '')),
+        str(metadata.get('chunk_id', '')),
+        doc.page_content
+    )
+
+
 class RAGService:
     """RAG检索增强生成服务"""
     
@@ -206,11 +271,12 @@ class RAGService:
             # 先检索相关知识
             knowledge_docs = self.kb_manager.search_similar(question, k=search_k)
             
-            # 构建增强的上下文
-            knowledge_context = "\n\n".join([
+            # 构建增强的上下文：知识按来源排序而非按相似度排序，检索到同一组文档时
+            # 提示词前缀逐字相同，可命中 LLM 服务端的前缀缓存（prefix caching）
+            knowledge_context = "\n\n".join(
                 f"【知识{i+1}】{doc.page_content}"
-                for i, doc in enumerate(knowledge_docs)
-            ])
+                for i, doc in enumerate(sorted(knowledge_docs, key=_knowledge_order_key))
+            )
             
             # 构建对话历史上下文
             history_context = ""
@@ -226,28 +292,13 @@ class RAGService:
             # 构建情绪上下文
             emotion_context = f"用户当前情绪: {user_emotion}" if user_emotion else ""
             
-            # 构建完整的prompt
-            enhanced_prompt = f"""你是"心语"，一个专业的心理健康陪伴机器人。
-
-{emotion_context}
-
-最近对话：
-{history_context}
-
-参考的专业知识：
-{knowledge_context}
-
-用户当前问题：{question}
-
-请基于上述专业知识和对话上下文，用温暖、共情和专业的语气回答用户。注意：
-1. 考虑用户的情绪状态，给予适当的情感支持
-2. 结合对话历史，提供连贯的回应
-3. 优先使用知识库中的科学方法和技巧
-4. 用通俗易懂的语言解释专业概念
-5. 提供具体可操作的建议
-6. 询问用户是否需要进一步的指导或陪伴
-
-回答："""
+            # 填充模块级提示词模板：固定的角色说明和知识在前，随每轮变化的情绪、历史和问题在后
+            enhanced_prompt = CONTEXT_PROMPT_TEMPLATE.format(
+                knowledge_context=knowledge_context,
+                emotion_context=emotion_context,
+                history_context=history_context,
+                question=question
+            )
             
             # 使用LLM生成回答
             response = self.llm.predict(enhanced_prompt)
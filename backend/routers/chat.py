@@ -4,18 +4,44 @@
 """
 
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Query
+from fastapi.responses import StreamingResponse
 from typing import List, Optional
 from backend.models import ChatRequest, ChatResponse, MessageUpdateRequest
 from backend.services.chat_service import ChatService
 from backend.logging_config import get_logger
+import asyncio
+import contextlib
+import functools
 import json
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from datetime import datetime
 import uuid
 import os
 import sys
+import threading
 import PyPDF2
 import requests
-from bs4 import BeautifulSoup
+import lxml.html
+import aiofiles
+
+try:
+    import pypdfium2 as pdfium
+    PDFIUM_AVAILABLE = True
+except ImportError:
+    PDFIUM_AVAILABLE = False
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    from cachetools import TTLCache
+    CACHETOOLS_AVAILABLE = True
+except ImportError:
+    CACHETOOLS_AVAILABLE = False
 
 # 添加项目根目录到Python路径
 project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -34,19 +60,85 @@ UPLOAD_DIR.mkdir(exist_ok=True)
 # 支持的文件类型
 ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.pdf', '.txt', '.doc', '.docx'}
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
-
-def is_allowed_file(filename):
-    return Path(filename).suffix.lower() in ALLOWED_EXTENSIONS
-
-def extract_text_from_pdf(file_path):
-    """从PDF文件中提取文本"""
+UPLOAD_CHUNK_SIZE = 64 * 1024  # 上传文件分块写盘大小
+
+# 批量删除消息单次最多条数：ID 列表作为 IN 参数用于四张表，需低于驱动和 SQLite 的参数个数上限
+MAX_BATCH_DELETE_MESSAGES = 500
+
+# PDF 解析是 CPU 密集型操作，使用独立的有界线程池，避免并发上传时挤占默认线程池
+PDF_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="pdf-extract")
+
+# PDFium 不是线程安全的：同一进程内所有文档的打开、遍历和关闭都在这把锁内串行执行
+# （PyPDF2 回退路径不受限制，仍可在线程池中并行）
+_PDFIUM_LOCK = threading.Lock()
+
+# URL 抓取复用同一个连接池，避免每次请求重新做 DNS 解析和 TCP/TLS 握手
+_HTTP = requests.Session()
+_HTTP.headers.update({
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+})
+
+# URL 解析结果缓存：同一链接常被多个用户粘贴，10 分钟内直接复用解析结果
+URL_CACHE_TTL = 600
+_url_cache = TTLCache(maxsize=1024, ttl=URL_CACHE_TTL) if CACHETOOLS_AVAILABLE else None
+_url_cache_lock = threading.Lock()
+
+# 正文提取：命中以下标签或 class 的节点视为正文块
+CONTENT_TAGS = frozenset({'article', 'main', 'p'})
+CONTENT_CLASSES = frozenset({'content', 'post-content', 'entry-content'})
+SKIP_TAGS = frozenset({'script', 'style', 'noscript', 'head'})
+MAX_CONTENT_BLOCKS = 5
+
+def get_file_extension(filename):
+    """返回小写的文件扩展名（含点号），无扩展名时返回空字符串"""
+    return os.path.splitext(filename)[1].lower()
+
+@functools.lru_cache(maxsize=64)
+def is_allowed_extension(ext):
+    """扩展名是否允许上传（按扩展名而非文件名缓存，取值集合很小，命中率高）"""
+    return ext in ALLOWED_EXTENSIONS
+
+def iter_pdf_pages(file_path):
+    """逐页产出PDF文本（优先使用 pdfium 的 C++ 文本提取，不可用时回退到 PyPDF2）"""
+    if PDFIUM_AVAILABLE:
+        # 锁持有到文档关闭为止，调用方提前结束遍历时须关闭生成器（见 extract_text_from_pdf）
+        with _PDFIUM_LOCK:
+            pdf = pdfium.PdfDocument(str(file_path))
+            try:
+                for page in pdf:
+                    textpage = page.get_textpage()
+                    try:
+                        yield textpage.get_text_range()
+                    finally:
+                        textpage.close()
+                        page.close()
+            finally:
+                pdf.close()
+        return
+    
+    with open(file_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        for page in pdf_reader.pages:
+            yield page.extract_text()
+
+def extract_text_from_pdf(file_path, max_chars=8000):
+    """
+    从PDF文件中提取文本
+    
+    下游只使用内容的前几百个字符，因此累计达到 max_chars 后即停止解析后续页面
+    """
     try:
-        with open(file_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-            return text
+        parts = []
+        total = 0
+        # 提前结束时立即关闭生成器，释放 PDFium 锁
+        with contextlib.closing(iter_pdf_pages(file_path)) as pages:
+            for page_text in pages:
+                parts.append(page_text)
+                parts.append("\n")
+                total += len(page_text) + 1
+                if total >= max_chars:
+                    break
+        return "".join(parts)
     except Exception as e:
         logger.error(f"PDF文本提取失败: {e}")
         return ""
@@ -61,33 +153,91 @@ def extract_text_from_image(file_path):
         logger.error(f"图片文本提取失败: {e}")
         return ""
 
+def read_text_file(file_path):
+    """读取文本文件内容"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+# 扩展名 -> 文本提取函数；不在表中的允许类型（如 .doc/.docx）暂不提取内容
+EXT_HANDLERS = {
+    '.pdf': extract_text_from_pdf,
+    '.jpg': extract_text_from_image,
+    '.jpeg': extract_text_from_image,
+    '.png': extract_text_from_image,
+    '.gif': extract_text_from_image,
+    '.txt': read_text_file,
+}
+
+def extract_file_content(file_path, file_extension):
+    """按扩展名提取附件文本内容（同步阻塞，应在线程池中执行；扩展名需已小写）"""
+    handler = EXT_HANDLERS.get(file_extension)
+    return handler(file_path) if handler else ""
+
+def iter_content_blocks(root):
+    """
+    单次遍历 DOM，按文档顺序产出正文块
+    
+    命中的节点不再向下展开，避免 <article> 与其内部 <p> 重复计入；
+    调用方取够数量后停止迭代，页面上其余节点不会被访问。
+    """
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        tag = node.tag
+        if not isinstance(tag, str) or tag in SKIP_TAGS:
+            continue
+        if tag in CONTENT_TAGS or CONTENT_CLASSES.intersection((node.get('class') or '').split()):
+            yield node
+            continue
+        stack.extend(reversed(node))
+
+
 def parse_url_content(url):
-    """解析URL内容"""
+    """解析URL内容（成功结果按 URL 缓存，失败结果不缓存以便下次重试）"""
+    if _url_cache is not None:
+        with _url_cache_lock:
+            cached = _url_cache.get(url)
+        if cached is not None:
+            return dict(cached)
+    
+    result = fetch_url_content(url)
+    if _url_cache is not None and result["status"] == "success":
+        with _url_cache_lock:
+            _url_cache[url] = result
+    return dict(result)
+
+
+def fetch_url_content(url):
+    """抓取并解析URL内容"""
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        response = requests.get(url, headers=headers, timeout=10)
+        response = _HTTP.get(url, timeout=10)
         response.raise_for_status()
         
-        soup = BeautifulSoup(response.content, 'html.parser')
+        # 响应头声明了字符集时按其解码，否则交给 lxml 根据 <meta charset> 自行识别
+        content_type = response.headers.get('Content-Type', '').lower()
+        encoding = response.encoding if 'charset' in content_type else None
+        tree = lxml.html.fromstring(
+            response.content, parser=lxml.html.HTMLParser(encoding=encoding)
+        )
         
         # 提取标题
-        title = soup.find('title')
-        title_text = title.get_text().strip() if title else "无标题"
+        title = tree.find('.//title')
+        title_text = title.text_content().strip() if title is not None else "无标题"
         
         # 提取主要内容
-        content_selectors = [
-            'article', 'main', '.content', '.post-content', 
-            '.entry-content', 'p', 'div'
-        ]
-        
-        content_text = ""
-        for selector in content_selectors:
-            elements = soup.select(selector)
-            if elements:
-                content_text = " ".join([elem.get_text().strip() for elem in elements[:5]])
-                break
+        blocks = []
+        for node in iter_content_blocks(tree):
+            text = node.text_content().strip()
+            if text:
+                blocks.append(text)
+                if len(blocks) == MAX_CONTENT_BLOCKS:
+                    break
+        if not blocks:
+            # 页面没有可识别的正文结构时退回到整个 body 的文本
+            body = tree.find('.//body')
+            if body is not None:
+                blocks.append(body.text_content().strip())
+        content_text = " ".join(blocks)
         
         return {
             "url": url,
@@ -118,6 +268,38 @@ async def chat(request: ChatRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    流式聊天接口（启用记忆系统），以 Server-Sent Events 逐段返回回复
+    """
+    if not request.session_id:
+        request.session_id = str(uuid.uuid4())
+    
+    async def event_stream():
+        yield f"data: {json.dumps({'type': 'start', 'session_id': request.session_id})}\n\n"
+        response_text = ""
+        try:
+            async for chunk in chat_service.chat_stream(request):
+                response_text += chunk
+                yield f"data: {json.dumps({'type': 'token', 'content': chunk}, ensure_ascii=False)}\n\n"
+            yield f"data: {json.dumps({'type': 'complete', 'full_response': response_text}, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            logger.error(f"流式聊天接口错误: {e}")
+            yield f"data: {json.dumps({'type': 'error', 'message': str(e)}, ensure_ascii=False)}\n\n"
+        yield "data: [DONE]\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+
 @router.post("/simple", response_model=ChatResponse)
 async def chat_simple(request: ChatRequest):
     """
@@ -147,18 +329,21 @@ async def get_session_summary(session_id: str):
 
 
 @router.get("/sessions/{session_id}/history")
-async def get_session_history(session_id: str, limit: int = 20):
-    """获取会话历史"""
+async def get_session_history(session_id: str, limit: int = 20, before: Optional[str] = None):
+    """获取会话历史（before 为上一页返回的 next_cursor）"""
     try:
-        history = await chat_service.get_session_history(session_id, limit)
+        history = await chat_service.get_session_history(session_id, limit, before)
         # 如果没有消息，返回空列表而不是404
         # 这样前端可以正常处理空会话的情况
         if not history.get("messages"):
             return {
                 "session_id": session_id,
-                "messages": []
+                "messages": [],
+                "next_cursor": None
             }
         return history
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except HTTPException:
         raise
     except Exception as e:
@@ -167,11 +352,13 @@ async def get_session_history(session_id: str, limit: int = 20):
 
 
 @router.get("/users/{user_id}/sessions")
-async def get_user_sessions(user_id: str, limit: int = 50):
-    """获取用户的所有会话列表"""
+async def get_user_sessions(user_id: str, limit: int = 50, before: Optional[str] = None):
+    """获取用户的所有会话列表（before 为上一页返回的 next_cursor）"""
     try:
-        sessions = await chat_service.get_user_sessions(user_id, limit)
+        sessions = await chat_service.get_user_sessions(user_id, limit, before)
         return sessions
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"获取用户会话列表错误: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -206,6 +393,39 @@ async def delete_sessions_batch(session_ids: List[str]):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/messages/batch-delete")
+async def delete_messages_batch(message_ids: List[int], user_id: str = Query(...)):
+    """
+    批量删除消息（清理用），只删除属于该用户的消息
+    """
+    try:
+        if not message_ids:
+            raise HTTPException(status_code=400, detail="消息ID列表不能为空")
+        if len(message_ids) > MAX_BATCH_DELETE_MESSAGES:
+            raise HTTPException(status_code=400, detail=f"单次最多删除 {MAX_BATCH_DELETE_MESSAGES} 条消息")
+        
+        from backend.database import DatabaseManager
+        
+        with DatabaseManager() as db:
+            result = db.delete_messages(message_ids, user_id)
+        
+        for session_id in result["session_ids"]:
+            chat_service.invalidate_conversation_history(session_id)
+        
+        # 不存在或不属于该用户的消息计为失败
+        deleted = set(result["deleted_messages"])
+        return {
+            "deleted_count": result["deleted_count"],
+            "deleted_messages": result["deleted_messages"],
+            "failed_messages": [message_id for message_id in dict.fromkeys(message_ids) if message_id not in deleted]
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"批量删除消息错误: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.put("/messages/{message_id}")
 async def update_message(message_id: str, request: MessageUpdateRequest):
     """
@@ -242,20 +462,28 @@ async def update_message(message_id: str, request: MessageUpdateRequest):
             message_timestamp = original_message.created_at
             
             # 2. 删除该消息之后的所有消息（包括AI回复）
+            # 命中 (session_id, created_at, id) 复合索引；不同步会话状态，省去加载待删行的步骤，
+            # 与下面的消息更新一起在 update_message 中一次提交
             from backend.database import ChatMessage
             deleted_count = db.db.query(ChatMessage).filter(
                 ChatMessage.session_id == session_id,
                 ChatMessage.created_at > message_timestamp
-            ).delete()
+            ).delete(synchronize_session=False)
             
-            # 3. 更新消息内容
-            updated_message = db.update_message(
+            # 3. 更新消息内容：直接 UPDATE 并与上面的删除一起提交；未更新到消息时整体回滚，
+            # 后续消息不会被删除。提交后 original_message 过期，读取属性时重新加载为更新后的值
+            updated = db.update_message(
                 message_id=message_id_int,
                 user_id=request.user_id,
                 new_content=request.new_content.strip(),
                 emotion=request.emotion,
                 emotion_intensity=request.emotion_intensity
             )
+            if not updated:
+                raise HTTPException(status_code=404, detail="消息不存在或无权修改")
+            updated_message = original_message
+            
+            chat_service.invalidate_conversation_history(session_id)
             
             # 4. 更新向量数据库（删除相关记录）
             try:
@@ -360,21 +588,23 @@ async def delete_message(message_id: str, user_id: str = Query(...)):
             
             logger.info(f"找到用户消息: {message.id}, 内容: {message.content[:50]}...")
             
-            # 检查是否为该会话中最近的一条用户消息
-            latest_user_message = db.db.query(ChatMessage).filter(
+            # 检查是否为该会话中最近的一条用户消息：
+            # 探测该消息之后是否还有同一用户的消息，命中 (session_id, user_id, created_at) 索引即可返回
+            newer_user_message = db.db.query(ChatMessage.id).filter(
                 ChatMessage.session_id == message.session_id,
                 ChatMessage.user_id == user_id,
-                ChatMessage.role == 'user'
-            ).order_by(ChatMessage.created_at.desc()).first()
+                ChatMessage.role == 'user',
+                ChatMessage.created_at > message.created_at
+            ).limit(1).first()
             
-            if not latest_user_message or latest_user_message.id != message.id:
-                logger.warning(f"只能删除最近的一条用户消息: message_id={message_id_int}, latest_id={latest_user_message.id if latest_user_message else None}")
+            if newer_user_message is not None:
+                logger.warning(f"只能删除最近的一条用户消息: message_id={message_id_int}, newer_id={newer_user_message.id}")
                 raise HTTPException(status_code=403, detail="只能撤回最近发送的一条消息")
             
             logger.info(f"验证通过，这是最近的用户消息: {message.id}")
             
-            # 执行删除
-            result = db.delete_message(message_id=message_id_int, user_id=user_id)
+            # 执行删除：复用上面已查询的消息，不再重复查询
+            result = db.delete_message(message_id=message_id_int, user_id=user_id, message=message)
             
             if not result.get("success"):
                 error_msg = result.get("error", "删除消息失败")
@@ -383,6 +613,7 @@ async def delete_message(message_id: str, user_id: str = Query(...)):
             
             deleted_count = result.get("deleted_count", 1)
             deleted_messages = result.get("deleted_messages", [])
+            chat_service.invalidate_conversation_history(message.session_id)
             
             logger.info(f"消息删除成功: message_id={message_id_int}, 删除了 {deleted_count} 条消息")
             return {
@@ -445,64 +676,78 @@ async def chat_with_attachments(
 ):
     """带附件的聊天接口（支持文件上传）"""
     try:
-        # 处理文件附件
-        file_contents = []
+        # 处理URL内容（先于文件落盘校验，格式非法时直接返回 400，而不是静默丢弃）
+        url_contents_list = []
+        if url_contents:
+            try:
+                url_contents_list = orjson.loads(url_contents) if ORJSON_AVAILABLE else json.loads(url_contents)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="url_contents 不是合法的 JSON")
+            if not isinstance(url_contents_list, list) or not all(isinstance(item, dict) for item in url_contents_list):
+                raise HTTPException(status_code=400, detail="url_contents 必须是对象数组")
+        
+        # 处理文件附件：先依次落盘，再并发提取内容
+        saved_files = []
         if files:
+            # 按日期分目录存放（uploads/yyyy/mm/dd），避免单个目录文件数无限增长，也便于按天清理
+            upload_dir = UPLOAD_DIR / datetime.utcnow().strftime("%Y/%m/%d")
+            upload_dir.mkdir(parents=True, exist_ok=True)
+            
             for file in files:
-                if not file.filename or not is_allowed_file(file.filename):
+                file_extension = get_file_extension(file.filename) if file.filename else ""
+                if not is_allowed_extension(file_extension):
                     raise HTTPException(status_code=400, detail=f"不支持的文件类型: {file.filename}")
                 
                 # 保存文件
                 file_id = str(uuid.uuid4())
-                file_extension = Path(file.filename).suffix
-                file_path = UPLOAD_DIR / f"{file_id}{file_extension}"
+                file_path = upload_dir / f"{file_id}{file_extension}"
                 
-                # 读取文件内容并检查大小
-                file_content = await file.read()
-                if len(file_content) > MAX_FILE_SIZE:
+                # 分块流式写盘，边写边检查大小，避免整个文件驻留内存
+                total_size = 0
+                async with aiofiles.open(file_path, "wb") as buffer:
+                    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                        total_size += len(chunk)
+                        if total_size > MAX_FILE_SIZE:
+                            break
+                        await buffer.write(chunk)
+                if total_size > MAX_FILE_SIZE:
+                    file_path.unlink(missing_ok=True)
                     raise HTTPException(status_code=400, detail=f"文件过大: {file.filename}")
                 
-                # 写入文件
-                with open(file_path, "wb") as buffer:
-                    buffer.write(file_content)
-                
-                # 提取文件内容
-                content = ""
-                if file_extension.lower() == '.pdf':
-                    content = extract_text_from_pdf(file_path)
-                elif file_extension.lower() in ['.jpg', '.jpeg', '.png', '.gif']:
-                    content = extract_text_from_image(file_path)
-                elif file_extension.lower() == '.txt':
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                
-                file_contents.append({
-                    "filename": file.filename,
-                    "content": content,
-                    "type": file.content_type
-                })
+                saved_files.append((file, file_path, file_extension))
         
-        # 处理URL内容
-        url_contents_list = []
-        if url_contents:
-            try:
-                url_contents_list = json.loads(url_contents)
-            except json.JSONDecodeError:
-                pass
+        # 提取文件内容（PDF 解析等为阻塞操作，放入线程池并发执行；PDF 走有界线程池）
+        loop = asyncio.get_running_loop()
+        extracted = await asyncio.gather(*[
+            loop.run_in_executor(
+                PDF_EXECUTOR if file_extension == '.pdf' else None,
+                extract_file_content, file_path, file_extension
+            )
+            for _, file_path, file_extension in saved_files
+        ])
+        file_contents = [
+            {
+                "filename": file.filename,
+                "content": content,
+                "type": file.content_type
+            }
+            for (file, _, _), content in zip(saved_files, extracted)
+        ]
         
-        # 构建增强的消息内容
-        enhanced_message = message
+        # 构建增强的消息内容（先收集片段再一次性拼接，避免反复复制已拼好的前缀）
+        parts = [message]
         if file_contents:
-            enhanced_message += "\n\n[附件内容]:\n"
+            parts.append("\n\n[附件内容]:\n")
             for file_content in file_contents:
                 content_preview = file_content['content'][:500] if file_content['content'] else "[空内容]"
-                enhanced_message += f"\n文件: {file_content['filename']}\n内容: {content_preview}...\n"
+                parts.append(f"\n文件: {file_content['filename']}\n内容: {content_preview}...\n")
         
         if url_contents_list:
-            enhanced_message += "\n\n[URL内容]:\n"
+            parts.append("\n\n[URL内容]:\n")
             for url_content in url_contents_list:
                 content_preview = url_content.get('content', '')[:500]
-                enhanced_message += f"\n链接: {url_content['url']}\n标题: {url_content['title']}\n内容: {content_preview}...\n"
+                parts.append(f"\n链接: {url_content['url']}\n标题: {url_content['title']}\n内容: {content_preview}...\n")
+        enhanced_message = "".join(parts)
         
         # 创建聊天请求
         chat_request = ChatRequest(
@@ -530,7 +775,8 @@ async def parse_url(data: dict):
         if not url:
             raise HTTPException(status_code=400, detail="URL参数缺失")
         
-        result = parse_url_content(url)
+        # 抓取与解析均为阻塞操作，放入线程池执行，避免阻塞事件循环
+        result = await asyncio.get_running_loop().run_in_executor(None, parse_url_content, url)
         return result
         
     except HTTPException:
@@ -6,7 +6,7 @@
 
 from typing import Any, Dict, List, Optional, Union
 from datetime import datetime
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, Field
 from enum import Enum
 
 from .common_schemas import BaseResponse, PaginationRequest, PaginationResponse
@@ -46,16 +46,9 @@ class ChatMessage(BaseModel):
     timestamp: datetime = Field(default_factory=datetime.now, description="消息时间")
     metadata: Optional[Dict[str, Any]] = Field(None, description="元数据")
     
-    @validator('content')
-    def validate_content(cls, v):
-        if not v.strip():
-            raise ValueError('消息内容不能为空')
-        return v.strip()
-    
     class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
+        # 先去除首尾空白再做长度校验，纯空白内容由 min_length 拒绝
+        anystr_strip_whitespace = True
 
 
 class ChatRequest(BaseModel):
@@ -69,19 +62,9 @@ class ChatRequest(BaseModel):
     use_rag: bool = Field(True, description="是否使用RAG知识库")
     context: Optional[Dict[str, Any]] = Field(None, description="额外上下文")
     
-    @validator('message')
-    def validate_message(cls, v):
-        if not v.strip():
-            raise ValueError('消息内容不能为空')
-        return v.strip()
-    
-    @validator('user_id')
-    def validate_user_id(cls, v):
-        if not v or len(v.strip()) < 3:
-            raise ValueError('用户ID长度不能少于3个字符')
-        return v.strip()
-    
     class Config:
+        # 先去除首尾空白再做长度校验，纯空白内容由 min_length 拒绝
+        anystr_strip_whitespace = True
         json_schema_extra = {
             "example": {
                 "message": "我最近总是失眠，怎么办？",
@@ -112,9 +95,6 @@ class ChatResponse(BaseResponse):
     context: Optional[Dict[str, Any]] = Field(None, description="上下文信息")
     
     class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
         json_schema_extra = {
             "example": {
                 "success": True,
@@ -148,11 +128,6 @@ class SessionInfo(BaseModel):
     last_activity: Optional[datetime] = Field(None, description="最后活动时间")
     emotion_summary: Optional[Dict[str, Any]] = Field(None, description="情绪摘要")
     metadata: Optional[Dict[str, Any]] = Field(None, description="元数据")
-    
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
 
 
 class UserProfile(BaseModel):
@@ -167,18 +142,13 @@ class UserProfile(BaseModel):
     last_active: Optional[datetime] = Field(None, description="最后活跃时间")
     profile_summary: Optional[str] = Field(None, description="档案摘要")
     metadata: Optional[Dict[str, Any]] = Field(None, description="元数据")
-    
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
 
 
 class SessionHistoryRequest(BaseModel):
     """会话历史请求模型"""
     session_id: str = Field(..., description="会话ID")
     limit: int = Field(20, ge=1, le=100, description="限制数量")
-    offset: int = Field(0, ge=0, description="偏移量")
+    before: Optional[str] = Field(None, description="分页游标，取上一页返回的 next_cursor")
     include_emotions: bool = Field(True, description="是否包含情绪信息")
 
 
@@ -187,6 +157,7 @@ class SessionHistoryResponse(BaseResponse):
     session_id: str = Field(..., description="会话ID")
     messages: List[ChatMessage] = Field(..., description="消息列表")
     total: int = Field(..., description="总消息数")
+    next_cursor: Optional[str] = Field(None, description="下一页游标，为空表示没有更早的消息")
     pagination: Optional[PaginationResponse] = Field(None, description="分页信息")
     
     class Config:
@@ -267,16 +238,8 @@ class SessionSummaryResponse(BaseResponse):
 
 class BatchChatRequest(BaseModel):
     """批量聊天请求模型"""
-    messages: List[ChatRequest] = Field(..., description="聊天请求列表")
+    messages: List[ChatRequest] = Field(..., min_items=1, max_items=10, description="聊天请求列表，1-10条")
     batch_options: Optional[Dict[str, Any]] = Field(None, description="批量处理选项")
-    
-    @validator('messages')
-    def validate_messages(cls, v):
-        if not v:
-            raise ValueError('消息列表不能为空')
-        if len(v) > 10:
-            raise ValueError('批量消息不能超过10条')
-        return v
 
 
 class BatchChatResponse(BaseResponse):
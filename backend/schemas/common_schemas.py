@@ -23,11 +23,6 @@ class BaseResponse(BaseModel):
     message: str = Field(..., description="响应消息")
     timestamp: datetime = Field(default_factory=datetime.now, description="响应时间戳")
     status_code: int = Field(200, description="HTTP状态码")
-    
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
 
 
 class ErrorResponse(BaseResponse):
@@ -108,9 +103,6 @@ class HealthCheckResponse(BaseModel):
     timestamp: datetime = Field(default_factory=datetime.now, description="检查时间")
     
     class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
         json_schema_extra = {
             "example": {
                 "status": "healthy",
@@ -136,11 +128,6 @@ class SystemInfoResponse(BaseModel):
     architecture: str = Field(..., description="系统架构")
     agent_enabled: bool = Field(..., description="Agent模块是否启用")
     timestamp: datetime = Field(default_factory=datetime.now, description="响应时间")
-    
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
 
 
 class StatisticsResponse(BaseModel):
@@ -152,11 +139,6 @@ class StatisticsResponse(BaseModel):
     emotion_distribution: Optional[Dict[str, int]] = Field(None, description="情绪分布")
     time_range: Optional[str] = Field(None, description="统计时间范围")
     timestamp: datetime = Field(default_factory=datetime.now, description="统计时间")
-    
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
 
 
 class FileUploadResponse(BaseModel):
@@ -167,11 +149,6 @@ class FileUploadResponse(BaseModel):
     upload_id: str = Field(..., description="上传ID")
     url: Optional[str] = Field(None, description="文件访问URL")
     timestamp: datetime = Field(default_factory=datetime.now, description="上传时间")
-    
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
 
 
 class SearchRequest(BaseModel):
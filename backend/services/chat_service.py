@@ -4,7 +4,7 @@
 处理所有与聊天相关的业务逻辑
 """
 
-from typing import Dict, Optional, Any, List
+from typing import Dict, Optional, Any, List, AsyncIterator, Tuple
 # 优先使用带插件支持的引擎
 try:
     from backend.modules.llm.core.llm_with_plugins import EmotionalChatEngineWithPlugins
@@ -16,18 +16,32 @@ except ImportError:
 from backend.modules.llm.core.llm_core import SimpleEmotionalChatEngine
 from backend.services.memory_service import MemoryService
 from backend.services.context_service import ContextService
+from backend.services.response_cache import response_cache
 from backend.models import ChatRequest, ChatResponse
-from backend.database import DatabaseManager, ChatSession
+from backend.database import DatabaseManager, encode_page_cursor, decode_page_cursor
+from backend.logging_config import get_logger
+from backend.utils.fingerprint import text_fingerprint
+import asyncio
+import copy
+import functools
+import os
+import threading
 import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+logger = get_logger(__name__)
+
 # 尝试导入RAG服务（可选功能）
 try:
-    from backend.modules.rag.services.rag_service import RAGIntegrationService
+    from backend.modules.rag.services.rag_service import RAGIntegrationService, QueryCache, rag_query_cache
     RAG_AVAILABLE = True
 except ImportError:
     RAG_AVAILABLE = False
     RAGIntegrationService = None
+    QueryCache = None
+    rag_query_cache = None
 
 # 尝试导入意图识别服务（可选功能）
 try:
@@ -45,6 +59,49 @@ except ImportError:
     ENHANCED_PROCESSOR_AVAILABLE = False
     EnhancedInputProcessor = None
 
+@functools.lru_cache(maxsize=2048)
+def _cached_emotion(engine, text: str) -> tuple:
+    """
+    情绪分析结果缓存（分析是消息文本的纯函数，结果冻结为元组以便缓存）
+    
+    结果中嵌套的列表和字典被所有命中共享，取用时须深拷贝（见 _thaw）
+    """
+    return tuple(engine.analyze_emotion(text).items())
+
+
+@functools.lru_cache(maxsize=2048)
+def _cached_intent(service, text: str) -> tuple:
+    """
+    意图识别结果缓存（识别只依赖文本，不参与缓存的告警日志由调用方按请求记录）
+    
+    结果中嵌套的列表和字典被所有命中共享，取用时须深拷贝（见 _thaw）
+    """
+    return tuple(service.classify(text).items())
+
+
+def _thaw(cached: tuple) -> Dict[str, Any]:
+    """把缓存的结果还原为字典；深拷贝，调用方修改结果不会影响缓存和其他请求"""
+    return copy.deepcopy(dict(cached))
+
+
+# 同步 SQLAlchemy 操作放到专用线程池执行，避免阻塞事件循环
+DB_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="chat-db")
+
+# RAG 增强（查询向量化 + 向量检索）在所有请求共享的专用线程池中执行，
+# 不占用事件循环，也不与数据库操作争用线程
+RAG_EXECUTOR = ThreadPoolExecutor(max_workers=os.cpu_count() or 4, thread_name_prefix="chat-rag")
+
+# 对话历史缓存：每个会话保留的最近消息条数，以及最多缓存的会话数
+HISTORY_CACHE_SIZE = 20
+HISTORY_CACHE_SESSIONS = 1000
+
+# 预取的上下文历史最多等待的秒数，超时则以空历史继续，不阻塞 LLM 调用
+PREFETCH_TIMEOUT = 0.8
+
+# 启动预热使用的示例输入
+WARMUP_TEXT = "你好，最近工作压力大，有点焦虑"
+WARMUP_USER_ID = "_warmup_"
+
 
 class ChatService:
     """聊天服务 - 统一的聊天接口"""
@@ -71,13 +128,13 @@ class ChatService:
         if PLUGIN_ENGINE_AVAILABLE:
             try:
                 self.chat_engine = EmotionalChatEngineWithPlugins()
-                print("✓ 使用带插件支持的聊天引擎（支持天气查询等功能）")
+                logger.info("使用带插件支持的聊天引擎（支持天气查询等功能）")
             except Exception as e:
-                print(f"⚠ 插件引擎初始化失败，使用常规引擎: {e}")
+                logger.warning("插件引擎初始化失败，使用常规引擎: %s", e)
                 self.chat_engine = SimpleEmotionalChatEngine()
         else:
             self.chat_engine = SimpleEmotionalChatEngine()
-            print("⚠ 插件引擎不可用，使用常规引擎")
+            logger.warning("插件引擎不可用，使用常规引擎")
         self.memory_service = memory_service or MemoryService()
         self.context_service = context_service or ContextService(memory_service=self.memory_service)
         
@@ -91,12 +148,12 @@ class ChatService:
                     enable_duplicate_check=True  # 启用重复检测
                 )
                 self.enhanced_processor_enabled = True
-                print("✓ 增强版输入处理器已启用")
+                logger.info("增强版输入处理器已启用")
             except Exception as e:
-                print(f"⚠ 增强版输入处理器初始化失败: {e}")
+                logger.error("增强版输入处理器初始化失败: %s", e)
         else:
             if not ENHANCED_PROCESSOR_AVAILABLE:
-                print("⚠ 增强版输入处理器不可用")
+                logger.warning("增强版输入处理器不可用")
         
         # 初始化RAG服务（如果可用且启用）
         self.rag_enabled = False
@@ -107,14 +164,14 @@ class ChatService:
                 # 检查知识库是否可用
                 if self.rag_service.rag_service.is_knowledge_available():
                     self.rag_enabled = True
-                    print("✓ RAG知识库已启用")
+                    logger.info("RAG知识库已启用")
                 else:
-                    print("⚠ RAG服务已加载，但知识库未初始化")
+                    logger.warning("RAG服务已加载，但知识库未初始化")
             except Exception as e:
-                print(f"⚠ RAG服务初始化失败: {e}")
+                logger.error("RAG服务初始化失败: %s", e)
         else:
             if not RAG_AVAILABLE:
-                print("⚠ RAG模块不可用（需要安装相关依赖）")
+                logger.warning("RAG模块不可用（需要安装相关依赖）")
         
         # 初始化意图识别服务（如果可用且启用）
         self.intent_enabled = False
@@ -123,23 +180,66 @@ class ChatService:
             try:
                 self.intent_service = IntentService()
                 self.intent_enabled = True
-                print("✓ 意图识别系统已启用")
+                logger.info("意图识别系统已启用")
             except Exception as e:
-                print(f"⚠ 意图识别服务初始化失败: {e}")
+                logger.error("意图识别服务初始化失败: %s", e)
         else:
             if not INTENT_AVAILABLE:
-                print("⚠ 意图识别模块不可用")
+                logger.warning("意图识别模块不可用")
         
         # 初始化向量数据库（如果可用）
         self.vector_store = None
         try:
             from backend.vector_store import VectorStore
             self.vector_store = VectorStore()
-            print("✓ 向量数据库已初始化")
+            logger.info("向量数据库已初始化")
         except ImportError:
-            print("⚠ 向量数据库模块不可用")
+            logger.warning("向量数据库模块不可用")
         except Exception as e:
-            print(f"⚠ 向量数据库初始化失败: {e}")
+            logger.error("向量数据库初始化失败: %s", e)
+        
+        self._init_runtime()
+        
+        # 后台预热分词词典、意图模型等懒加载资源，不阻塞服务启动
+        threading.Thread(target=self._warm_up, name="chat-warmup", daemon=True).start()
+    
+    def _init_runtime(self) -> None:
+        """初始化请求处理期间使用的运行时状态"""
+        # 进行中的输入预处理：(user_id, 消息指纹) -> Future，同一用户并发的相同消息共享一次计算
+        self._preprocess_inflight: Dict[tuple, asyncio.Future] = {}
+        
+        # 会话最近消息缓存：session_id -> deque（按时间正序），保存消息时追加，修改/删除消息时失效；
+        # 只在事件循环线程中读写
+        self._history_cache: "OrderedDict[str, deque]" = OrderedDict()
+        
+        # 后台持久化任务的强引用，防止任务在完成前被垃圾回收
+        self._background_tasks: set = set()
+        
+        # 按启用的功能组装回复前的处理流水线，请求处理时不再逐项判断开关
+        self._intent_active = bool(self.intent_enabled and self.intent_service)
+        steps = [
+            (self._step_preprocess, self.enhanced_processor_enabled and self.enhanced_processor),
+            (self._step_analyze, True),
+            (self._step_context, True),
+            (self._step_rag, self.rag_enabled and self.rag_service),
+        ]
+        self._pipeline_steps = [step for step, enabled in steps if enabled]
+        logger.debug("ChatService处理流水线: %s", [step.__name__ for step in self._pipeline_steps])
+    
+    def _warm_up(self) -> None:
+        """
+        用一条示例输入走一遍预处理、情绪分析和意图识别，触发各自的懒加载，
+        避免第一位用户承担冷启动耗时；直接调用底层服务，不写入结果缓存
+        """
+        try:
+            if self.enhanced_processor_enabled and self.enhanced_processor:
+                self.enhanced_processor.preprocess(WARMUP_TEXT, WARMUP_USER_ID)
+            self.chat_engine.analyze_emotion(WARMUP_TEXT)
+            if self._intent_active:
+                self.intent_service.analyze(WARMUP_TEXT, WARMUP_USER_ID)
+            logger.debug("ChatService预热完成")
+        except Exception as e:
+            logger.warning("ChatService预热失败（不影响正常服务）: %s", e)
     
     async def chat(
         self,
@@ -162,148 +262,301 @@ class ChatService:
         
         # 如果启用记忆系统
         if use_memory_system:
-            return await self._chat_with_memory(request)
+            # 回合开始即预取对话历史，与预处理、情绪/意图分析重叠执行
+            prefetch = self._start_prefetch(request.session_id)
+            return await self._chat_with_memory(request, prefetch)
         else:
-            # 使用原有引擎（无记忆）
-            return self.chat_engine.chat(request)
+            # 使用原有引擎（无记忆）；引擎调用是同步的，放入线程池避免阻塞事件循环
+            return await asyncio.get_running_loop().run_in_executor(None, self.chat_engine.chat, request)
     
-    async def _chat_with_memory(self, request: ChatRequest) -> ChatResponse:
-        """使用记忆系统的聊天"""
-        user_id = request.user_id or "anonymous"
-        session_id = request.session_id
-        message = request.message
+    async def chat_stream(self, request: ChatRequest) -> AsyncIterator[str]:
+        """
+        流式聊天（启用记忆系统），逐段产出回复文本
         
-        # 0. 增强版输入预处理（第一步）
-        preprocessed = None
-        if self.enhanced_processor_enabled and self.enhanced_processor:
-            try:
-                preprocessed = self.enhanced_processor.preprocess(message, user_id)
-                
-                # 检查是否被阻止
-                if preprocessed["blocked"]:
-                    return ChatResponse(
-                        response=preprocessed.get("friendly_message", "输入无效，请重新输入"),
-                        emotion="neutral",
-                        session_id=session_id,
-                        timestamp=datetime.now(),
-                        context={
-                            "blocked": True,
-                            "reason": preprocessed["warnings"],
-                            "input_validation": "failed"
-                        },
-                        message_id=0
-                    )
-                
-                # 使用清洗后的文本
-                message = preprocessed["cleaned"]
-                
-                # 如果检测到重复且频率过高，可以提供特殊提示
-                if preprocessed["metadata"].get("high_frequency_repeat"):
-                    print(f"⚠️ 用户 {user_id} 高频重复输入: {message[:30]}...")
-                
-            except Exception as e:
-                print(f"输入预处理失败，使用原始消息: {e}")
-                preprocessed = None
+        生成前的步骤与 chat 相同；回复全部产出后保存消息，向量库写入与记忆处理在后台进行
         
-        # 1. 分析情绪（使用清洗后的消息）
-        emotion_result = self.chat_engine.analyze_emotion(message)
-        emotion = emotion_result.get("emotion", "neutral")
-        emotion_intensity = emotion_result.get("intensity", 5.0)
+        Args:
+            request: 聊天请求
+            
+        Yields:
+            回复文本片段
+        """
+        if not request.session_id:
+            request.session_id = str(uuid.uuid4())
+        
+        prefetch = self._start_prefetch(request.session_id)
+        turn = await self._prepare_turn(request, prefetch)
+        if isinstance(turn, ChatResponse):
+            # 输入被预处理拦截
+            yield turn.response
+            return
+        user_id = turn["user_id"]
+        session_id = turn["session_id"]
+        message = turn["message"]
+        emotion = turn["emotion"]
+        emotion_intensity = turn["emotion_intensity"]
+        rag_result = turn["rag_result"]
         
-        # 2. 意图识别（如果启用）
-        intent_result = None
-        if self.intent_enabled and self.intent_service:
+        loop = asyncio.get_running_loop()
+        if rag_result and rag_result.get("use_rag"):
+            response_text = rag_result["answer"]
+            yield response_text
+        else:
+            enhanced_request = ChatRequest(
+                message=message,
+                session_id=session_id,
+                user_id=user_id,
+                context=turn["context"],
+                deep_thinking=request.deep_thinking or False
+            )
+            if not hasattr(self.chat_engine, "stream"):
+                # 引擎不支持流式输出时整段生成，消息由引擎自行保存
+                response = await loop.run_in_executor(None, self.chat_engine.chat, enhanced_request)
+                yield response.response
+                self._record_engine_exchange(session_id, message, response)
+                await self._run_db(self._ensure_session, session_id, user_id)
+                self._spawn_background(self._persist_reply(
+                    session_id, user_id, message, response.response, emotion, emotion_intensity,
+                    store_vector=False
+                ))
+                return
+            
+            # 引擎的同步生成器在线程池中逐段推进，每段生成后立即交给调用方
+            chunks = []
+            iterator = self.chat_engine.stream(enhanced_request)
+            done = object()
+            # 推进与关闭互斥：取消时线程中可能仍有一次 next 在执行，关闭需等它结束
+            iterator_lock = threading.Lock()
+            
+            def advance():
+                with iterator_lock:
+                    return next(iterator, done)
+            
+            def close():
+                with iterator_lock:
+                    iterator.close()
+            
             try:
-                intent_analysis = self.intent_service.analyze(message, user_id)
-                intent_result = intent_analysis.get('intent', {})
-                
-                # 检查是否需要特殊处理（危机情况）
-                if intent_analysis.get('action_required', False):
-                    print(f"⚠️ 检测到用户 {user_id} 的危机情况，意图: {intent_result.get('intent')}")
-                    # 这里可以触发特殊的危机响应流程
-                    
-            except Exception as e:
-                print(f"意图识别失败: {e}")
-                intent_result = None
+                while True:
+                    chunk = await loop.run_in_executor(None, advance)
+                    if chunk is done:
+                        break
+                    chunks.append(chunk)
+                    yield chunk
+            finally:
+                # 客户端断开或生成出错时关闭引擎生成器，释放其流式 HTTP 连接
+                loop.run_in_executor(None, close)
+            response_text = "".join(chunks)
         
-        # 3. 构建上下文（包含记忆）
-        context = await self.context_service.build_context(
-            user_id=user_id,
-            session_id=session_id,
-            current_message=message,
-            emotion=emotion,
-            emotion_intensity=emotion_intensity
-        )
+        # 流结束后保存会话与一问一答
+        try:
+            await self._run_db(
+                self._save_exchange, session_id, user_id, message, response_text, emotion, emotion_intensity
+            )
+            self._append_history(
+                session_id,
+                {"role": "user", "content": message},
+                {"role": "assistant", "content": response_text}
+            )
+        except Exception as e:
+            logger.error("ChatService流式回复保存失败: %s", e)
         
-        # 将意图信息添加到上下文中
-        if intent_result:
-            context['intent'] = intent_result
+        # 向量库写入与记忆处理在后台进行，流可以立即结束
+        self._spawn_background(self._persist_reply(
+            session_id, user_id, message, response_text, emotion, emotion_intensity
+        ))
+    
+    def _start_prefetch(self, session_id: str) -> Dict[str, asyncio.Task]:
+        """
+        启动对话历史预取任务
         
-        # 4. 尝试使用RAG增强回复
-        rag_result = None
-        print(f"ChatService RAG检查: rag_enabled={self.rag_enabled}, rag_service={self.rag_service is not None}")
+        Returns:
+            {"chat_history": 上下文用历史, "conversation_history": RAG 用历史（仅启用 RAG 时）}
+        """
+        prefetch = {
+            "chat_history": asyncio.create_task(self.context_service.get_chat_history(session_id))
+        }
         if self.rag_enabled and self.rag_service:
-            try:
-                print("ChatService尝试使用RAG增强")
-                # 获取对话历史 - 增加历史长度以包含更多上下文
-                conversation_history = await self._get_conversation_history(session_id, limit=15)
-                
-                # 尝试RAG增强
-                rag_result = self.rag_service.enhance_response(
-                    message=message,
-                    emotion=emotion,
-                    conversation_history=conversation_history
+            prefetch["conversation_history"] = asyncio.create_task(
+                self._get_conversation_history(session_id, limit=15)
+            )
+        return prefetch
+    
+    async def _prepare_turn(
+        self,
+        request: ChatRequest,
+        prefetch: Optional[Dict[str, asyncio.Task]] = None
+    ):
+        """
+        生成回复前的准备步骤：依次执行 _init_runtime 中按启用的功能组装好的流水线
+        
+        Returns:
+            输入被拦截时返回拦截提示的 ChatResponse，否则返回本轮对话的中间结果字典
+        """
+        session_id = request.session_id
+        state = {
+            "user_id": request.user_id or "anonymous",
+            "session_id": session_id,
+            "message": request.message,
+            "prefetch": prefetch if prefetch is not None else self._start_prefetch(session_id),
+            "preprocessed": None,
+            "intent_result": None,
+            "conversation_history": None,
+            "rag_result": None
+        }
+        for step in self._pipeline_steps:
+            state = await step(state)
+            if "blocked_response" in state:
+                # 输入被拦截时不再需要预取的历史，取消仍在进行的任务并等待其结束
+                await self._cancel_prefetch(state["prefetch"])
+                return state["blocked_response"]
+        return state
+    
+    @staticmethod
+    async def _cancel_prefetch(prefetch: Dict[str, asyncio.Task]) -> None:
+        """取消预取任务；已完成的任务不受影响"""
+        tasks = list(prefetch.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    
+    async def _step_preprocess(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """0. 增强版输入预处理（第一步）"""
+        message = state["message"]
+        user_id = state["user_id"]
+        try:
+            preprocessed = await self._preprocess(message, user_id)
+            
+            # 检查是否被阻止
+            if preprocessed["blocked"]:
+                state["blocked_response"] = ChatResponse(
+                    response=preprocessed.get("friendly_message", "输入无效，请重新输入"),
+                    emotion="neutral",
+                    session_id=state["session_id"],
+                    timestamp=datetime.now(),
+                    context={
+                        "blocked": True,
+                        "reason": preprocessed["warnings"],
+                        "input_validation": "failed"
+                    },
+                    message_id=0
                 )
-                print(f"ChatService RAG结果: {rag_result}")
-                
-            except Exception as e:
-                print(f"RAG增强失败，使用常规回复: {e}")
-        else:
-            print("ChatService RAG未启用，使用常规引擎")
+                return state
+            
+            # 使用清洗后的文本
+            state["message"] = preprocessed["cleaned"]
+            state["preprocessed"] = preprocessed
+            
+            # 如果检测到重复且频率过高，可以提供特殊提示
+            if preprocessed["metadata"].get("high_frequency_repeat"):
+                logger.warning("用户 %s 高频重复输入: %s...", user_id, state['message'][:30])
+            
+        except Exception as e:
+            logger.warning("输入预处理失败，使用原始消息: %s", e)
+        return state
+    
+    async def _step_analyze(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """1-2. 情绪分析、意图识别和（RAG 用的）对话历史互不依赖，放入线程池并发执行"""
+        message = state["message"]
+        loop = asyncio.get_running_loop()
+        jobs = [loop.run_in_executor(None, self._analyze_emotion, message)]
+        if self._intent_active:
+            jobs.append(loop.run_in_executor(None, self._analyze_intent, message, state["user_id"]))
+        history_task = state["prefetch"].get("conversation_history")
+        if history_task is not None:
+            jobs.append(history_task)
+        results = await asyncio.gather(*jobs)
+        
+        emotion_result = results[0]
+        state["emotion_result"] = emotion_result
+        state["emotion"] = emotion_result.get("emotion", "neutral")
+        state["emotion_intensity"] = emotion_result.get("intensity", 5.0)
+        if history_task is not None:
+            state["conversation_history"] = results[-1]
+        
+        intent_analysis = results[1] if self._intent_active else None
+        if intent_analysis:
+            intent_result = intent_analysis.get('intent', {})
+            state["intent_result"] = intent_result
+            
+            # 检查是否需要特殊处理（危机情况）
+            if intent_analysis.get('action_required', False):
+                logger.warning("检测到用户 %s 的危机情况，意图: %s", state['user_id'], intent_result.get('intent'))
+                # 这里可以触发特殊的危机响应流程
+        return state
+    
+    async def _step_context(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """3. 构建上下文（包含记忆），对话历史使用回合开始时的预取结果"""
+        try:
+            chat_history = await asyncio.wait_for(state["prefetch"]["chat_history"], timeout=PREFETCH_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("ChatService对话历史预取超时(%ss)，以空历史继续: %s", PREFETCH_TIMEOUT, state['session_id'])
+            chat_history = []
+        context = await self.context_service.build_context(
+            user_id=state["user_id"],
+            session_id=state["session_id"],
+            current_message=state["message"],
+            emotion=state["emotion"],
+            emotion_intensity=state["emotion_intensity"],
+            chat_history=chat_history
+        )
+        
+        # 将意图信息添加到上下文中
+        if state["intent_result"]:
+            context['intent'] = state["intent_result"]
+        state["context"] = context
+        return state
+    
+    async def _step_rag(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """4. 尝试使用RAG增强回复（对话历史已在第 1-2 步并发获取）"""
+        try:
+            logger.debug("ChatService尝试使用RAG增强")
+            rag_result = await asyncio.get_running_loop().run_in_executor(
+                RAG_EXECUTOR, self._enhance_with_rag,
+                state["message"], state["emotion"], state["conversation_history"]
+            )
+            logger.debug("ChatService RAG结果: %s", rag_result)
+            state["rag_result"] = rag_result
+        except Exception as e:
+            logger.warning("RAG增强失败，使用常规回复: %s", e)
+        return state
+    
+    async def _chat_with_memory(
+        self,
+        request: ChatRequest,
+        prefetch: Optional[Dict[str, asyncio.Task]] = None
+    ) -> ChatResponse:
+        """使用记忆系统的聊天"""
+        turn = await self._prepare_turn(request, prefetch)
+        if isinstance(turn, ChatResponse):
+            # 输入被预处理拦截
+            return turn
+        user_id = turn["user_id"]
+        session_id = turn["session_id"]
+        message = turn["message"]
+        preprocessed = turn["preprocessed"]
+        emotion = turn["emotion"]
+        emotion_intensity = turn["emotion_intensity"]
+        intent_result = turn["intent_result"]
+        context = turn["context"]
+        rag_result = turn["rag_result"]
         
         # 5. 生成回复
         if rag_result and rag_result.get("use_rag"):
-            # 使用RAG增强的回复
-            # 保存用户消息到数据库以获取message_id
-            user_message = None
-            try:
-                with DatabaseManager() as db:
-                    user_message = db.save_message(
-                        session_id=session_id,
-                        user_id=user_id,
-                        role="user",
-                        content=message,
-                        emotion=emotion,
-                        emotion_intensity=emotion_intensity
-                    )
-            except Exception as e:
-                print(f"ChatService保存用户消息失败: {e}")
-                import traceback
-                traceback.print_exc()
-            
+            # 使用RAG增强的回复（message_id 在 5.1 保存消息后回填）
             response = ChatResponse(
                 response=rag_result["answer"],
                 emotion=emotion,
                 emotion_intensity=emotion_intensity,
                 session_id=session_id,
-                message_id=user_message.id if user_message else 0,
+                message_id=0,
                 timestamp=datetime.now()
             )
             # 添加RAG来源信息和预处理信息
-            response.context = {
-                "memories_count": len(context.get("memories", {}).get("all", [])),
-                "emotion_trend": context.get("emotion_context", {}).get("trend", {}).get("trend"),
-                "has_profile": bool(context.get("user_profile", {}).get("summary")),
-                "used_rag": True,
-                "knowledge_sources": len(rag_result.get("sources", [])),
-                "intent": intent_result.get('intent') if intent_result else None,
-                "intent_confidence": intent_result.get('confidence') if intent_result else None,
-                "input_preprocessed": preprocessed is not None,
-                "input_metadata": preprocessed.get("metadata") if preprocessed else None
-            }
+            response.context = self._response_context(context, intent_result, preprocessed, rag_result)
         else:
             # 使用常规引擎回复
-            print(f"ChatService使用常规引擎: session_id={session_id}, user_id={user_id}")
+            logger.debug("ChatService使用常规引擎: session_id=%s, user_id=%s", session_id, user_id)
             try:
                 # 将构建好的上下文信息传递给LLM引擎
                 enhanced_request = ChatRequest(
@@ -313,10 +566,13 @@ class ChatService:
                     context=context,  # 传递构建好的上下文
                     deep_thinking=request.deep_thinking or False
                 )
-                response = self.chat_engine.chat(enhanced_request)
-                print(f"ChatService常规引擎回复完成: {response.session_id}")
+                # 引擎同步调用 LLM，放入线程池执行，不阻塞事件循环
+                response = await asyncio.get_running_loop().run_in_executor(
+                    None, self.chat_engine.chat, enhanced_request
+                )
+                logger.debug("ChatService常规引擎回复完成: %s", response.session_id)
             except Exception as e:
-                print(f"ChatService常规引擎调用失败: {e}")
+                logger.error("ChatService常规引擎调用失败: %s", e)
                 import traceback
                 traceback.print_exc()
                 # 创建简单的回复
@@ -327,48 +583,41 @@ class ChatService:
                     timestamp=datetime.now(),
                     message_id=0
                 )
-            response.context = {
-                "memories_count": len(context.get("memories", {}).get("all", [])),
-                "emotion_trend": context.get("emotion_context", {}).get("trend", {}).get("trend"),
-                "has_profile": bool(context.get("user_profile", {}).get("summary")),
-                "used_rag": False,
-                "intent": intent_result.get('intent') if intent_result else None,
-                "intent_confidence": intent_result.get('confidence') if intent_result else None,
-                "input_preprocessed": preprocessed is not None,
-                "input_metadata": preprocessed.get("metadata") if preprocessed else None
-            }
+            response.context = self._response_context(context, intent_result, preprocessed)
         
         # 5.1. 保存会话和消息到数据库
-        # RAG分支需要手动保存消息，因为没有调用 llm_with_plugins.py 的 chat 方法
         if rag_result and rag_result.get("use_rag"):
+            # RAG分支没有调用 llm_with_plugins.py 的 chat 方法，需要手动保存；
+            # 会话创建和一问一答两条消息在同一个事务中完成
             try:
-                with DatabaseManager() as db:
-                    # 如果是新会话，创建会话记录
-                    if not request.session_id:
-                        print(f"ChatService创建新会话: {session_id} for user: {user_id}")
-                        db.create_session(session_id, user_id)
-                        print(f"ChatService会话创建完成")
-                    
-                    # RAG分支需要保存AI回复
-                    print(f"ChatService RAG分支：保存AI回复")
-                    ai_message = db.save_message(
-                        session_id=session_id,
-                        user_id=user_id,
-                        role="assistant",
-                        content=response.response,
-                        emotion=emotion
-                    )
-                    print(f"ChatService RAG分支：消息保存完成，AI消息ID: {ai_message.id}")
-                    # 将AI消息ID添加到响应中
-                    response.ai_message_id = ai_message.id
-                    
+                user_message_id, ai_message_id = await self._run_db(
+                    self._save_exchange, session_id, user_id, message, response.response, emotion, emotion_intensity
+                )
+                logger.debug("ChatService RAG分支：消息保存完成，AI消息ID: %s", ai_message_id)
+                self._append_history(
+                    session_id,
+                    {"role": "user", "content": message},
+                    {"role": "assistant", "content": response.response}
+                )
+                response.message_id = user_message_id
+                # 将AI消息ID添加到响应中
+                response.ai_message_id = ai_message_id
             except Exception as e:
-                print(f"ChatService数据库操作失败: {e}")
+                logger.error("ChatService数据库操作失败: %s", e)
                 import traceback
                 traceback.print_exc()
         else:
-            # 非RAG分支，AI消息已经在llm_with_plugins.py中保存，只需要确保ai_message_id被传递
-            print(f"ChatService 非RAG分支：AI消息ID已从llm_with_plugins获取: {response.ai_message_id}")
+            # 非RAG分支，消息已经在 llm_with_plugins.py 中保存；
+            # 引擎只在没有 session_id 时建会话，这里确保会话存在
+            logger.debug("ChatService 非RAG分支：AI消息ID已从llm_with_plugins获取: %s", response.ai_message_id)
+            self._record_engine_exchange(session_id, message, response)
+            try:
+                if await self._run_db(self._ensure_session, session_id, user_id):
+                    logger.debug("ChatService手动会话创建完成: %s for user: %s", session_id, user_id)
+            except Exception as e:
+                logger.error("ChatService手动保存失败: %s", e)
+                import traceback
+                traceback.print_exc()
         
         # 6. 处理并存储记忆
         await self.memory_service.process_and_store_memories(
@@ -380,34 +629,153 @@ class ChatService:
             emotion_intensity=emotion_intensity
         )
         
-        # 7. 确保会话被保存（如果还没有保存）
-        # 注意：消息已经在 llm_with_plugins.py 中保存，这里只确保会话存在
+        return response
+    
+    async def _preprocess(self, message: str, user_id: str) -> Dict[str, Any]:
+        """
+        输入预处理（分词、正则清洗在线程池中执行）
+        
+        同一用户并发提交的相同消息合并为一次预处理，重复检测也只记一次
+        """
+        key = (user_id, text_fingerprint(message))
+        future = self._preprocess_inflight.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().run_in_executor(
+                None, self.enhanced_processor.preprocess, message, user_id
+            )
+            self._preprocess_inflight[key] = future
+            future.add_done_callback(lambda _: self._preprocess_inflight.pop(key, None))
+        # shield: 某个请求被取消时不影响共享同一计算的其他请求
+        return await asyncio.shield(future)
+    
+    @staticmethod
+    def _response_context(context: Dict[str, Any], intent_result: Optional[Dict[str, Any]],
+                          preprocessed: Optional[Dict[str, Any]], rag_result: Optional[Dict[str, Any]] = None,
+                          regenerated: bool = False) -> Dict[str, Any]:
+        """构建回复附带的上下文摘要，rag_result 不为空时附加知识来源信息"""
+        memories_all = (context.get("memories") or {}).get("all") or []
+        emotion_trend = ((context.get("emotion_context") or {}).get("trend") or {}).get("trend")
+        has_profile = bool((context.get("user_profile") or {}).get("summary"))
+        
+        response_context = {
+            "memories_count": len(memories_all),
+            "emotion_trend": emotion_trend,
+            "has_profile": has_profile,
+            "used_rag": rag_result is not None
+        }
+        if rag_result is not None:
+            response_context["knowledge_sources"] = len(rag_result.get("sources", []))
+        response_context.update({
+            "intent": intent_result.get('intent') if intent_result else None,
+            "intent_confidence": intent_result.get('confidence') if intent_result else None,
+            "input_preprocessed": preprocessed is not None,
+            "input_metadata": preprocessed.get("metadata") if preprocessed else None
+        })
+        if regenerated:
+            response_context["regenerated"] = True
+        return response_context
+    
+    def _analyze_intent(self, message: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """
+        意图识别（同步，供线程池调用）
+        
+        Returns:
+            意图分析结果；未启用或识别失败时返回 None
+        """
+        if not (self.intent_enabled and self.intent_service):
+            return None
         try:
-            with DatabaseManager() as db:
-                # 检查会话是否存在
-                existing_session = db.db.query(ChatSession).filter(
-                    ChatSession.session_id == session_id
-                ).first()
-                
-                if not existing_session:
-                    print(f"ChatService手动创建会话: {session_id} for user: {user_id}")
-                    db.create_session(session_id, user_id)
-                    print(f"ChatService手动会话创建完成")
-                    # 消息已经在 llm_with_plugins.py 中保存，这里不再重复保存
-                    print(f"ChatService：消息已在llm引擎中保存，跳过重复保存")
-                else:
-                    print(f"ChatService会话已存在: {session_id}")
-                    
+            result = _thaw(_cached_intent(self.intent_service, message))
+            self.intent_service.report_attention(result, user_id)
+            return result
         except Exception as e:
-            print(f"ChatService手动保存失败: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.error("意图识别失败: %s", e)
+            return None
+    
+    def _enhance_with_rag(
+        self,
+        message: str,
+        emotion: Optional[str],
+        conversation_history: Optional[List[Dict[str, str]]]
+    ) -> Dict[str, Any]:
+        """RAG 增强（同步），重复的问题直接命中结果缓存，不再检索和生成"""
+        if rag_query_cache is None:
+            return self.rag_service.enhance_response(
+                message=message,
+                emotion=emotion,
+                conversation_history=conversation_history
+            )
         
-        return response
+        key = QueryCache.make_key(message, emotion, conversation_history)
+        cached = rag_query_cache.get(key)
+        if cached is not None:
+            logger.debug("RAG结果命中缓存")
+            return cached
+        
+        rag_result = self.rag_service.enhance_response(
+            message=message,
+            emotion=emotion,
+            conversation_history=conversation_history
+        )
+        # 出错的结果不缓存，下次请求重新尝试
+        if "error" not in rag_result:
+            rag_query_cache.set(key, rag_result)
+        return rag_result
+    
+    def _analyze_emotion(self, message: str) -> Dict[str, Any]:
+        """情绪分析（同步，结果按消息文本缓存，重新生成回复时不再重复分析）"""
+        return _thaw(_cached_emotion(self.chat_engine, message))
+    
+    async def _run_db(self, fn, *args):
+        """在数据库线程池中执行同步的数据库操作"""
+        return await asyncio.get_running_loop().run_in_executor(DB_EXECUTOR, fn, *args)
+    
+    @staticmethod
+    def _save_message(
+        session_id: str,
+        user_id: str,
+        role: str,
+        content: str,
+        emotion: Optional[str] = None,
+        emotion_intensity: Optional[float] = None
+    ) -> int:
+        """保存一条消息（同步），返回消息ID"""
+        with DatabaseManager() as db:
+            return db.save_message(
+                session_id=session_id,
+                user_id=user_id,
+                role=role,
+                content=content,
+                emotion=emotion,
+                emotion_intensity=emotion_intensity
+            ).id
+    
+    @staticmethod
+    def _ensure_session(session_id: str, user_id: str) -> bool:
+        """会话不存在时创建（同步），返回是否新建"""
+        with DatabaseManager() as db:
+            return db.ensure_session(session_id, user_id)
+    
+    @staticmethod
+    def _save_exchange(
+        session_id: str,
+        user_id: str,
+        user_content: str,
+        assistant_content: str,
+        emotion: Optional[str] = None,
+        emotion_intensity: Optional[float] = None
+    ) -> tuple:
+        """在一个事务中建会话并保存一问一答（同步），返回 (用户消息ID, 助手消息ID)"""
+        with DatabaseManager() as db:
+            return db.save_exchange(
+                session_id, user_id, user_content, assistant_content, emotion, emotion_intensity
+            )
     
     async def _get_conversation_history(self, session_id: str, limit: int = 15) -> List[Dict[str, str]]:
         """
-        获取最近的对话历史（用于RAG上下文）
+        获取最近的对话历史（用于RAG上下文，按时间倒序）
+        
+        优先读取会话历史缓存；未命中时在线程池中查询数据库并回填缓存
         
         Args:
             session_id: 会话ID
@@ -416,6 +784,48 @@ class ChatService:
         Returns:
             对话历史列表
         """
+        cached = self._history_cache.get(session_id)
+        if cached and limit <= HISTORY_CACHE_SIZE:
+            self._history_cache.move_to_end(session_id)
+            return list(reversed(cached))[:limit]
+        
+        history = await self._run_db(
+            self._load_conversation_history, session_id, max(limit, HISTORY_CACHE_SIZE)
+        )
+        if history:
+            self._history_cache[session_id] = deque(reversed(history), maxlen=HISTORY_CACHE_SIZE)
+            self._history_cache.move_to_end(session_id)
+            if len(self._history_cache) > HISTORY_CACHE_SESSIONS:
+                self._history_cache.popitem(last=False)
+        return history[:limit]
+    
+    def _append_history(self, session_id: str, *messages: Dict[str, str]) -> None:
+        """新消息保存后追加到已缓存的会话历史（未缓存的会话等下次读取时再从数据库加载）"""
+        cached = self._history_cache.get(session_id)
+        if cached is not None:
+            cached.extend(messages)
+    
+    def _record_engine_exchange(self, session_id: str, message: str, response: ChatResponse) -> None:
+        """
+        引擎自行保存消息后同步历史缓存：一问一答都已保存（两个消息ID都有值）时追加；
+        引擎调用失败的兜底回复（message_id 为 0）没有保存，不能进入历史；
+        其他无法确认保存了哪些消息的情况丢弃缓存，下次从数据库重新加载
+        """
+        if response.message_id and response.ai_message_id:
+            self._append_history(
+                session_id,
+                {"role": "user", "content": message},
+                {"role": "assistant", "content": response.response}
+            )
+        else:
+            self.invalidate_conversation_history(session_id)
+    
+    def invalidate_conversation_history(self, session_id: str) -> None:
+        """会话消息被修改或删除后丢弃其历史缓存"""
+        self._history_cache.pop(session_id, None)
+    
+    def _load_conversation_history(self, session_id: str, limit: int) -> List[Dict[str, str]]:
+        """从数据库读取对话历史（同步）"""
         try:
             with DatabaseManager() as db:
                 messages = db.get_session_messages(session_id, limit)
@@ -429,7 +839,7 @@ class ChatService:
                 
                 return history
         except Exception as e:
-            print(f"获取对话历史失败: {e}")
+            logger.error("获取对话历史失败: %s", e)
             return []
     
     async def get_session_summary(self, session_id: str) -> Dict[str, Any]:
@@ -447,7 +857,8 @@ class ChatService:
     async def get_session_history(
         self,
         session_id: str,
-        limit: int = 20
+        limit: int = 20,
+        before: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         获取会话历史
@@ -455,39 +866,19 @@ class ChatService:
         Args:
             session_id: 会话ID
             limit: 限制数量
+            before: 分页游标，取上一页返回的 next_cursor
             
         Returns:
-            会话历史
+            会话历史，next_cursor 为空表示没有更早的消息
+            
+        Raises:
+            ValueError: 分页游标格式非法
         """
+        before_key = decode_page_cursor(before) if before else None
         try:
-            with DatabaseManager() as db:
-                messages = db.get_session_messages(session_id, limit)
-                
-                if not messages:
-                    return {
-                        "session_id": session_id,
-                        "messages": [],
-                        "total": 0
-                    }
-                
-                return {
-                    "session_id": session_id,
-                    "messages": [
-                        {
-                            "id": msg.id,
-                            "user_id": msg.user_id,  # 添加user_id字段
-                            "role": msg.role,
-                            "content": msg.content,
-                            "emotion": msg.emotion,
-                            "emotion_intensity": msg.emotion_intensity,
-                            "timestamp": msg.created_at.isoformat() if msg.created_at else None
-                        }
-                        for msg in messages
-                    ],
-                    "total": len(messages)
-                }
+            return await self._run_db(self._load_session_history, session_id, limit, before_key)
         except Exception as e:
-            print(f"获取会话历史失败: {e}")
+            logger.error("获取会话历史失败: %s", e)
             return {
                 "session_id": session_id,
                 "messages": [],
@@ -495,10 +886,50 @@ class ChatService:
                 "error": str(e)
             }
     
+    @staticmethod
+    def _load_session_history(session_id: str, limit: int, before_key) -> Dict[str, Any]:
+        """读取一页会话历史（同步）"""
+        with DatabaseManager() as db:
+            # 多取一条用于判断是否还有下一页
+            messages = db.get_session_messages(session_id, limit + 1, before_key)
+            
+            if not messages:
+                return {
+                    "session_id": session_id,
+                    "messages": [],
+                    "total": 0,
+                    "next_cursor": None
+                }
+            
+            next_cursor = None
+            if len(messages) > limit:
+                messages = messages[:limit]
+                last = messages[-1]
+                next_cursor = encode_page_cursor(last.created_at, last.id)
+            
+            return {
+                "session_id": session_id,
+                "messages": [
+                    {
+                        "id": msg.id,
+                        "user_id": msg.user_id,  # 添加user_id字段
+                        "role": msg.role,
+                        "content": msg.content,
+                        "emotion": msg.emotion,
+                        "emotion_intensity": msg.emotion_intensity,
+                        "timestamp": msg.created_at.isoformat() if msg.created_at else None
+                    }
+                    for msg in messages
+                ],
+                "total": len(messages),
+                "next_cursor": next_cursor
+            }
+    
     async def get_user_sessions(
         self,
         user_id: str,
-        limit: int = 50
+        limit: int = 50,
+        before: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         获取用户的所有会话
@@ -506,70 +937,77 @@ class ChatService:
         Args:
             user_id: 用户ID
             limit: 限制数量
+            before: 分页游标，取上一页返回的 next_cursor
             
         Returns:
-            会话列表
+            会话列表，next_cursor 为空表示没有更多会话
+            
+        Raises:
+            ValueError: 分页游标格式非法
         """
+        before_key = decode_page_cursor(before) if before else None
         try:
-            with DatabaseManager() as db:
-                from backend.database import ChatMessage
-                
-                sessions = db.get_user_sessions(user_id, limit)
-                
-                session_list = []
-                for session in sessions:
-                    # 检查会话是否有消息
-                    message_count = db.db.query(ChatMessage)\
-                        .filter(ChatMessage.session_id == session.session_id)\
-                        .count()
-                    
-                    # 如果会话没有消息，跳过（不显示在历史列表中）
-                    if message_count == 0:
-                        continue
-                    
-                    # 获取会话的第一条消息作为标题
-                    first_message = db.db.query(ChatMessage)\
-                        .filter(ChatMessage.session_id == session.session_id)\
-                        .filter(ChatMessage.role == 'user')\
-                        .order_by(ChatMessage.created_at.asc())\
-                        .first()
-                    
-                    # 获取会话的最后一条消息作为预览
-                    last_message = db.db.query(ChatMessage)\
-                        .filter(ChatMessage.session_id == session.session_id)\
-                        .order_by(ChatMessage.created_at.desc())\
-                        .first()
-                    
-                    title = first_message.content[:30] + "..." if first_message and len(first_message.content) > 30 else (first_message.content if first_message else "新对话")
-                    
-                    # 生成预览文本（最后一条消息的内容，最多50个字符）
-                    preview = ""
-                    if last_message:
-                        preview = last_message.content[:50] + "..." if len(last_message.content) > 50 else last_message.content
-                    
-                    session_list.append({
-                        "session_id": session.session_id,
-                        "title": title,
-                        "preview": preview,
-                        "message_count": message_count,
-                        "created_at": session.created_at.isoformat() if session.created_at else None,
-                        "updated_at": session.updated_at.isoformat() if session.updated_at else None
-                    })
-                
-                return {
-                    "user_id": user_id,
-                    "sessions": session_list,
-                    "total": len(session_list)
-                }
+            return await self._run_db(self._load_user_sessions, user_id, limit, before_key)
         except Exception as e:
-            print(f"获取用户会话列表失败: {e}")
+            logger.error("获取用户会话列表失败: %s", e)
             return {
                 "user_id": user_id,
                 "sessions": [],
                 "total": 0,
+                "total_capped": 0,
+                "has_more": False,
                 "error": str(e)
             }
     
+    def _load_user_sessions(self, user_id: str, limit: int, before_key) -> Dict[str, Any]:
+        """读取一页用户会话列表（同步）"""
+        with DatabaseManager() as db:
+            # 多取一条用于判断是否还有下一页
+            rows = db.get_user_sessions_with_previews(user_id, limit + 1, before_key)
+            
+            next_cursor = None
+            if len(rows) > limit:
+                rows = rows[:limit]
+                last = rows[-1]
+                next_cursor = encode_page_cursor(last.updated_at, last.id)
+            
+            session_list = [self._session_summary(row) for row in rows]
+            
+            return {
+                "user_id": user_id,
+                "sessions": session_list,
+                "total": len(session_list),
+                "total_capped": db.count_user_sessions(user_id),
+                "has_more": next_cursor is not None,
+                "next_cursor": next_cursor
+            }
+    
+    @staticmethod
+    def _session_summary(row) -> Dict[str, Any]:
+        """
+        将 get_user_sessions_with_previews 的结果行转换为会话列表项
+        
+        行中的内容已在 SQL 中截取为 31/51 个字符，长度超出 30/50 即说明原文被截断
+        """
+        first_content = row.first_user_content
+        last_content = row.last_content
+        
+        title = first_content[:30] + "..." if first_content and len(first_content) > 30 else (first_content if first_content else "新对话")
+        
+        # 生成预览文本（最后一条消息的内容，最多50个字符）
+        preview = ""
+        if last_content:
+            preview = last_content[:50] + "..." if len(last_content) > 50 else last_content
+        
+        return {
+            "session_id": row.session_id,
+            "title": title,
+            "preview": preview,
+            "message_count": row.message_count,
+            "created_at": row.created_at.isoformat() if row.created_at else None,
+            "updated_at": row.updated_at.isoformat() if row.updated_at else None
+        }
+    
     async def delete_session(self, session_id: str) -> bool:
         """
         删除会话
@@ -580,11 +1018,12 @@ class ChatService:
         Returns:
             是否成功
         """
+        self.invalidate_conversation_history(session_id)
+        response_cache.invalidate(session_id)
         try:
-            with DatabaseManager() as db:
-                return db.delete_session(session_id)
+            return await self._run_db(self._delete_sessions, [session_id]) == {session_id}
         except Exception as e:
-            print(f"删除会话失败: {e}")
+            logger.error("删除会话失败: %s", e)
             return False
     
     async def search_user_sessions(
@@ -605,77 +1044,60 @@ class ChatService:
             会话列表
         """
         try:
-            with DatabaseManager() as db:
-                from backend.database import ChatMessage
-                
-                sessions = db.get_user_sessions(user_id, limit * 2)  # 获取更多以便筛选
-                
-                session_list = []
-                keyword_lower = keyword.lower() if keyword else ""
-                
-                for session in sessions:
-                    # 检查会话是否有消息
-                    message_count = db.db.query(ChatMessage)\
-                        .filter(ChatMessage.session_id == session.session_id)\
-                        .count()
-                    
-                    if message_count == 0:
-                        continue
-                    
-                    # 获取会话的第一条消息作为标题
-                    first_message = db.db.query(ChatMessage)\
-                        .filter(ChatMessage.session_id == session.session_id)\
-                        .filter(ChatMessage.role == 'user')\
-                        .order_by(ChatMessage.created_at.asc())\
-                        .first()
-                    
-                    # 获取会话的最后一条消息作为预览
-                    last_message = db.db.query(ChatMessage)\
-                        .filter(ChatMessage.session_id == session.session_id)\
-                        .order_by(ChatMessage.created_at.desc())\
-                        .first()
-                    
-                    title = first_message.content[:30] + "..." if first_message and len(first_message.content) > 30 else (first_message.content if first_message else "新对话")
-                    
-                    # 生成预览文本
-                    preview = ""
-                    if last_message:
-                        preview = last_message.content[:50] + "..." if len(last_message.content) > 50 else last_message.content
+            return await self._run_db(self._search_user_sessions, user_id, keyword, limit)
+        except Exception as e:
+            logger.error("搜索用户会话失败: %s", e)
+            return {
+                "user_id": user_id,
+                "sessions": [],
+                "total": 0,
+                "has_more": False,
+                "keyword": keyword,
+                "error": str(e)
+            }
+    
+    def _search_user_sessions(self, user_id: str, keyword: str, limit: int) -> Dict[str, Any]:
+        """
+        按关键词筛选用户会话（同步）
+        
+        关键词匹配标题和预览，在 Python 中过滤：按页扫描会话，找到 limit + 1 个匹配项
+        （多出的一个用于判断是否还有更多）或扫描完为止。
+        不返回 total_capped：数据库计数无法套用关键词过滤，与实际匹配数不一致
+        """
+        with DatabaseManager() as db:
+            scan_limit = limit * 2  # 每页多取一些，减少扫描次数
+            keyword_lower = keyword.lower() if keyword else ""
+            session_list = []
+            before = None
+            
+            while len(session_list) <= limit:
+                rows = db.get_user_sessions_with_previews(user_id, scan_limit, before)
+                for row in rows:
+                    summary = self._session_summary(row)
                     
                     # 如果有关键词，进行搜索过滤
                     if keyword_lower:
-                        title_lower = title.lower()
-                        preview_lower = preview.lower()
+                        title_lower = summary["title"].lower()
+                        preview_lower = summary["preview"].lower()
                         if keyword_lower not in title_lower and keyword_lower not in preview_lower:
                             continue
                     
-                    session_list.append({
-                        "session_id": session.session_id,
-                        "title": title,
-                        "preview": preview,
-                        "message_count": message_count,
-                        "created_at": session.created_at.isoformat() if session.created_at else None,
-                        "updated_at": session.updated_at.isoformat() if session.updated_at else None
-                    })
-                    
-                    # 限制返回数量
-                    if len(session_list) >= limit:
+                    session_list.append(summary)
+                    if len(session_list) > limit:
                         break
                 
-                return {
-                    "user_id": user_id,
-                    "sessions": session_list,
-                    "total": len(session_list),
-                    "keyword": keyword
-                }
-        except Exception as e:
-            print(f"搜索用户会话失败: {e}")
+                if len(rows) < scan_limit:
+                    break
+                before = (rows[-1].updated_at, rows[-1].id)
+            
+            has_more = len(session_list) > limit
+            session_list = session_list[:limit]
             return {
                 "user_id": user_id,
-                "sessions": [],
-                "total": 0,
-                "keyword": keyword,
-                "error": str(e)
+                "sessions": session_list,
+                "total": len(session_list),
+                "has_more": has_more,
+                "keyword": keyword
             }
     
     async def delete_sessions_batch(self, session_ids: List[str]) -> Dict[str, Any]:
@@ -688,32 +1110,24 @@ class ChatService:
         Returns:
             删除结果
         """
+        for session_id in session_ids:
+            self.invalidate_conversation_history(session_id)
+            response_cache.invalidate(session_id)
         try:
-            success_count = 0
-            failed_count = 0
-            failed_sessions = []
-            
-            for session_id in session_ids:
-                try:
-                    success = await self.delete_session(session_id)
-                    if success:
-                        success_count += 1
-                    else:
-                        failed_count += 1
-                        failed_sessions.append(session_id)
-                except Exception as e:
-                    failed_count += 1
-                    failed_sessions.append(session_id)
-                    print(f"删除会话 {session_id} 失败: {e}")
+            # 所有会话在一个事务里按 IN 列表批量删除，不再逐个会话往返数据库
+            deleted = await self._run_db(self._delete_sessions, session_ids)
+            
+            # 不存在的会话计为失败
+            failed_sessions = [session_id for session_id in session_ids if session_id not in deleted]
             
             return {
-                "success_count": success_count,
-                "failed_count": failed_count,
+                "success_count": len(session_ids) - len(failed_sessions),
+                "failed_count": len(failed_sessions),
                 "failed_sessions": failed_sessions,
                 "total": len(session_ids)
             }
         except Exception as e:
-            print(f"批量删除会话失败: {e}")
+            logger.error("批量删除会话失败: %s", e)
             return {
                 "success_count": 0,
                 "failed_count": len(session_ids),
@@ -722,6 +1136,12 @@ class ChatService:
                 "error": str(e)
             }
     
+    @staticmethod
+    def _delete_sessions(session_ids: List[str]) -> set:
+        """批量删除会话（同步），返回实际删除的会话ID集合"""
+        with DatabaseManager() as db:
+            return db.delete_sessions(session_ids)
+    
     async def get_user_emotion_trends(self, user_id: str, days: int = 7) -> Dict[str, Any]:
         """
         获取用户情绪趋势
@@ -753,93 +1173,26 @@ class ChatService:
         """
         user_id = request.user_id or "anonymous"
         session_id = request.session_id
-        message = request.message
         
-        print(f"[EDIT] 为编辑后的消息生成AI回复: {message[:50]}...")
+        logger.debug("[EDIT] 为编辑后的消息生成AI回复: %s...", request.message[:50])
+        # 编辑会删除该消息之后的记录，缓存的历史已失效；失效后再启动预取
+        self.invalidate_conversation_history(session_id)
         
-        # 0. 增强版输入预处理（如果启用）
-        preprocessed = None
-        if self.enhanced_processor_enabled and self.enhanced_processor:
-            try:
-                preprocessed = self.enhanced_processor.preprocess(message, user_id)
-                
-                # 检查是否被阻止
-                if preprocessed["blocked"]:
-                    return ChatResponse(
-                        response=preprocessed.get("friendly_message", "输入无效，请重新输入"),
-                        emotion="neutral",
-                        session_id=session_id,
-                        timestamp=datetime.now(),
-                        context={
-                            "blocked": True,
-                            "reason": preprocessed["warnings"],
-                            "input_validation": "failed",
-                            "regenerated": True
-                        },
-                        message_id=edited_message.id
-                    )
-                
-                # 使用清洗后的文本
-                message = preprocessed["cleaned"]
-                
-            except Exception as e:
-                print(f"输入预处理失败，使用原始消息: {e}")
-                preprocessed = None
-        
-        # 1. 分析编辑后消息的情绪
-        emotion_result = self.chat_engine.analyze_emotion(message)
-        emotion = emotion_result.get("emotion", "neutral")
-        emotion_intensity = emotion_result.get("intensity", 5.0)
-        
-        # 2. 意图识别（如果启用）
-        intent_result = None
-        if self.intent_enabled and self.intent_service:
-            try:
-                intent_analysis = self.intent_service.analyze(message, user_id)
-                intent_result = intent_analysis.get('intent', {})
-                
-                # 检查是否需要特殊处理（危机情况）
-                if intent_analysis.get('action_required', False):
-                    print(f"⚠️ 检测到用户 {user_id} 的危机情况，意图: {intent_result.get('intent')}")
-                    
-            except Exception as e:
-                print(f"意图识别失败: {e}")
-                intent_result = None
-        
-        # 3. 构建上下文（包含记忆，基于编辑后的消息）
-        context = await self.context_service.build_context(
-            user_id=user_id,
-            session_id=session_id,
-            current_message=message,
-            emotion=emotion,
-            emotion_intensity=emotion_intensity
-        )
-        
-        # 将意图信息添加到上下文中
-        if intent_result:
-            context['intent'] = intent_result
-        
-        # 4. 尝试使用RAG增强回复
-        rag_result = None
-        print(f"[EDIT] RAG检查: rag_enabled={self.rag_enabled}, rag_service={self.rag_service is not None}")
-        if self.rag_enabled and self.rag_service:
-            try:
-                print("[EDIT] 尝试使用RAG增强")
-                # 获取对话历史（现在应该包含编辑后的消息）
-                conversation_history = await self._get_conversation_history(session_id)
-                
-                # 尝试RAG增强
-                rag_result = self.rag_service.enhance_response(
-                    message=message,
-                    emotion=emotion,
-                    conversation_history=conversation_history
-                )
-                print(f"[EDIT] RAG结果: {rag_result}")
-                
-            except Exception as e:
-                print(f"RAG增强失败，使用常规回复: {e}")
-        else:
-            print("[EDIT] RAG未启用，使用常规引擎")
+        # 0-4. 与正常聊天共用同一条准备流水线（预处理、情绪/意图、上下文、RAG）
+        turn = await self._prepare_turn(request)
+        if isinstance(turn, ChatResponse):
+            # 输入被预处理拦截
+            turn.message_id = edited_message.id
+            turn.context["regenerated"] = True
+            return turn
+        message = turn["message"]
+        preprocessed = turn["preprocessed"]
+        emotion_result = turn["emotion_result"]
+        emotion = turn["emotion"]
+        emotion_intensity = turn["emotion_intensity"]
+        intent_result = turn["intent_result"]
+        context = turn["context"]
+        rag_result = turn["rag_result"]
         
         # 5. 生成回复
         if rag_result and rag_result.get("use_rag"):
@@ -853,56 +1206,28 @@ class ChatService:
                 timestamp=datetime.now()
             )
             # 添加RAG来源信息和预处理信息
-            response.context = {
-                "memories_count": len(context.get("memories", {}).get("all", [])),
-                "emotion_trend": context.get("emotion_context", {}).get("trend", {}).get("trend"),
-                "has_profile": bool(context.get("user_profile", {}).get("summary")),
-                "used_rag": True,
-                "knowledge_sources": len(rag_result.get("sources", [])),
-                "intent": intent_result.get('intent') if intent_result else None,
-                "intent_confidence": intent_result.get('confidence') if intent_result else None,
-                "input_preprocessed": preprocessed is not None,
-                "input_metadata": preprocessed.get("metadata") if preprocessed else None,
-                "regenerated": True
-            }
+            response.context = self._response_context(context, intent_result, preprocessed, rag_result, regenerated=True)
         else:
             # 使用常规引擎回复 - 但不调用chat方法（避免重复保存用户消息）
-            print(f"[EDIT] 使用常规引擎生成回复")
+            # 同一会话中以相同内容重新生成时直接复用缓存的回复
+            cache_key = response_cache.make_key(
+                user_id, session_id, message, getattr(self.chat_engine, "model", None), emotion,
+                deep_thinking=bool(request.deep_thinking)
+            )
+            cached = response_cache.get(cache_key)
             try:
-                # 直接调用引擎的内部方法生成回复，不保存消息
-                if hasattr(self.chat_engine, '_generate_response_with_plugins'):
-                    # 如果是带插件的引擎，调用插件方法
-                    response_text = self.chat_engine._generate_response_with_plugins(
-                        user_input=message,
-                        session_id=session_id,
-                        user_id=user_id,
-                        emotion_state={
-                            "emotion": emotion,
-                            "intensity": emotion_intensity
-                        },
-                        plugin_used_ref=[None],
-                        plugin_result_ref=[None],
-                        deep_thinking=request.deep_thinking or False
-                    )
-                elif hasattr(self.chat_engine, '_call_llm_normal'):
-                    # 如果是带插件的引擎但没有插件，使用普通方法
-                    response_text = self.chat_engine._call_llm_normal(
-                        user_input=message,
-                        session_id=session_id,
-                        user_id=user_id,
-                        emotion_state={
-                            "emotion": emotion,
-                            "intensity": emotion_intensity
-                        },
-                        deep_thinking=request.deep_thinking or False
-                    )
+                if cached is not None:
+                    logger.debug("[EDIT] 命中回复缓存")
+                    response_text = cached["answer"]
                 else:
-                    # 使用简单引擎的方法
-                    response_text = self.chat_engine.get_openai_response(
-                        user_input=message,
-                        user_id=user_id,
-                        session_id=session_id
+                    logger.debug("[EDIT] 使用常规引擎生成回复")
+                    # 引擎同步调用 LLM，放入线程池执行，不阻塞事件循环
+                    response_text, cacheable = await asyncio.get_running_loop().run_in_executor(
+                        None, self._generate_edited_reply_text,
+                        request, message, session_id, user_id, emotion, emotion_intensity
                     )
+                    if cacheable:
+                        response_cache.set(cache_key, {"answer": response_text, "emotion": emotion})
                 
                 response = ChatResponse(
                     response=response_text,
@@ -915,7 +1240,7 @@ class ChatService:
                 )
                 
             except Exception as e:
-                print(f"常规引擎调用失败: {e}")
+                logger.error("常规引擎调用失败: %s", e)
                 import traceback
                 traceback.print_exc()
                 response = ChatResponse(
@@ -926,60 +1251,139 @@ class ChatService:
                     message_id=edited_message.id
                 )
             
-            response.context = {
-                "memories_count": len(context.get("memories", {}).get("all", [])),
-                "emotion_trend": context.get("emotion_context", {}).get("trend", {}).get("trend"),
-                "has_profile": bool(context.get("user_profile", {}).get("summary")),
-                "used_rag": False,
-                "intent": intent_result.get('intent') if intent_result else None,
-                "intent_confidence": intent_result.get('confidence') if intent_result else None,
-                "input_preprocessed": preprocessed is not None,
-                "input_metadata": preprocessed.get("metadata") if preprocessed else None,
-                "regenerated": True
-            }
+            response.context = self._response_context(context, intent_result, preprocessed, regenerated=True)
         
-        # 6. 保存AI回复到数据库
+        # 6-8. 向量库写入与记忆处理放到后台并发执行，不阻塞返回；
+        # 数据库保存与之并行，但仍需等待，以便把AI消息ID返回给前端
+        self._spawn_background(self._persist_reply(
+            session_id, user_id, message, response.response, emotion, emotion_intensity
+        ))
         try:
-            with DatabaseManager() as db:
-                ai_message = db.save_message(
-                    session_id=session_id,
-                    user_id=user_id,
-                    role="assistant",
-                    content=response.response,
-                    emotion=emotion
-                )
-                print(f"[EDIT] AI回复已保存到数据库: {ai_message.id}")
+            response.ai_message_id = await self._run_db(
+                self._save_message, session_id, user_id, "assistant", response.response, emotion
+            )
+            logger.debug("[EDIT] AI回复已保存到数据库: %s", response.ai_message_id)
+            # 准备流水线可能已从数据库重新加载了历史（含编辑后的用户消息），追加新回复
+            self._append_history(session_id, {"role": "assistant", "content": response.response})
         except Exception as e:
-            print(f"保存AI回复失败: {e}")
+            logger.error("保存AI回复失败: %s", e)
+            self.invalidate_conversation_history(session_id)
             import traceback
             traceback.print_exc()
         
-        # 7. 保存到向量数据库
-        if self.vector_store:
-            try:
-                self.vector_store.add_conversation(
-                    session_id=session_id,
-                    message=message,
-                    response=response.response,
-                    emotion=emotion
-                )
-                print(f"[EDIT] 对话已保存到向量数据库")
-            except Exception as e:
-                print(f"保存到向量数据库失败: {e}")
-        
-        # 8. 处理并存储记忆
-        try:
-            await self.memory_service.process_and_store_memories(
+        return response
+    
+    def _spawn_background(self, coro) -> asyncio.Task:
+        """在后台运行协程并持有其引用，完成后自动移除"""
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
+    
+    async def _persist_reply(
+        self,
+        session_id: str,
+        user_id: str,
+        message: str,
+        response_text: str,
+        emotion: str,
+        emotion_intensity: float,
+        store_vector: bool = True
+    ) -> None:
+        """并发保存对话到向量数据库并处理记忆，失败只记录日志"""
+        jobs = {
+            "记忆处理": self.memory_service.process_and_store_memories(
                 session_id=session_id,
                 user_id=user_id,
                 user_message=message,
-                bot_response=response.response,
+                bot_response=response_text,
                 emotion=emotion,
                 emotion_intensity=emotion_intensity
             )
-            print(f"[EDIT] 记忆处理完成")
-        except Exception as e:
-            print(f"记忆处理失败: {e}")
+        }
+        if store_vector and self.vector_store:
+            jobs["保存到向量数据库"] = asyncio.to_thread(
+                self.vector_store.add_conversation,
+                session_id=session_id,
+                message=message,
+                response=response_text,
+                emotion=emotion
+            )
+        results = await asyncio.gather(*jobs.values(), return_exceptions=True)
+        for name, result in zip(jobs, results):
+            if isinstance(result, BaseException):
+                logger.error("%s失败: %s", name, result)
+            else:
+                logger.debug("%s完成", name)
+    
+    def _generate_edited_reply_text(
+        self,
+        request: ChatRequest,
+        message: str,
+        session_id: str,
+        user_id: str,
+        emotion: str,
+        emotion_intensity: float
+    ) -> Tuple[str, bool]:
+        """
+        直接调用引擎的内部方法生成回复文本，不保存消息（同步，供线程池调用；
+        begin_reply 与 reply_was_fallback 在同一线程中调用）
         
-        return response
-
+        Returns:
+            (回复文本, 是否可缓存)：引擎使用了备用回复（LLM 调用失败）或调用了插件
+            （天气、新闻、节假日等实时数据）时不可缓存
+        """
+        engine = self.chat_engine
+        if hasattr(engine, 'begin_reply'):
+            engine.begin_reply()
+        plugin_used_ref = [None]
+        response_text = self._call_engine_for_edit(
+            request, message, session_id, user_id, emotion, emotion_intensity, plugin_used_ref
+        )
+        fell_back = engine.reply_was_fallback() if hasattr(engine, 'reply_was_fallback') else False
+        return response_text, not fell_back and plugin_used_ref[0] is None
+    
+    def _call_engine_for_edit(
+        self,
+        request: ChatRequest,
+        message: str,
+        session_id: str,
+        user_id: str,
+        emotion: str,
+        emotion_intensity: float,
+        plugin_used_ref: List
+    ) -> str:
+        """按引擎类型选择生成回复文本的内部方法"""
+        if hasattr(self.chat_engine, '_generate_response_with_plugins'):
+            # 如果是带插件的引擎，调用插件方法
+            return self.chat_engine._generate_response_with_plugins(
+                user_input=message,
+                session_id=session_id,
+                user_id=user_id,
+                emotion_state={
+                    "emotion": emotion,
+                    "intensity": emotion_intensity
+                },
+                plugin_used_ref=plugin_used_ref,
+                plugin_result_ref=[None],
+                deep_thinking=request.deep_thinking or False
+            )
+        elif hasattr(self.chat_engine, '_call_llm_normal'):
+            # 如果是带插件的引擎但没有插件，使用普通方法
+            return self.chat_engine._call_llm_normal(
+                user_input=message,
+                session_id=session_id,
+                user_id=user_id,
+                emotion_state={
+                    "emotion": emotion,
+                    "intensity": emotion_intensity
+                },
+                deep_thinking=request.deep_thinking or False
+            )
+        else:
+            # 使用简单引擎的方法
+            return self.chat_engine.get_openai_response(
+                user_input=message,
+                user_id=user_id,
+                session_id=session_id
+            )
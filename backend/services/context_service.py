@@ -5,6 +5,7 @@
 集成上下文腐烂（Context Rot）解决方案
 """
 
+import asyncio
 from typing import Dict, List, Optional, Any
 from backend.context_assembler import ContextAssembler, UserProfile
 from backend.services.memory_service import MemoryService
@@ -49,7 +50,8 @@ class ContextService:
         current_message: str,
         emotion: Optional[str] = None,
         emotion_intensity: Optional[float] = None,
-        auto_reduce: bool = True
+        auto_reduce: bool = True,
+        chat_history: Optional[List[Dict[str, Any]]] = None
     ) -> Dict[str, Any]:
         """
         构建完整的对话上下文
@@ -61,12 +63,14 @@ class ContextService:
             emotion: 当前情绪
             emotion_intensity: 情绪强度
             auto_reduce: 是否自动缩减上下文（防止腐烂）
+            chat_history: 已预取的对话历史，为 None 时在此查询
             
         Returns:
             完整的上下文数据（可能已缩减）
         """
         # 获取对话历史
-        chat_history = await self._get_chat_history(session_id)
+        if chat_history is None:
+            chat_history = await self.get_chat_history(session_id)
         
         # 组装上下文
         context = self.assembler.assemble_context(
@@ -143,7 +147,13 @@ class ContextService:
         """
         return self.assembler.build_prompt_context(context, system_prompt)
     
-    async def _get_chat_history(self, session_id: str, limit: int = 10) -> List[Dict[str, str]]:
+    async def get_chat_history(self, session_id: str, limit: int = 10) -> List[Dict[str, str]]:
+        """获取对话历史（数据库查询在线程池中执行，可在回合开始时预取）"""
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self._get_chat_history, session_id, limit
+        )
+    
+    def _get_chat_history(self, session_id: str, limit: int = 10) -> List[Dict[str, str]]:
         """获取对话历史"""
         try:
             with DatabaseManager() as db:
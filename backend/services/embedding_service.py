@@ -4,18 +4,47 @@ Embedding服务
 支持多种embedding提供商
 """
 
-import os
-from typing import List, Dict, Any, Optional
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
 from backend.modules.llm.providers.siliconflow_provider import SiliconFlowProvider
+from backend.utils.fingerprint import text_fingerprint
+from config import Config
+
+# 查询向量缓存的最大条目数
+EMBEDDING_CACHE_SIZE = 4096
+
+# 大批量向量化（知识导入、记忆导入）按长度排序后切成小批，并发请求提供商接口
+EMBEDDING_BATCH_SIZE = 64
+EMBEDDING_MAX_CONCURRENCY = 16
+_batch_executor = ThreadPoolExecutor(max_workers=EMBEDDING_MAX_CONCURRENCY, thread_name_prefix="embedding")
+
+# 连接池大小与并发批次数一致，并发请求都能复用长连接
+EMBEDDING_POOL_SIZE = EMBEDDING_MAX_CONCURRENCY
+
+def _create_http_session() -> requests.Session:
+    """创建复用长连接的HTTP会话，每次向量化请求不再重新做 TCP/TLS 握手"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=EMBEDDING_POOL_SIZE, pool_maxsize=EMBEDDING_POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
 
 class EmbeddingService:
     """Embedding服务"""
     
     def __init__(self):
-        self.provider = os.getenv('EMBEDDING_PROVIDER', 'siliconflow')
-        self.model = os.getenv('EMBEDDING_MODEL', 'BAAI/bge-m3')
-        self.api_key = os.getenv('EMBEDDING_API_KEY') or os.getenv('SILICONFLOW_API_KEY')
-        self.base_url = os.getenv('EMBEDDING_BASE_URL', 'https://api.siliconflow.cn/v1')
+        self.provider = Config.EMBEDDING_SERVICE_PROVIDER
+        self.model = Config.EMBEDDING_SERVICE_MODEL
+        self.api_key = Config.EMBEDDING_SERVICE_API_KEY
+        self.base_url = Config.EMBEDDING_SERVICE_BASE_URL
+        
+        # 向量缓存：(模型, 文本指纹) -> 向量元组，单条与批量查询共用，按最近使用淘汰
+        self._cache: "OrderedDict[Tuple[str, bytes], Tuple[float, ...]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
         
         # 初始化提供商
         self._init_provider()
@@ -31,11 +60,13 @@ class EmbeddingService:
             config = {
                 'api_key': self.api_key,
                 'base_url': self.base_url,
-                'model': self.model
+                'model': self.model,
+                'timeout': 30
             }
             
             try:
-                self.embedding_provider = SiliconFlowProvider(config)
+                self._http = _create_http_session()
+                self.embedding_provider = SiliconFlowProvider(config, session=self._http)
                 print(f"✓ Embedding服务初始化成功: {self.provider} - {self.model}")
             except Exception as e:
                 print(f"⚠ Embedding服务初始化失败: {e}")
@@ -48,6 +79,8 @@ class EmbeddingService:
         """
         获取文本的embedding向量
         
+        已缓存的文本直接返回，其余文本合并为一次请求，结果按输入顺序返回
+        
         Args:
             texts: 要获取embedding的文本列表
             
@@ -60,27 +93,113 @@ class EmbeddingService:
         if not texts:
             return []
         
-        try:
-            if hasattr(self.embedding_provider, 'get_embedding'):
-                return self.embedding_provider.get_embedding(texts, self.model)
-            else:
-                raise Exception(f"提供商 {self.provider} 不支持embedding功能")
-        except Exception as e:
-            print(f"获取embedding失败: {e}")
-            raise
+        texts = [text.strip() for text in texts]
+        keys = [self._cache_key(text) for text in texts]
+        vectors: List[Optional[Tuple[float, ...]]] = [self._cache_get(key) for key in keys]
+        
+        # 未命中的文本去重后一次性请求
+        misses: Dict[Tuple[str, bytes], str] = {}
+        for key, text, vector in zip(keys, texts, vectors):
+            if vector is None and key not in misses:
+                misses[key] = text
+        
+        if misses:
+            fetched = self._fetch_batched(list(misses.values()))
+            if len(fetched) != len(misses):
+                raise Exception(f"Embedding返回数量不匹配: 期望 {len(misses)}，实际 {len(fetched)}")
+            fetched_by_key = {}
+            for key, vector in zip(misses, fetched):
+                vector = tuple(vector)
+                self._cache_set(key, vector)
+                fetched_by_key[key] = vector
+            vectors = [
+                vector if vector is not None else fetched_by_key[key]
+                for key, vector in zip(keys, vectors)
+            ]
+        
+        return [list(vector) for vector in vectors]
     
     def get_embedding(self, text: str) -> List[float]:
         """
         获取单个文本的embedding向量
         
+        单条查询直接走 _embed_one 的缓存路径，不经过批量接口的列表拆分与合并；
+        重复查询不再请求接口
+        
         Args:
             text: 要获取embedding的文本
             
         Returns:
             embedding向量
         """
-        embeddings = self.get_embeddings([text])
-        return embeddings[0] if embeddings else []
+        if not self.embedding_provider:
+            raise Exception("Embedding服务不可用")
+        return list(self._embed_one(text.strip()))
+    
+    def _embed_one(self, text: str) -> Tuple[float, ...]:
+        """获取单个（已去除首尾空白的）文本的向量元组，优先读取缓存"""
+        key = self._cache_key(text)
+        vector = self._cache_get(key)
+        if vector is None:
+            embeddings = self._fetch([text])
+            vector = tuple(embeddings[0]) if embeddings else ()
+            if vector:
+                self._cache_set(key, vector)
+        return vector
+    
+    def _fetch_batched(self, texts: List[str]) -> List[List[float]]:
+        """
+        分批获取向量：按文本长度排序后每 EMBEDDING_BATCH_SIZE 条一批，
+        长度相近的文本同批可减少服务端填充，多批时并发请求，结果按输入顺序返回
+        """
+        if len(texts) <= EMBEDDING_BATCH_SIZE:
+            return self._fetch(texts)
+        
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        batches = [order[i:i + EMBEDDING_BATCH_SIZE] for i in range(0, len(order), EMBEDDING_BATCH_SIZE)]
+        results = _batch_executor.map(lambda batch: self._fetch([texts[i] for i in batch]), batches)
+        
+        vectors: List[Optional[List[float]]] = [None] * len(texts)
+        for batch, batch_vectors in zip(batches, results):
+            if len(batch_vectors) != len(batch):
+                raise Exception(f"Embedding返回数量不匹配: 期望 {len(batch)}，实际 {len(batch_vectors)}")
+            for index, vector in zip(batch, batch_vectors):
+                vectors[index] = vector
+        return vectors
+    
+    def _fetch(self, texts: List[str]) -> List[List[float]]:
+        """调用提供商接口获取向量（不经过缓存）"""
+        try:
+            if hasattr(self.embedding_provider, 'get_embedding'):
+                return self.embedding_provider.get_embedding(texts, self.model)
+            else:
+                raise Exception(f"提供商 {self.provider} 不支持embedding功能")
+        except Exception as e:
+            print(f"获取embedding失败: {e}")
+            raise
+    
+    def _cache_key(self, text: str) -> Tuple[str, bytes]:
+        """缓存键：模型 + 文本指纹（调用方已去除首尾空白）"""
+        return self.model, text_fingerprint(text)
+    
+    def _cache_get(self, key: Tuple[str, bytes]) -> Optional[Tuple[float, ...]]:
+        with self._cache_lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self._cache.move_to_end(key)
+            return vector
+    
+    def _cache_set(self, key: Tuple[str, bytes], vector: Tuple[float, ...]) -> None:
+        with self._cache_lock:
+            self._cache[key] = vector
+            self._cache.move_to_end(key)
+            while len(self._cache) > EMBEDDING_CACHE_SIZE:
+                self._cache.popitem(last=False)
+    
+    def clear_cache(self) -> None:
+        """清空向量缓存"""
+        with self._cache_lock:
+            self._cache.clear()
     
     def is_available(self) -> bool:
         """检查embedding服务是否可用"""
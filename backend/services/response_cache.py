@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+回复缓存
+编辑消息后重新生成回复时，相同输入直接复用上一次生成的回复
+"""
+
+from typing import Optional, Tuple
+
+from backend.utils.fingerprint import text_fingerprint
+from backend.utils.ttl_cache import TTLLRUCache
+
+
+class ResponseCache(TTLLRUCache):
+    """
+    LLM 回复的 LRU + TTL 缓存（线程安全）
+    
+    缓存键按会话分组，会话被删除时通过 invalidate() 清除该会话的全部条目；
+    只应缓存模型正常生成的回复，备用回复和基于插件实时数据的回复不应写入
+    """
+    
+    def __init__(self, ttl_seconds: int = 3600, max_size: int = 500):
+        super().__init__(ttl_seconds, max_size)
+    
+    @staticmethod
+    def make_key(
+        user_id: str,
+        session_id: str,
+        message: str,
+        model: Optional[str] = None,
+        emotion: Optional[str] = None,
+        deep_thinking: bool = False
+    ) -> Tuple[str, bytes]:
+        """缓存键：会话ID + (用户、规范化空白后的消息、模型、情绪、是否深度思考) 的指纹"""
+        normalized = " ".join(message.split())
+        mode = "deep" if deep_thinking else "normal"
+        return session_id, text_fingerprint(user_id, normalized, model, emotion, mode)
+    
+    def invalidate(self, session_id: str) -> None:
+        """清除某个会话的全部缓存回复"""
+        self.discard_where(lambda key: key[0] == session_id)
+
+
+# 全局回复缓存
+response_cache = ResponseCache()
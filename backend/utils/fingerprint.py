@@ -0,0 +1,28 @@
+"""
+文本指纹模块
+
+将消息等任意长度的文本压缩为 16 字节的 blake2b 摘要，用作缓存键：
+键的内存占用固定，字典查找时也不必对长文本逐字符比较
+"""
+import hashlib
+
+# 多个字段之间的分隔符，避免 ("ab", "c") 与 ("a", "bc") 得到相同指纹
+_SEPARATOR = b"\x00"
+
+
+def text_fingerprint(*parts: str) -> bytes:
+    """
+    计算一个或多个文本字段的指纹
+    
+    Args:
+        *parts: 参与计算的文本字段，None 视为空字符串
+        
+    Returns:
+        16 字节摘要
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for index, part in enumerate(parts):
+        if index:
+            digest.update(_SEPARATOR)
+        digest.update((part or "").encode("utf-8"))
+    return digest.digest()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+LRU + TTL 缓存
+RAG 结果缓存、回复缓存等共用的线程安全缓存基类
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class TTLLRUCache:
+    """
+    LRU + TTL 缓存（线程安全），值为字典
+    
+    写入和读取时都复制一层字典，调用方修改返回值不会影响缓存内容
+    """
+    
+    def __init__(self, ttl_seconds: float, max_size: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.RLock()
+    
+    def get(self, key: Hashable) -> Optional[Dict[str, Any]]:
+        """读取缓存，过期或不存在时返回 None"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return dict(value)
+    
+    def set(self, key: Hashable, value: Dict[str, Any]) -> None:
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl_seconds, dict(value))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+    
+    def discard_where(self, predicate: Callable[[Hashable], bool]) -> None:
+        """删除键满足条件的全部条目"""
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+    
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
@@ -4,31 +4,139 @@ setup_sqlite3()
 
 import chromadb
 from chromadb.config import Settings
-import uuid
+import asyncio
+import atexit
+import functools
+import threading
+import time
+import weakref
 import os
 import shutil
+import sqlite3
+from datetime import timezone
 from typing import List, Dict, Any, Optional
 from config import Config
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 尝试导入 ONNX Runtime 推理依赖（量化 embedding 模型，可选功能）
+try:
+    import numpy as np
+    import onnxruntime as ort
+    from tokenizers import Tokenizer
+    ONNX_RUNTIME_AVAILABLE = True
+except ImportError:
+    ONNX_RUNTIME_AVAILABLE = False
+
+# 默认embedding函数下查询向量缓存的最大条目数
+QUERY_EMBEDDING_CACHE_SIZE = 256
+
+# 集合的 HNSW 索引参数：M / construction_ef 在新建索引时生效，search_ef 在每次加载索引时生效
+COLLECTION_METADATA = {
+    "hnsw:space": "cosine",
+    "hnsw:M": 32,
+    "hnsw:construction_ef": 200,
+    "hnsw:search_ef": 64
+}
+
+# 对话写入缓冲：攒够条数或超过间隔秒数后一次性写入，摊薄每次 add 的向量化和 HNSW 插入开销
+CONVERSATION_BUFFER_SIZE = 32
+CONVERSATION_FLUSH_INTERVAL = 2.0
+# 批量写入失败时放回缓冲重试的最多次数，超过后丢弃这批对话，避免向量库持续不可用时缓冲无限增长
+CONVERSATION_FLUSH_MAX_RETRIES = 3
+
+# 所有 VectorStore 实例，进程退出或服务关闭时写入各自缓冲中的对话
+_stores: "weakref.WeakSet[VectorStore]" = weakref.WeakSet()
+
+
+def flush_all_conversations() -> None:
+    """写入所有 VectorStore 实例缓冲中的对话"""
+    for store in list(_stores):
+        store.flush_conversations()
+
+
+atexit.register(flush_all_conversations)
+
+
+def _time_ordered_id() -> str:
+    """
+    按时间排序的文档ID：12 位十六进制毫秒时间戳 + 20 位随机十六进制（与 ULID 同样的 48+80 位结构）
+    
+    新写入的ID按字典序递增，批量导入时插入位置集中在索引尾部
+    """
+    return f"{int(time.time() * 1000):012x}{os.urandom(10).hex()}"
+
+def _enable_wal(db_path: str) -> None:
+    """
+    把 ChromaDB 的 SQLite 文件切换为 WAL 日志模式
+    
+    WAL 模式写入时不再每次 add 都重写回滚日志，读写互不阻塞；该模式记录在数据库文件中，
+    之后 ChromaDB 自己打开的连接也会沿用。synchronous、cache_size 等是连接级设置，
+    在这里设置不会作用到 ChromaDB 的连接，因此不做修改
+    """
+    sqlite_file = os.path.join(db_path, "chroma.sqlite3")
+    if not os.path.exists(sqlite_file):
+        return
+    try:
+        conn = sqlite3.connect(sqlite_file, timeout=5)
+        try:
+            mode = conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+            logger.debug(f"ChromaDB SQLite 日志模式: {mode}")
+        finally:
+            conn.close()
+    except Exception as e:
+        logger.warning(f"设置 ChromaDB SQLite WAL 模式失败: {e}")
+
+
 class VectorStore:
+    """
+    对话、知识、情感三个向量集合的封装
+    
+    构造时只记录配置；ChromaDB 客户端、embedding 函数和各集合在首次使用时才创建，
+    不使用向量功能的进程（调试脚本、测试）不必承担打开数据库的开销
+    """
+    
     def __init__(self):
         # 禁用遥测
-        settings = Settings(
+        self.settings = Settings(
             anonymized_telemetry=False,
             allow_reset=True
         )
+        self.db_path = Config.CHROMA_PERSIST_DIRECTORY
         
+        # 对话写入缓冲：(文档, 元数据, ID)
+        self._conv_buffer: List[tuple] = []
+        self._buffer_lock = threading.Lock()
+        self._flush_timer: Optional[threading.Timer] = None
+        self._flush_failures = 0
+        _stores.add(self)
+        
+        # 尝试使用自定义embedding服务
+        self.use_custom_embedding = False
+        try:
+            from backend.services.embedding_service import get_embedding_service
+            self.embedding_service = get_embedding_service()
+            if self.embedding_service.is_available():
+                self.use_custom_embedding = True
+                logger.info(f"✓ 使用自定义embedding服务: {self.embedding_service.get_info()}")
+            else:
+                logger.info("⚠ 自定义embedding服务不可用，使用ChromaDB默认embedding")
+        except Exception as e:
+            logger.warning(f"初始化自定义embedding服务失败: {e}")
+            self.embedding_service = None
+    
+    @functools.cached_property
+    def client(self):
+        """ChromaDB 客户端（首次访问时创建）"""
         # 如果数据库目录存在但架构不匹配，删除并重建
-        db_path = Config.CHROMA_PERSIST_DIRECTORY
+        db_path = self.db_path
         if os.path.exists(db_path):
             try:
                 # 尝试创建客户端，如果失败则删除旧数据库
                 test_client = chromadb.PersistentClient(
                     path=db_path,
-                    settings=settings
+                    settings=self.settings
                 )
                 # 尝试获取集合列表，如果失败说明架构不匹配
                 try:
@@ -43,107 +151,144 @@ class VectorStore:
                     shutil.rmtree(db_path)
                     logger.info(f"已删除旧数据库目录: {db_path}")
         
-        self.client = chromadb.PersistentClient(
+        client = chromadb.PersistentClient(
             path=db_path,
-            settings=settings
+            settings=self.settings
         )
-        
-        # 尝试使用自定义embedding服务
-        self.use_custom_embedding = False
-        try:
-            from backend.services.embedding_service import get_embedding_service
-            self.embedding_service = get_embedding_service()
-            if self.embedding_service.is_available():
-                self.use_custom_embedding = True
-                logger.info(f"✓ 使用自定义embedding服务: {self.embedding_service.get_info()}")
-            else:
-                logger.info("⚠ 自定义embedding服务不可用，使用ChromaDB默认embedding")
-        except Exception as e:
-            logger.warning(f"初始化自定义embedding服务失败: {e}")
-            self.embedding_service = None
-        
-        # 创建embedding函数
+        _enable_wal(db_path)
+        return client
+    
+    @functools.cached_property
+    def embedding_function(self):
+        """集合使用的embedding函数（首次访问时创建）"""
         if self.use_custom_embedding:
             # 使用自定义embedding函数
-            embedding_function = CustomEmbeddingFunction(self.embedding_service)
-        else:
-            # 使用ChromaDB默认embedding函数
-            from chromadb.utils import embedding_functions
-            embedding_function = embedding_functions.DefaultEmbeddingFunction()
-        
-        # 创建集合
+            return CustomEmbeddingFunction(self.embedding_service)
+        if Config.ONNX_EMBEDDING_MODEL_DIR and ONNX_RUNTIME_AVAILABLE:
+            # 使用本地 INT8 量化 ONNX 模型
+            logger.info(f"✓ 使用量化 ONNX embedding模型: {Config.ONNX_EMBEDDING_MODEL_DIR}")
+            return QuantizedONNXEmbeddingFunction(Config.ONNX_EMBEDDING_MODEL_DIR)
+        if Config.ONNX_EMBEDDING_MODEL_DIR:
+            logger.warning("⚠ 未安装 onnxruntime/tokenizers，忽略 ONNX_EMBEDDING_MODEL_DIR，使用ChromaDB默认embedding")
+        # 使用ChromaDB默认embedding函数
+        from chromadb.utils import embedding_functions
+        return embedding_functions.DefaultEmbeddingFunction()
+    
+    @functools.cached_property
+    def _embed_default(self):
+        """默认embedding函数（本地 ONNX 模型）的查询向量缓存"""
+        embedding_function = self.embedding_function
+        return functools.lru_cache(maxsize=QUERY_EMBEDDING_CACHE_SIZE)(
+            lambda query: tuple(embedding_function([query])[0])
+        )
+    
+    @functools.cached_property
+    def conversation_collection(self):
+        return self._get_collection("conversations")
+    
+    @functools.cached_property
+    def knowledge_collection(self):
+        return self._get_collection("knowledge")
+    
+    @functools.cached_property
+    def emotion_collection(self):
+        return self._get_collection("emotions")
+    
+    def _get_collection(self, name: str):
+        """获取或创建集合"""
         try:
-            self.conversation_collection = self.client.get_or_create_collection(
-                name="conversations",
-                embedding_function=embedding_function,
-                metadata={"hnsw:space": "cosine"}
-            )
-            
-            self.knowledge_collection = self.client.get_or_create_collection(
-                name="knowledge",
-                embedding_function=embedding_function,
-                metadata={"hnsw:space": "cosine"}
-            )
-            
-            self.emotion_collection = self.client.get_or_create_collection(
-                name="emotions",
-                embedding_function=embedding_function,
-                metadata={"hnsw:space": "cosine"}
+            return self.client.get_or_create_collection(
+                name=name,
+                embedding_function=self.embedding_function,
+                metadata=COLLECTION_METADATA
             )
         except Exception as e:
             logger.error(f"创建 ChromaDB 集合失败: {e}")
             # 如果仍然失败，尝试重置数据库
-            if os.path.exists(db_path):
-                shutil.rmtree(db_path)
-                logger.info(f"已删除数据库目录，请重新启动服务: {db_path}")
+            if os.path.exists(self.db_path):
+                shutil.rmtree(self.db_path)
+                logger.info(f"已删除数据库目录，请重新启动服务: {self.db_path}")
             raise
-
-
-class CustomEmbeddingFunction:
-    """自定义embedding函数，使用我们的embedding服务"""
     
-    def __init__(self, embedding_service):
-        self.embedding_service = embedding_service
+    def add_conversation(self, session_id: str, message: str, response: str, emotion: str = None):
+        """
+        存储对话记录
+        
+        文档只保存用户消息，向量也只由用户消息计算（检索时匹配的是用户的提问），
+        助手回复和情感作为元数据保存
+        """
+        doc_id = f"{session_id}_{_time_ordered_id()}"
+        metadata = {
+            "session_id": session_id,
+            "response": response,
+            "emotion": emotion or "neutral",
+            "timestamp": int(time.time() * 1000)
+        }
+        
+        # 先放入缓冲，攒够一批后一次写入；未满时由定时器在间隔后写入
+        with self._buffer_lock:
+            self._conv_buffer.append((message, metadata, doc_id))
+            buffer_full = len(self._conv_buffer) >= CONVERSATION_BUFFER_SIZE
+            if not buffer_full:
+                self._start_flush_timer()
+        if buffer_full:
+            self.flush_conversations()
     
-    def __call__(self, input: List[str]) -> List[List[float]]:
+    def _start_flush_timer(self):
+        """启动定时写入（调用方持有 _buffer_lock；已有定时器时不重复启动）"""
+        if self._flush_timer is None:
+            self._flush_timer = threading.Timer(CONVERSATION_FLUSH_INTERVAL, self.flush_conversations)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+    
+    def flush_conversations(self):
         """
-        ChromaDB调用的embedding函数
+        将缓冲中的对话一次性写入向量数据库
         
-        Args:
-            input: 要获取embedding的文本列表
-            
-        Returns:
-            embedding向量列表
+        写入失败时把这批对话放回缓冲头部并重新启动定时器，
+        连续失败超过 CONVERSATION_FLUSH_MAX_RETRIES 次后丢弃
         """
+        with self._buffer_lock:
+            buffered, self._conv_buffer = self._conv_buffer, []
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+        if not buffered:
+            return
+        
+        documents, metadatas, ids = (list(column) for column in zip(*buffered))
         try:
-            return self.embedding_service.get_embeddings(input)
+            self.conversation_collection.add(
+                documents=documents,
+                embeddings=self._embed_many(documents),
+                metadatas=metadatas,
+                ids=ids
+            )
         except Exception as e:
-            logger.error(f"自定义embedding函数调用失败: {e}")
-            # 如果失败，返回零向量作为fallback
-            return [[0.0] * 1024 for _ in input]  # 假设1024维向量
-    
-    def add_conversation(self, session_id: str, message: str, response: str, emotion: str = None):
-        """存储对话记录"""
-        conversation_text = f"用户: {message}\n助手: {response}"
-        if emotion:
-            conversation_text += f"\n情感: {emotion}"
-        
-        doc_id = f"{session_id}_{uuid.uuid4().hex[:8]}"
+            with self._buffer_lock:
+                self._flush_failures += 1
+                if self._flush_failures > CONVERSATION_FLUSH_MAX_RETRIES:
+                    self._flush_failures = 0
+                    logger.error(f"批量写入 {len(ids)} 条对话记录失败，已重试 {CONVERSATION_FLUSH_MAX_RETRIES} 次，丢弃: {e}")
+                    return
+                self._conv_buffer[:0] = buffered
+                self._start_flush_timer()
+            logger.error(f"批量写入 {len(ids)} 条对话记录失败，稍后重试: {e}")
+            return
         
-        self.conversation_collection.add(
-            documents=[conversation_text],
-            metadatas=[{
-                "session_id": session_id,
-                "emotion": emotion or "neutral",
-                "timestamp": str(uuid.uuid4().time_low)
-            }],
-            ids=[doc_id]
-        )
+        with self._buffer_lock:
+            self._flush_failures = 0
     
-    def search_similar_conversations(self, query: str, session_id: str = None, n_results: int = 5):
-        """搜索相似对话"""
+    def search_similar_conversations(
+        self,
+        query: str,
+        session_id: str = None,
+        n_results: int = 5,
+        query_embedding: Optional[List[float]] = None
+    ):
+        """搜索相似对话（可传入已计算的查询向量）"""
         results = self.conversation_collection.query(
-            query_texts=[query],
+            query_embeddings=[query_embedding or self._embed(query)],
             n_results=n_results,
             where={"session_id": session_id} if session_id else None
         )
@@ -151,7 +296,7 @@ class CustomEmbeddingFunction:
     
     def add_knowledge(self, text: str, category: str = "general", metadata: Dict = None):
         """添加知识库内容"""
-        doc_id = uuid.uuid4().hex
+        doc_id = _time_ordered_id()
         self.knowledge_collection.add(
             documents=[text],
             metadatas=[{
@@ -161,11 +306,17 @@ class CustomEmbeddingFunction:
             ids=[doc_id]
         )
     
-    def search_knowledge(self, query: str, category: str = None, n_results: int = 3):
-        """搜索知识库"""
+    def search_knowledge(
+        self,
+        query: str,
+        category: str = None,
+        n_results: int = 3,
+        query_embedding: Optional[List[float]] = None
+    ):
+        """搜索知识库（可传入已计算的查询向量）"""
         where_clause = {"category": category} if category else None
         results = self.knowledge_collection.query(
-            query_texts=[query],
+            query_embeddings=[query_embedding or self._embed(query)],
             n_results=n_results,
             where=where_clause
         )
@@ -173,7 +324,7 @@ class CustomEmbeddingFunction:
     
     def add_emotion_example(self, text: str, emotion: str, intensity: float):
         """添加情感示例"""
-        doc_id = uuid.uuid4().hex
+        doc_id = _time_ordered_id()
         self.emotion_collection.add(
             documents=[text],
             metadatas=[{
@@ -183,18 +334,84 @@ class CustomEmbeddingFunction:
             ids=[doc_id]
         )
     
-    def search_emotion_patterns(self, query: str, emotion: str = None, n_results: int = 3):
-        """搜索情感模式"""
+    def search_emotion_patterns(
+        self,
+        query: str,
+        emotion: str = None,
+        n_results: int = 3,
+        query_embedding: Optional[List[float]] = None
+    ):
+        """搜索情感模式（可传入已计算的查询向量）"""
         where_clause = {"emotion": emotion} if emotion else None
         results = self.emotion_collection.query(
-            query_texts=[query],
+            query_embeddings=[query_embedding or self._embed(query)],
             n_results=n_results,
             where=where_clause
         )
         return results
     
+    def _embed(self, query: str) -> List[float]:
+        """
+        计算查询向量，所有检索都传入预先计算的向量，避免 Chroma 对同一查询重复向量化
+        
+        自定义embedding服务自带缓存；默认embedding函数的结果缓存在 _embed_default 中
+        """
+        if self.use_custom_embedding:
+            return self.embedding_service.get_embedding(query)
+        return list(self._embed_default(query))
+    
+    def _embed_many(self, texts: List[str]) -> List[List[float]]:
+        """
+        批量计算文档向量；刚作为查询检索过的消息可直接命中查询向量缓存
+        """
+        if self.use_custom_embedding:
+            return self.embedding_service.get_embeddings(texts)
+        return [list(self._embed_default(text)) for text in texts]
+    
+    async def search_all(
+        self,
+        query: str,
+        session_id: str = None,
+        category: str = None,
+        emotion: str = None,
+        n_conversations: int = 5,
+        n_knowledge: int = 3,
+        n_emotions: int = 3
+    ) -> Dict[str, Any]:
+        """
+        同时检索对话、知识库和情感模式三个集合
+        
+        查询向量只计算一次，三个集合的检索在线程池中并发执行，
+        总耗时取决于最慢的一次检索而不是三者之和
+        
+        Returns:
+            {"conversations": ..., "knowledge": ..., "emotions": ...}，单个集合检索失败时对应值为 None
+        """
+        query_embedding = await asyncio.to_thread(self._embed, query)
+        searches = {
+            "conversations": (self.search_similar_conversations, session_id, n_conversations),
+            "knowledge": (self.search_knowledge, category, n_knowledge),
+            "emotions": (self.search_emotion_patterns, emotion, n_emotions),
+        }
+        results = await asyncio.gather(
+            *(
+                asyncio.to_thread(search, query, where_value, n_results, query_embedding)
+                for search, where_value, n_results in searches.values()
+            ),
+            return_exceptions=True
+        )
+        
+        combined = {}
+        for name, result in zip(searches, results):
+            if isinstance(result, Exception):
+                logger.error(f"检索集合 {name} 失败: {result}")
+                result = None
+            combined[name] = result
+        return combined
+    
     def get_session_history(self, session_id: str, limit: int = 10):
         """获取会话历史"""
+        self.flush_conversations()
         results = self.conversation_collection.get(
             where={"session_id": session_id},
             limit=limit
@@ -202,34 +419,33 @@ class CustomEmbeddingFunction:
         return results
     
     def delete_conversation_after_timestamp(self, session_id: str, timestamp):
-        """删除指定时间戳之后的对话记录"""
+        """
+        删除指定时间戳之后的对话记录
+        
+        Args:
+            session_id: 会话ID
+            timestamp: 时间点（datetime；不带时区时按 UTC 处理，与数据库 created_at 一致）
+        """
+        # 写入所有实例（不只是本实例）缓冲中的对话，避免其他实例稍后写回已删除的对话
+        flush_all_conversations()
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        cutoff_ms = int(timestamp.timestamp() * 1000)
         try:
-            # 获取该会话的所有记录
-            results = self.conversation_collection.get(
-                where={"session_id": session_id}
+            # 在 ChromaDB 端按会话和毫秒时间戳过滤，一次调用完成删除
+            self.conversation_collection.delete(
+                where={"$and": [
+                    {"session_id": session_id},
+                    {"timestamp": {"$gt": cutoff_ms}}
+                ]}
             )
-            
-            if not results['ids']:
-                return
-            
-            # 找出需要删除的记录ID
-            ids_to_delete = []
-            for i, metadata in enumerate(results['metadatas']):
-                # 比较时间戳（这里需要根据你的时间戳格式调整）
-                record_timestamp = metadata.get('timestamp')
-                if record_timestamp and record_timestamp > timestamp.isoformat():
-                    ids_to_delete.append(results['ids'][i])
-            
-            # 删除记录
-            if ids_to_delete:
-                self.conversation_collection.delete(ids=ids_to_delete)
-                logger.info(f"删除了 {len(ids_to_delete)} 条向量记录")
-                
+            logger.info(f"已删除会话 {session_id} 在 {timestamp.isoformat()} 之后的向量记录")
         except Exception as e:
             logger.error(f"删除向量记录失败: {e}")
     
     def delete_conversation_by_session(self, session_id: str):
         """删除整个会话的对话记录"""
+        flush_all_conversations()
         try:
             # 获取该会话的所有记录
             results = self.conversation_collection.get(
@@ -242,3 +458,79 @@ class CustomEmbeddingFunction:
                 
         except Exception as e:
             logger.error(f"删除会话向量记录失败: {e}")
+
+
+class CustomEmbeddingFunction:
+    """自定义embedding函数，使用我们的embedding服务"""
+    
+    def __init__(self, embedding_service):
+        self.embedding_service = embedding_service
+    
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        """
+        ChromaDB调用的embedding函数
+        
+        Args:
+            input: 要获取embedding的文本列表
+            
+        Returns:
+            embedding向量列表
+        """
+        try:
+            if len(input) == 1:
+                # 单条文本走带缓存的单条查询路径
+                return [self.embedding_service.get_embedding(input[0])]
+            return self.embedding_service.get_embeddings(input)
+        except Exception as e:
+            logger.error(f"自定义embedding函数调用失败: {e}")
+            # 如果失败，返回零向量作为fallback
+            return [[0.0] * 1024 for _ in input]  # 假设1024维向量
+
+
+class QuantizedONNXEmbeddingFunction:
+    """
+    本地 INT8 量化 ONNX embedding 函数
+    
+    模型目录需包含 model.onnx（量化后的句向量模型）和 tokenizer.json；
+    每批文本只填充到批内最长长度，一次推理后做带掩码的平均池化并归一化
+    """
+    
+    MAX_LENGTH = 256
+    BATCH_SIZE = 32
+    
+    def __init__(self, model_dir: str):
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, "model.onnx"),
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        # 沿用 tokenizer.json 中的截断/填充配置，未配置时按批内最长文本填充
+        if self.tokenizer.truncation is None:
+            self.tokenizer.enable_truncation(max_length=self.MAX_LENGTH)
+        if self.tokenizer.padding is None:
+            self.tokenizer.enable_padding()
+    
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        embeddings = []
+        for start in range(0, len(input), self.BATCH_SIZE):
+            embeddings.extend(self._embed_batch(input[start:start + self.BATCH_SIZE]))
+        return embeddings
+    
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        encoded = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encoded], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encoded], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+        
+        last_hidden_state = self.session.run(None, feeds)[0]
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (last_hidden_state * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.astype(np.float32).tolist()
@@ -48,6 +48,14 @@ class Config:
     EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
     EMBEDDING_API_KEY = os.getenv("EMBEDDING_API_KEY") or LLM_API_KEY
     EMBEDDING_BASE_URL = os.getenv("EMBEDDING_BASE_URL") or LLM_BASE_URL
+    # 对话向量库使用的embedding服务（EmbeddingService），读取同名环境变量，默认SiliconFlow
+    EMBEDDING_SERVICE_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "siliconflow")
+    EMBEDDING_SERVICE_MODEL = os.getenv("EMBEDDING_MODEL", "BAAI/bge-m3")
+    EMBEDDING_SERVICE_API_KEY = os.getenv("EMBEDDING_API_KEY") or os.getenv("SILICONFLOW_API_KEY")
+    EMBEDDING_SERVICE_BASE_URL = os.getenv("EMBEDDING_BASE_URL", "https://api.siliconflow.cn/v1")
+    # 本地 INT8 量化 ONNX embedding 模型目录（含 model.onnx 和 tokenizer.json），
+    # 未配置自定义 embedding 服务时替代 ChromaDB 默认模型
+    ONNX_EMBEDDING_MODEL_DIR = os.getenv("ONNX_EMBEDDING_MODEL_DIR")
     
     # 服务器配置
     HOST = os.getenv("HOST", "0.0.0.0")
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+调试脚本公共组件
+
+统一设置导入路径，并提供复用长连接的 HTTP 会话、响应 JSON 解析，
+以及预先构建的消息查询语句和流式读取、计数等数据库辅助函数
+"""
+import sys
+import os
+
+import requests
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# 添加项目根目录到Python路径
+project_root = os.path.dirname(os.path.abspath(__file__))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from backend.database import DatabaseManager, ChatMessage
+from sqlalchemy import select, func, bindparam, literal_column
+
+# 调试脚本访问的后端地址
+API_BASE_URL = os.getenv("DEBUG_API_BASE_URL", "http://localhost:8000")
+
+# 所有脚本的请求复用同一个会话的长连接，避免每次调用重新建立 TCP 连接
+HTTP = requests.Session()
+
+# 打印用的消息列：用 Core select 直接取行，不构造 ORM 对象
+MESSAGE_COLUMNS = (
+    ChatMessage.id,
+    ChatMessage.role,
+    ChatMessage.user_id,
+    ChatMessage.created_at,
+    ChatMessage.content
+)
+
+# 会话内全部消息（按时间升序），模块加载时构建一次，执行时只绑定 session_id
+STMT_SESSION_MESSAGES = select(*MESSAGE_COLUMNS).where(
+    ChatMessage.session_id == bindparam("session_id")
+).order_by(ChatMessage.created_at.asc())
+
+
+class LineBuffer:
+    """
+    诊断输出缓冲：逐行编码追加到字节缓冲，满 flush_size 字节或退出上下文时
+    一次写入 stdout，替代逐行 print 的多次加锁、编码和写调用
+    """
+
+    def __init__(self, flush_size=64 * 1024):
+        self.flush_size = flush_size
+        self.encoding = sys.stdout.encoding or "utf-8"
+        self._buffer = bytearray()
+
+    def add(self, text=""):
+        self._buffer += text.encode(self.encoding, errors="replace")
+        self._buffer += b"\n"
+        if len(self._buffer) >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        # 先清空文本层缓冲，保证与之前 print 的输出顺序一致
+        sys.stdout.flush()
+        sys.stdout.buffer.write(self._buffer)
+        sys.stdout.buffer.flush()
+        self._buffer.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.flush()
+
+
+def json_response(response):
+    """解析响应 JSON，orjson 可用时直接解析原始字节"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(response.content)
+    return response.json()
+
+
+def dump_json(data):
+    """缩进格式化输出 JSON，保留中文字符"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2).decode()
+    import json
+    return json.dumps(data, indent=2, ensure_ascii=False)
+
+
+def fetch_session_messages(db, session_id):
+    """获取会话内全部消息行"""
+    return db.db.execute(STMT_SESSION_MESSAGES, {"session_id": session_id}).all()
+
+
+def count_messages(db, *conditions):
+    """统计满足条件的消息数"""
+    return db.db.scalar(select(func.count()).select_from(ChatMessage).where(*conditions))
+
+
+def seconds_since(db, column, moment):
+    """
+    列值与给定时间点相差的秒数，按数据库方言在 SQL 中计算
+
+    PostgreSQL 用 EXTRACT(EPOCH ...)，MySQL 用 TIMESTAMPDIFF，SQLite 用 julianday 差值
+    """
+    dialect = db.db.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return func.extract('epoch', column - moment)
+    if dialect == 'mysql':
+        return func.timestampdiff(literal_column('MICROSECOND'), moment, column) / 1000000.0
+    return (func.julianday(column) - func.julianday(moment)) * 86400.0
+
+
+def stream_rows(db, stmt, params=None, batch_size=200):
+    """以服务端游标分批流式读取查询结果行"""
+    return db.db.execute(stmt.execution_options(stream_results=True), params or {}).yield_per(batch_size)
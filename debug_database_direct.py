@@ -2,16 +2,13 @@
 """
 直接查询数据库调试删除问题
 """
-import sys
-import os
 import time
 
-# 添加项目根目录到Python路径
-project_root = os.path.dirname(os.path.abspath(__file__))
-sys.path.insert(0, project_root)
-
-from backend.database import DatabaseManager, ChatMessage
-from sqlalchemy import text
+from debug_common import (
+    DatabaseManager, ChatMessage, STMT_SESSION_MESSAGES,
+    LineBuffer, count_messages, seconds_since, stream_rows
+)
+from sqlalchemy import select
 
 def debug_database_direct():
     """直接查询数据库调试删除问题"""
@@ -39,9 +36,6 @@ def debug_database_direct():
             )
             print(f"✅ 用户消息已插入: ID={user_message.id}, 时间={user_message.created_at}")
             
-            # 稍微延迟一下，确保时间戳不同
-            time.sleep(0.1)
-            
             # 插入AI回复
             ai_message = db.save_message(
                 session_id=session_id,
@@ -53,18 +47,20 @@ def debug_database_direct():
             
             # 2. 查询所有消息
             print(f"\n2. 查询会话中的所有消息...")
-            all_messages = db.db.query(ChatMessage).filter(
-                ChatMessage.session_id == session_id
-            ).order_by(ChatMessage.created_at.asc()).all()
+            # 先用 COUNT 取总数，再分批流式遍历行，长会话也不会一次加载全部消息
+            total_count = count_messages(db, ChatMessage.session_id == session_id)
             
-            print(f"会话中共有 {len(all_messages)} 条消息:")
-            for i, msg in enumerate(all_messages):
-                print(f"  {i+1}. ID: {msg.id}")
-                print(f"     角色: {msg.role}")
-                print(f"     用户ID: {msg.user_id}")
-                print(f"     时间: {msg.created_at}")
-                print(f"     内容: {msg.content}")
-                print()
+            print(f"会话中共有 {total_count} 条消息:")
+            rows = stream_rows(db, STMT_SESSION_MESSAGES, {"session_id": session_id})
+            # 行是流式读取的，输出累积在字节缓冲中，满 64KB 或本步结束时一次写出
+            with LineBuffer() as out:
+                for i, msg in enumerate(rows):
+                    out.add(f"  {i+1}. ID: {msg.id}")
+                    out.add(f"     角色: {msg.role}")
+                    out.add(f"     用户ID: {msg.user_id}")
+                    out.add(f"     时间: {msg.created_at}")
+                    out.add(f"     内容: {msg.content}")
+                    out.add()
             
             # 3. 测试删除逻辑
             print(f"3. 测试删除逻辑...")
@@ -75,38 +71,37 @@ def debug_database_direct():
             
             # 查找AI回复
             print(f"查找用户消息 {user_message.id} 之后的AI回复...")
-            ai_responses = db.db.query(ChatMessage).filter(
-                ChatMessage.session_id == user_message.session_id,
-                ChatMessage.role == 'assistant',
-                ChatMessage.created_at > user_message.created_at
-            ).order_by(ChatMessage.created_at.asc()).all()
+            # 与 delete_message 使用同一条预构建语句，只取第一条
+            first_ai = db.get_reply_to(user_message)
             
-            print(f"找到 {len(ai_responses)} 条AI回复:")
-            for ai_resp in ai_responses:
-                print(f"  - AI消息 ID: {ai_resp.id}, 时间: {ai_resp.created_at}")
-                time_diff = (ai_resp.created_at - user_message.created_at).total_seconds()
+            if first_ai:
+                print(f"  - AI消息 ID: {first_ai.id}, 时间: {first_ai.created_at}")
+                time_diff = (first_ai.created_at - user_message.created_at).total_seconds()
                 print(f"    时间差: {time_diff}秒")
-                
-            if ai_responses:
-                first_ai = ai_responses[0]
                 messages_to_delete.append(first_ai)
                 print(f"✅ 将删除AI回复: {first_ai.id}")
             else:
                 print("❌ 未找到AI回复")
                 
-                # 检查所有AI消息
-                all_ai = db.db.query(ChatMessage).filter(
-                    ChatMessage.session_id == session_id,
-                    ChatMessage.role == 'assistant'
-                ).all()
+                # 检查所有AI消息：时间差和先后比较在 SQL 中算好，随行一起返回；
+                # 边遍历边计数，一次查询完成列出和统计
+                ai_rows = select(
+                    ChatMessage.id,
+                    ChatMessage.created_at,
+                    seconds_since(db, ChatMessage.created_at, user_message.created_at).label('diff'),
+                    (ChatMessage.created_at > user_message.created_at).label('is_after')
+                ).where(ChatMessage.session_id == session_id, ChatMessage.role == 'assistant')
                 
-                print(f"会话中所有AI消息 ({len(all_ai)} 条):")
-                for ai_msg in all_ai:
-                    time_diff = (ai_msg.created_at - user_message.created_at).total_seconds()
-                    print(f"  - ID: {ai_msg.id}, 时间差: {time_diff}秒")
-                    print(f"    用户消息时间: {user_message.created_at}")
-                    print(f"    AI消息时间: {ai_msg.created_at}")
-                    print(f"    时间比较: {ai_msg.created_at} > {user_message.created_at} = {ai_msg.created_at > user_message.created_at}")
+                ai_count = 0
+                with LineBuffer() as out:
+                    out.add("会话中所有AI消息:")
+                    for ai_msg in stream_rows(db, ai_rows):
+                        ai_count += 1
+                        out.add(f"  - ID: {ai_msg.id}, 时间差: {ai_msg.diff}秒")
+                        out.add(f"    用户消息时间: {user_message.created_at}")
+                        out.add(f"    AI消息时间: {ai_msg.created_at}")
+                        out.add(f"    时间比较: {ai_msg.created_at} > {user_message.created_at} = {bool(ai_msg.is_after)}")
+                    out.add(f"共 {ai_count} 条")
             
             # 4. 执行实际删除
             print(f"\n4. 执行实际删除...")
@@ -121,19 +116,20 @@ def debug_database_direct():
             
             # 5. 验证删除结果
             print(f"\n5. 验证删除结果...")
-            remaining_messages = db.db.query(ChatMessage).filter(
-                ChatMessage.session_id == session_id
-            ).all()
-            
-            print(f"删除后剩余 {len(remaining_messages)} 条消息:")
-            for msg in remaining_messages:
-                print(f"  - ID: {msg.id}, 角色: {msg.role}, 内容: {msg.content[:30]}...")
+            # 剩余消息边遍历边计数，一次查询完成列出和统计
+            remaining_count = 0
+            with LineBuffer() as out:
+                out.add("删除后剩余消息:")
+                for msg in stream_rows(db, STMT_SESSION_MESSAGES, {"session_id": session_id}):
+                    remaining_count += 1
+                    out.add(f"  - ID: {msg.id}, 角色: {msg.role}, 内容: {msg.content[:30]}...")
+                out.add(f"共 {remaining_count} 条")
             
-            if len(remaining_messages) == 0:
+            if remaining_count == 0:
                 print("✅ 所有消息都被删除了")
-            elif len(remaining_messages) == len(all_messages) - 2:
+            elif remaining_count == total_count - 2:
                 print("✅ 用户消息和AI回复都被删除了")
-            elif len(remaining_messages) == len(all_messages) - 1:
+            elif remaining_count == total_count - 1:
                 print("⚠️ 只删除了1条消息，可能是AI回复未被删除")
             else:
                 print(f"❓ 意外的删除结果")
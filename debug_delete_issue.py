@@ -2,22 +2,13 @@
 """
 调试删除功能问题
 """
-import requests
-import json
 import time
-import sys
-import os
 
-# 添加项目根目录到Python路径
-project_root = os.path.dirname(os.path.abspath(__file__))
-sys.path.insert(0, project_root)
-
-from backend.database import DatabaseManager, ChatMessage
+from debug_common import API_BASE_URL, DatabaseManager, ChatMessage, HTTP, LineBuffer, json_response, fetch_session_messages
+from sqlalchemy import select
 
 def debug_delete_issue():
     """调试删除功能问题"""
-    base_url = "http://localhost:8000"
-    
     print("🔍 调试删除功能问题")
     print("-" * 50)
     
@@ -26,16 +17,18 @@ def debug_delete_issue():
     user_id = "debug_user"
     
     try:
+        # 两条消息必须依次发送：并发发送时同一会话里两问两答会交错写入，
+        # 第二条用户消息之后的第一条AI回复可能是第一条消息的回复，复现的就不再是撤回场景
         # 1. 发送第一条消息
         print("1. 发送第一条消息...")
-        response = requests.post(f"{base_url}/chat", json={
+        response = HTTP.post(f"{API_BASE_URL}/chat", json={
             "message": "第一条测试消息",
             "user_id": user_id,
             "session_id": session_id
         })
         
         if response.status_code == 200:
-            result = response.json()
+            result = json_response(response)
             first_message_id = result.get('message_id')
             print(f"✅ 第一条消息发送成功，ID: {first_message_id}")
         else:
@@ -44,99 +37,102 @@ def debug_delete_issue():
         
         # 2. 发送第二条消息
         print("\n2. 发送第二条消息...")
-        response = requests.post(f"{base_url}/chat", json={
+        response = HTTP.post(f"{API_BASE_URL}/chat", json={
             "message": "第二条测试消息",
             "user_id": user_id,
             "session_id": session_id
         })
         
         if response.status_code == 200:
-            result = response.json()
+            result = json_response(response)
             second_message_id = result.get('message_id')
             print(f"✅ 第二条消息发送成功，ID: {second_message_id}")
         else:
             print(f"❌ 第二条消息发送失败: {response.status_code}")
             return
         
-        # 3. 直接查询数据库检查消息结构
-        print(f"\n3. 检查数据库中的消息结构...")
+        # 3-6 复用同一个数据库会话；只读检查期间提交不使对象过期，打印字段时不会重新查询
         with DatabaseManager() as db:
-            messages = db.db.query(ChatMessage).filter(
-                ChatMessage.session_id == session_id
-            ).order_by(ChatMessage.created_at.asc()).all()
+            db.db.expire_on_commit = False
+            
+            # 3. 直接查询数据库检查消息结构
+            print(f"\n3. 检查数据库中的消息结构...")
+            # 只打印列值，用 Core select 取行，不构造 ORM 对象
+            messages = fetch_session_messages(db, session_id)
             
-            print(f"数据库中共有 {len(messages)} 条消息:")
-            for i, msg in enumerate(messages):
-                print(f"  {i+1}. ID: {msg.id}, 角色: {msg.role}, 时间: {msg.created_at}")
-                print(f"     内容: {msg.content[:50]}...")
-                print(f"     用户ID: {msg.user_id}")
-                print()
+            # 每个步骤的输出先累积到字节缓冲，最后一次写出
+            with LineBuffer() as out:
+                out.add(f"数据库中共有 {len(messages)} 条消息:")
+                for i, msg in enumerate(messages):
+                    out.add(f"  {i+1}. ID: {msg.id}, 角色: {msg.role}, 时间: {msg.created_at}")
+                    out.add(f"     内容: {msg.content[:50]}...")
+                    out.add(f"     用户ID: {msg.user_id}")
+                    out.add()
         
-        # 4. 模拟删除逻辑，查看AI回复查找过程
-        print(f"4. 模拟删除第二条用户消息的逻辑...")
-        with DatabaseManager() as db:
+            # 4. 模拟删除逻辑，查看AI回复查找过程
+            print(f"4. 模拟删除第二条用户消息的逻辑...")
             # 获取第二条用户消息
             user_message = db.get_message(second_message_id, user_id)
             if user_message:
                 print(f"找到用户消息: ID={user_message.id}, 时间={user_message.created_at}")
                 
-                # 查找AI回复
-                ai_responses = db.db.query(ChatMessage).filter(
-                    ChatMessage.session_id == user_message.session_id,
-                    ChatMessage.role == 'assistant',
-                    ChatMessage.created_at > user_message.created_at
-                ).order_by(ChatMessage.created_at.asc()).all()
-                
-                print(f"找到 {len(ai_responses)} 条AI回复:")
-                for ai_msg in ai_responses:
-                    print(f"  - AI消息 ID: {ai_msg.id}, 时间: {ai_msg.created_at}")
-                    print(f"    内容: {ai_msg.content[:50]}...")
-                    print(f"    用户ID: {ai_msg.user_id}")
+                # 查找AI回复：与 delete_message 使用同一条预构建语句，只取第一条
+                first_ai = db.get_reply_to(user_message)
                 
-                if ai_responses:
-                    first_ai = ai_responses[0]
+                if first_ai:
+                    print(f"  - AI消息 ID: {first_ai.id}, 时间: {first_ai.created_at}")
+                    print(f"    内容: {first_ai.content[:50]}...")
+                    print(f"    用户ID: {first_ai.user_id}")
                     print(f"\n将删除的AI回复: ID={first_ai.id}")
                 else:
                     print("\n❌ 没有找到AI回复！")
                     
                     # 检查是否有任何AI消息
-                    all_ai_messages = db.db.query(ChatMessage).filter(
-                        ChatMessage.session_id == user_message.session_id,
-                        ChatMessage.role == 'assistant'
+                    # 先后比较在 SQL 中算好，随行一起返回
+                    all_ai_messages = db.db.execute(
+                        select(
+                            ChatMessage.id,
+                            ChatMessage.created_at,
+                            (ChatMessage.created_at > user_message.created_at).label('is_after')
+                        ).where(
+                            ChatMessage.session_id == user_message.session_id,
+                            ChatMessage.role == 'assistant'
+                        )
                     ).all()
                     
-                    print(f"会话中总共有 {len(all_ai_messages)} 条AI消息:")
-                    for ai_msg in all_ai_messages:
-                        print(f"  - AI消息 ID: {ai_msg.id}, 时间: {ai_msg.created_at}")
-                        print(f"    与用户消息时间比较: {ai_msg.created_at} > {user_message.created_at} = {ai_msg.created_at > user_message.created_at}")
-        
-        # 5. 实际执行删除
-        print(f"\n5. 实际执行删除...")
-        response = requests.delete(
-            f"{base_url}/chat/messages/{second_message_id}",
-            params={"user_id": user_id}
-        )
+                    with LineBuffer() as out:
+                        out.add(f"会话中总共有 {len(all_ai_messages)} 条AI消息:")
+                        for ai_msg in all_ai_messages:
+                            out.add(f"  - AI消息 ID: {ai_msg.id}, 时间: {ai_msg.created_at}")
+                            out.add(f"    与用户消息时间比较: {ai_msg.created_at} > {user_message.created_at} = {bool(ai_msg.is_after)}")
         
-        if response.status_code == 200:
-            result = response.json()
-            print(f"✅ 删除成功")
-            print(f"   删除数量: {result.get('deleted_count')}")
-            print(f"   删除ID: {result.get('deleted_messages')}")
-        else:
-            print(f"❌ 删除失败: {response.status_code}")
-            print(f"   错误: {response.json().get('detail', response.text)}")
-        
-        # 6. 检查删除后的数据库状态
-        print(f"\n6. 检查删除后的数据库状态...")
-        with DatabaseManager() as db:
-            remaining_messages = db.db.query(ChatMessage).filter(
-                ChatMessage.session_id == session_id
-            ).order_by(ChatMessage.created_at.asc()).all()
+            # 5. 实际执行删除
+            print(f"\n5. 实际执行删除...")
+            response = HTTP.delete(
+                f"{API_BASE_URL}/chat/messages/{second_message_id}",
+                params={"user_id": user_id}
+            )
+            
+            if response.status_code == 200:
+                result = json_response(response)
+                print(f"✅ 删除成功")
+                print(f"   删除数量: {result.get('deleted_count')}")
+                print(f"   删除ID: {result.get('deleted_messages')}")
+            else:
+                print(f"❌ 删除失败: {response.status_code}")
+                print(f"   错误: {json_response(response).get('detail', response.text)}")
+            
+            # 6. 检查删除后的数据库状态
+            print(f"\n6. 检查删除后的数据库状态...")
+            # 结束之前的只读事务，新事务才能看到服务端刚做的删除
+            db.db.commit()
+            remaining_messages = fetch_session_messages(db, session_id)
             
-            print(f"删除后剩余 {len(remaining_messages)} 条消息:")
-            for i, msg in enumerate(remaining_messages):
-                print(f"  {i+1}. ID: {msg.id}, 角色: {msg.role}, 时间: {msg.created_at}")
-                print(f"     内容: {msg.content[:50]}...")
+            with LineBuffer() as out:
+                out.add(f"删除后剩余 {len(remaining_messages)} 条消息:")
+                for i, msg in enumerate(remaining_messages):
+                    out.add(f"  {i+1}. ID: {msg.id}, 角色: {msg.role}, 时间: {msg.created_at}")
+                    out.add(f"     内容: {msg.content[:50]}...")
         
     except Exception as e:
         print(f"❌ 调试过程异常: {e}")
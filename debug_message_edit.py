@@ -3,10 +3,8 @@
 调试消息编辑功能
 """
 
-import requests
-import json
+from debug_common import API_BASE_URL, HTTP, json_response, dump_json
 
-API_BASE_URL = "http://localhost:8000"
 TEST_USER_ID = "debug_user"
 
 def debug_message_edit():
@@ -20,14 +18,14 @@ def debug_message_edit():
         "session_id": None
     }
     
-    response = requests.post(f"{API_BASE_URL}/chat", json=chat_data)
+    response = HTTP.post(f"{API_BASE_URL}/chat", json=chat_data)
     print(f"发送消息状态码: {response.status_code}")
     
     if response.status_code != 200:
         print(f"❌ 发送消息失败: {response.text}")
         return
     
-    result = response.json()
+    result = json_response(response)
     session_id = result["session_id"]
     api_message_id = result["message_id"]
     
@@ -37,23 +35,22 @@ def debug_message_edit():
     
     # 2. 获取会话历史，查看实际的数据库ID
     print("\n2. 获取会话历史...")
-    history_response = requests.get(f"{API_BASE_URL}/chat/sessions/{session_id}/history")
+    history_response = HTTP.get(f"{API_BASE_URL}/chat/sessions/{session_id}/history")
     print(f"获取历史状态码: {history_response.status_code}")
     
     if history_response.status_code != 200:
         print(f"❌ 获取历史失败: {history_response.text}")
         return
     
-    history = history_response.json()
+    history = json_response(history_response)
     print(f"✓ 历史获取成功，消息数量: {len(history['messages'])}")
     
-    # 找到用户消息
-    user_messages = [msg for msg in history["messages"] if msg["role"] == "user"]
-    if not user_messages:
+    # 找到第一条用户消息
+    user_message = next((msg for msg in history["messages"] if msg["role"] == "user"), None)
+    if user_message is None:
         print("❌ 没有找到用户消息")
         return
     
-    user_message = user_messages[0]
     db_message_id = user_message["id"]
     message_user_id = user_message.get("user_id", "未知")
     
@@ -61,7 +58,7 @@ def debug_message_edit():
     print(f"  数据库Message ID: {db_message_id}")
     print(f"  消息User ID: {message_user_id}")
     print(f"  消息内容: {user_message['content']}")
-    print(f"  完整消息对象: {json.dumps(user_message, indent=2, ensure_ascii=False)}")
+    print(f"  完整消息对象: {dump_json(user_message)}")
     
     # 3. 尝试使用API返回的ID编辑消息
     print(f"\n3. 使用API返回的ID ({api_message_id}) 编辑消息...")
@@ -70,7 +67,7 @@ def debug_message_edit():
         "new_content": "使用API ID编辑的内容"
     }
     
-    response = requests.put(f"{API_BASE_URL}/chat/messages/{api_message_id}", json=edit_data)
+    response = HTTP.put(f"{API_BASE_URL}/chat/messages/{api_message_id}", json=edit_data)
     print(f"编辑状态码: {response.status_code}")
     print(f"编辑响应: {response.text}")
     
@@ -81,7 +78,7 @@ def debug_message_edit():
         "new_content": "使用数据库ID编辑的内容"
     }
     
-    response = requests.put(f"{API_BASE_URL}/chat/messages/{db_message_id}", json=edit_data)
+    response = HTTP.put(f"{API_BASE_URL}/chat/messages/{db_message_id}", json=edit_data)
     print(f"编辑状态码: {response.status_code}")
     print(f"编辑响应: {response.text}")
     
@@ -90,12 +87,12 @@ def debug_message_edit():
         
         # 5. 验证编辑结果
         print("\n5. 验证编辑结果...")
-        history_response = requests.get(f"{API_BASE_URL}/chat/sessions/{session_id}/history")
+        history_response = HTTP.get(f"{API_BASE_URL}/chat/sessions/{session_id}/history")
         if history_response.status_code == 200:
-            history = history_response.json()
-            user_messages = [msg for msg in history["messages"] if msg["role"] == "user"]
-            if user_messages:
-                updated_content = user_messages[0]["content"]
+            history = json_response(history_response)
+            updated_message = next((msg for msg in history["messages"] if msg["role"] == "user"), None)
+            if updated_message:
+                updated_content = updated_message["content"]
                 print(f"✓ 消息已更新为: {updated_content}")
             else:
                 print("❌ 找不到更新后的消息")
@@ -111,7 +108,7 @@ def debug_message_edit():
         "new_content": "恶意编辑尝试"
     }
     
-    response = requests.put(f"{API_BASE_URL}/chat/messages/{db_message_id}", json=edit_data)
+    response = HTTP.put(f"{API_BASE_URL}/chat/messages/{db_message_id}", json=edit_data)
     print(f"权限测试状态码: {response.status_code}")
     print(f"权限测试响应: {response.text}")
     
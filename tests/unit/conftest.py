@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+单元测试公共夹具
+"""
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import backend.database as database
+
+
+@pytest.fixture
+def session_factory(monkeypatch):
+    """
+    内存 SQLite 数据库的会话工厂，已建好全部表
+
+    同时替换 backend.database.SessionLocal，测试中直接构造的 DatabaseManager 也使用该数据库
+    """
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    database.Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    monkeypatch.setattr(database, "SessionLocal", factory)
+    yield factory
+    engine.dispose()
+
+
+@pytest.fixture
+def db(session_factory):
+    """绑定测试数据库的 DatabaseManager"""
+    with database.DatabaseManager() as manager:
+        yield manager
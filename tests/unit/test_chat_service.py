@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+测试 ChatService 的会话历史缓存
+"""
+
+import asyncio
+from collections import OrderedDict
+from datetime import datetime
+
+from backend.database import ChatMessage
+from backend.models import ChatRequest
+from backend.services.chat_service import ChatService
+
+
+class StubEngine:
+    """只提供简单引擎接口的聊天引擎"""
+    
+    def get_openai_response(self, user_input, user_id, session_id):
+        return f"回复：{user_input}"
+
+
+def make_service():
+    """不经过 __init__ 构造 ChatService，只设置编辑重新生成回复用到的属性"""
+    service = ChatService.__new__(ChatService)
+    service.chat_engine = StubEngine()
+    service._history_cache = OrderedDict()
+    service._background_tasks = set()
+    
+    async def prepare_turn(request, prefetch=None):
+        # 与启用 RAG 时的预取一致：准备流水线中读取（并缓存）会话历史
+        await service._get_conversation_history(request.session_id)
+        return {
+            "message": request.message,
+            "preprocessed": None,
+            "emotion_result": {"suggestions": []},
+            "emotion": "neutral",
+            "emotion_intensity": 0.0,
+            "intent_result": None,
+            "context": {},
+            "rag_result": None
+        }
+    
+    async def persist_reply(*args, **kwargs):
+        pass
+    
+    service._prepare_turn = prepare_turn
+    service._persist_reply = persist_reply
+    return service
+
+
+def test_edited_reply_is_appended_to_cached_history(db):
+    """编辑消息重新生成回复后，缓存的历史包含新回复，与数据库一致"""
+    session_id = "edit-history-session"
+    edited = ChatMessage(
+        session_id=session_id, user_id="alice", role="user", content="编辑后",
+        created_at=datetime(2024, 1, 1, 8, 0, 0)
+    )
+    db.db.add(edited)
+    db.db.commit()
+    service = make_service()
+    request = ChatRequest(message="编辑后", user_id="alice", session_id=session_id)
+
+    response = asyncio.run(service._generate_ai_response_for_edited_message(request, edited))
+
+    assert response.ai_message_id
+    assert session_id in service._history_cache
+    cached = asyncio.run(service._get_conversation_history(session_id))
+    assert cached == [
+        {"role": "assistant", "content": "回复：编辑后"},
+        {"role": "user", "content": "编辑后"}
+    ]
+    assert cached == service._load_conversation_history(session_id, 15)
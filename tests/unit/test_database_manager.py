@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+测试 DatabaseManager 的批量删除与键集分页
+"""
+
+from datetime import datetime, timedelta
+
+from backend.database import (
+    ChatMessage, ChatSession, EmotionAnalysis, UserFeedback, ResponseEvaluation, decode_page_cursor
+)
+
+BASE_TIME = datetime(2024, 1, 1, 8, 0, 0)
+
+
+def add_message(db, session_id, user_id, role, content, minutes):
+    """写入一条指定时间的消息，返回其ID"""
+    message = ChatMessage(
+        session_id=session_id,
+        user_id=user_id,
+        role=role,
+        content=content,
+        created_at=BASE_TIME + timedelta(minutes=minutes)
+    )
+    db.db.add(message)
+    db.db.flush()
+    return message.id
+
+
+def add_related(db, session_id, user_id, message_id):
+    """为消息写入情感分析、反馈、评估各一条"""
+    db.db.add_all([
+        EmotionAnalysis(session_id=session_id, user_id=user_id, message_id=message_id),
+        UserFeedback(session_id=session_id, user_id=user_id, message_id=message_id),
+        ResponseEvaluation(session_id=session_id, user_id=user_id, message_id=message_id),
+    ])
+
+
+def add_session(db, session_id, user_id, minutes, messages=()):
+    """写入一个会话及其用户消息"""
+    updated_at = BASE_TIME + timedelta(minutes=minutes)
+    db.db.add(ChatSession(session_id=session_id, user_id=user_id, created_at=updated_at, updated_at=updated_at))
+    for content in messages:
+        add_message(db, session_id, user_id, "user", content, minutes)
+
+
+def count(db, model, *conditions):
+    return db.db.query(model).filter(*conditions).count()
+
+
+def test_delete_messages_removes_owned_messages_and_related_rows(db):
+    own_1 = add_message(db, "s1", "alice", "user", "一", 0)
+    own_2 = add_message(db, "s2", "alice", "user", "二", 1)
+    other = add_message(db, "s1", "bob", "user", "三", 2)
+    for message_id in (own_1, own_2, other):
+        add_related(db, "s1", "x", message_id)
+    db.db.commit()
+
+    result = db.delete_messages([own_1, own_2, other, own_1, 999], "alice")
+
+    assert result["deleted_count"] == 2
+    assert sorted(result["deleted_messages"]) == sorted([own_1, own_2])
+    assert result["session_ids"] == {"s1", "s2"}
+    assert count(db, ChatMessage) == 1
+    for model in (EmotionAnalysis, UserFeedback, ResponseEvaluation):
+        assert count(db, model, model.message_id.in_([own_1, own_2])) == 0
+        assert count(db, model, model.message_id == other) == 1
+
+
+def test_delete_messages_with_no_owned_ids(db):
+    other = add_message(db, "s1", "bob", "user", "三", 0)
+    db.db.commit()
+
+    assert db.delete_messages([], "alice")["deleted_count"] == 0
+    result = db.delete_messages([other], "alice")
+    assert result == {"deleted_count": 0, "deleted_messages": [], "session_ids": set()}
+    assert count(db, ChatMessage) == 1
+
+
+def test_get_session_messages_keyset_pagination(db):
+    """按 (created_at, id) 倒序翻页，同一时间戳的消息按ID区分且不重复、不遗漏"""
+    ids = [add_message(db, "s1", "alice", "user", str(i), i // 2) for i in range(7)]
+    add_message(db, "s2", "alice", "user", "其他会话", 10)
+    db.db.commit()
+
+    first = db.get_session_messages("s1", limit=3)
+    last = first[-1]
+    second = db.get_session_messages("s1", limit=3, before=(last.created_at, last.id))
+    last = second[-1]
+    third = db.get_session_messages("s1", limit=3, before=(last.created_at, last.id))
+
+    paged = [m.id for m in first + second + third]
+    assert paged == sorted(ids, reverse=True)
+    assert len(third) == 1
+
+
+def test_update_message_direct_update(db):
+    message_id = add_message(db, "s1", "alice", "user", "原内容", 0)
+    db.db.commit()
+
+    assert db.update_message(message_id, "alice", "  新内容 ", emotion="happy") == 1
+    message = db.get_message(message_id)
+    assert message.content == "新内容"
+    assert message.emotion == "happy"
+
+
+def test_update_message_rolls_back_when_not_found(db):
+    """未更新到消息（不存在或不属于该用户）时回滚同一事务中的其他修改"""
+    message_id = add_message(db, "s1", "alice", "user", "原内容", 0)
+    later_id = add_message(db, "s1", "alice", "assistant", "回复", 1)
+    db.db.commit()
+
+    db.db.query(ChatMessage).filter(ChatMessage.id == later_id).delete(synchronize_session=False)
+    assert db.update_message(message_id, "bob", "新内容") == 0
+
+    assert db.get_message(later_id) is not None
+    assert db.get_message(message_id).content == "原内容"
+
+
+def test_page_cursor_matches_last_message(db):
+    """_load_session_history 的游标指向本页最后一条消息"""
+    from backend.services.chat_service import ChatService
+
+    for i in range(5):
+        add_message(db, "s1", "alice", "user", str(i), i)
+    db.db.commit()
+
+    page = ChatService._load_session_history("s1", 2, None)
+    assert [m["content"] for m in page["messages"]] == ["4", "3"]
+    assert decode_page_cursor(page["next_cursor"])[1] == page["messages"][-1]["id"]
+
+    rest = ChatService._load_session_history("s1", 5, decode_page_cursor(page["next_cursor"]))
+    assert [m["content"] for m in rest["messages"]] == ["2", "1", "0"]
+    assert rest["next_cursor"] is None
+
+
+def test_count_user_sessions_skips_empty_sessions(db):
+    """计数与会话列表一致，不包含没有消息的会话"""
+    add_session(db, "s1", "alice", 0, ["你好"])
+    add_session(db, "s2", "alice", 1)
+    add_session(db, "s3", "bob", 2, ["你好"])
+    db.db.commit()
+
+    assert db.count_user_sessions("alice") == 1
+    assert len(db.get_user_sessions_with_previews("alice")) == 1
+
+
+def test_search_user_sessions_has_more_only_when_more_matches(db):
+    """只有限制之外还有匹配的会话时 has_more 才为真，匹配项可以跨多页扫描"""
+    from backend.services.chat_service import ChatService
+
+    service = ChatService.__new__(ChatService)
+    for i in range(10):
+        add_session(db, f"other{i}", "alice", 100 + i, ["无关"])
+    add_session(db, "match1", "alice", 1, ["天气不错"])
+    add_session(db, "match2", "alice", 2, ["今天天气"])
+    db.db.commit()
+
+    result = service._search_user_sessions("alice", "天气", 2)
+    assert [s["session_id"] for s in result["sessions"]] == ["match2", "match1"]
+    assert result["has_more"] is False
+    assert "total_capped" not in result
+
+    result = service._search_user_sessions("alice", "天气", 1)
+    assert [s["session_id"] for s in result["sessions"]] == ["match2"]
+    assert result["has_more"] is True
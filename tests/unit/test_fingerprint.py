@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+测试文本指纹
+"""
+
+from backend.utils.fingerprint import text_fingerprint
+
+
+def test_fingerprint_is_16_bytes_and_stable():
+    """指纹为固定 16 字节，相同输入得到相同结果"""
+    fingerprint = text_fingerprint("你好", "happy")
+    assert isinstance(fingerprint, bytes)
+    assert len(fingerprint) == 16
+    assert fingerprint == text_fingerprint("你好", "happy")
+
+
+def test_fingerprint_separates_fields():
+    """字段之间有分隔符：("ab", "c") 与 ("a", "bc") 的指纹不同"""
+    assert text_fingerprint("ab", "c") != text_fingerprint("a", "bc")
+    assert text_fingerprint("abc") != text_fingerprint("ab", "c")
+
+
+def test_fingerprint_treats_none_as_empty():
+    """None 字段按空字符串处理"""
+    assert text_fingerprint("a", None) == text_fingerprint("a", "")
+
+
+def test_long_text_fingerprint_length():
+    """长文本的指纹长度不变"""
+    assert len(text_fingerprint("字" * 100000)) == 16
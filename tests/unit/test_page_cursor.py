@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+测试分页游标的编码与解析
+"""
+
+from datetime import datetime
+
+import pytest
+
+from backend.database import encode_page_cursor, decode_page_cursor
+
+
+def test_cursor_round_trip():
+    """编码后再解析得到原来的 (时间戳, 主键)"""
+    timestamp = datetime(2024, 5, 1, 12, 30, 15, 123456)
+    cursor = encode_page_cursor(timestamp, 42)
+    assert decode_page_cursor(cursor) == (timestamp, 42)
+
+
+def test_cursor_is_url_safe():
+    """游标只包含 URL 安全字符，可以直接放在查询参数中"""
+    cursor = encode_page_cursor(datetime(2024, 1, 1), 10 ** 12)
+    assert all(ch.isalnum() or ch in "-_=" for ch in cursor)
+
+
+@pytest.mark.parametrize("cursor", ["", "not-a-cursor", "@@@", encode_page_cursor(datetime(2024, 1, 1), 1)[:-4]])
+def test_invalid_cursor_raises_value_error(cursor):
+    """格式非法的游标抛出 ValueError"""
+    with pytest.raises(ValueError):
+        decode_page_cursor(cursor)
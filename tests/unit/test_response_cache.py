@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+测试回复缓存与 RAG 结果缓存
+"""
+
+from backend.services.response_cache import ResponseCache
+from backend.modules.rag.services.rag_service import QueryCache
+
+
+def test_response_key_normalizes_whitespace():
+    """消息中的空白差异不影响缓存键"""
+    assert ResponseCache.make_key("u", "s", "你好  世界\n") == ResponseCache.make_key("u", "s", " 你好 世界")
+
+
+def test_response_key_distinguishes_inputs():
+    """用户、模型、情绪、深度思考模式不同时缓存键不同"""
+    base = ResponseCache.make_key("u", "s", "hi", "m", "happy")
+    assert base != ResponseCache.make_key("u2", "s", "hi", "m", "happy")
+    assert base != ResponseCache.make_key("u", "s", "hi", "m2", "happy")
+    assert base != ResponseCache.make_key("u", "s", "hi", "m", "sad")
+    assert base != ResponseCache.make_key("u", "s", "hi", "m", "happy", deep_thinking=True)
+    assert base[0] == "s"
+
+
+def test_invalidate_removes_only_that_session():
+    cache = ResponseCache()
+    key_a = ResponseCache.make_key("u", "session-a", "hi")
+    key_b = ResponseCache.make_key("u", "session-b", "hi")
+    cache.set(key_a, {"answer": "a"})
+    cache.set(key_b, {"answer": "b"})
+
+    cache.invalidate("session-a")
+
+    assert cache.get(key_a) is None
+    assert cache.get(key_b) == {"answer": "b"}
+
+
+def test_query_key_uses_latest_history_entry():
+    """RAG 缓存键包含最近一条历史，历史不同时不命中"""
+    history = [{"role": "user", "content": "上一句"}]
+    other = [{"role": "user", "content": "另一句"}]
+    assert QueryCache.make_key("问题", "sad", history) == QueryCache.make_key("问题", "sad", list(history))
+    assert QueryCache.make_key("问题", "sad", history) != QueryCache.make_key("问题", "sad", other)
+    assert QueryCache.make_key("问题", "sad") != QueryCache.make_key("问题", "happy")
+
+
+def test_query_cache_round_trip():
+    cache = QueryCache(ttl_seconds=60, max_size=10)
+    key = QueryCache.make_key("问题")
+    cache.set(key, {"use_rag": True, "answer": "答案"})
+    assert cache.get(key) == {"use_rag": True, "answer": "答案"}
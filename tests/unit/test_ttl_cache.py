@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+测试 LRU + TTL 缓存基类
+"""
+
+from backend.utils import ttl_cache
+from backend.utils.ttl_cache import TTLLRUCache
+
+
+def test_get_missing_key_returns_none():
+    cache = TTLLRUCache(ttl_seconds=60, max_size=10)
+    assert cache.get("missing") is None
+
+
+def test_set_and_get_copies_value():
+    """写入和读取都复制字典，修改返回值或原字典不影响缓存"""
+    cache = TTLLRUCache(ttl_seconds=60, max_size=10)
+    value = {"answer": "a"}
+    cache.set("k", value)
+    value["answer"] = "changed"
+
+    result = cache.get("k")
+    assert result == {"answer": "a"}
+    result["answer"] = "changed"
+    assert cache.get("k") == {"answer": "a"}
+
+
+def test_expired_entry_is_removed(monkeypatch):
+    """超过 TTL 的条目读取时返回 None 并被删除"""
+    now = [1000.0]
+    monkeypatch.setattr(ttl_cache.time, "monotonic", lambda: now[0])
+    cache = TTLLRUCache(ttl_seconds=10, max_size=10)
+    cache.set("k", {"v": 1})
+
+    now[0] += 9
+    assert cache.get("k") == {"v": 1}
+    now[0] += 2
+    assert cache.get("k") is None
+    assert len(cache) == 0
+
+
+def test_evicts_least_recently_used():
+    """超出容量时淘汰最久未使用的条目，读取会刷新使用顺序"""
+    cache = TTLLRUCache(ttl_seconds=60, max_size=2)
+    cache.set("a", {"v": 1})
+    cache.set("b", {"v": 2})
+    cache.get("a")
+    cache.set("c", {"v": 3})
+
+    assert cache.get("b") is None
+    assert cache.get("a") == {"v": 1}
+    assert cache.get("c") == {"v": 3}
+
+
+def test_discard_where_and_clear():
+    cache = TTLLRUCache(ttl_seconds=60, max_size=10)
+    cache.set(("s1", 1), {})
+    cache.set(("s1", 2), {})
+    cache.set(("s2", 1), {})
+
+    cache.discard_where(lambda key: key[0] == "s1")
+    assert len(cache) == 1
+    assert cache.get(("s2", 1)) == {}
+
+    cache.clear()
+    assert len(cache) == 0
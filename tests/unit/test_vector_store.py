@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+测试对话写入缓冲
+"""
+
+import pytest
+
+from backend import vector_store
+from backend.vector_store import VectorStore
+
+
+class FailingCollection:
+    """写入总是失败的集合，记录调用次数"""
+    
+    def __init__(self):
+        self.calls = 0
+    
+    def add(self, **kwargs):
+        self.calls += 1
+        raise RuntimeError("chroma unavailable")
+
+
+@pytest.fixture
+def store(monkeypatch):
+    # 定时器间隔调大，测试期间不会自动写入
+    monkeypatch.setattr(vector_store, "CONVERSATION_FLUSH_INTERVAL", 3600)
+    store = VectorStore()
+    store.use_custom_embedding = False
+    store.conversation_collection = FailingCollection()
+    monkeypatch.setattr(store, "_embed_many", lambda texts: [[0.0] for _ in texts])
+    yield store
+    with store._buffer_lock:
+        store._conv_buffer = []
+        if store._flush_timer is not None:
+            store._flush_timer.cancel()
+            store._flush_timer = None
+
+
+def test_failed_flush_keeps_buffered_items(store):
+    """写入失败时对话放回缓冲头部，保持顺序，并重新启动定时器"""
+    store.add_conversation("s1", "第一句", "回复一")
+    store.add_conversation("s1", "第二句", "回复二")
+
+    store.flush_conversations()
+
+    assert [item[0] for item in store._conv_buffer] == ["第一句", "第二句"]
+    assert store._flush_timer is not None
+
+    store.add_conversation("s1", "第三句", "回复三")
+    assert [item[0] for item in store._conv_buffer] == ["第一句", "第二句", "第三句"]
+
+
+def test_failed_flush_gives_up_after_max_retries(store):
+    """连续失败超过重试次数后丢弃这批对话"""
+    store.add_conversation("s1", "你好", "回复")
+
+    for _ in range(vector_store.CONVERSATION_FLUSH_MAX_RETRIES):
+        store.flush_conversations()
+        assert len(store._conv_buffer) == 1
+
+    store.flush_conversations()
+    assert store._conv_buffer == []
+    assert store.conversation_collection.calls == vector_store.CONVERSATION_FLUSH_MAX_RETRIES + 1